@@ -0,0 +1,91 @@
+import os
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+
+from auth.security import PASSWORD_HASH_WORKERS
+
+logger = logging.getLogger("sistema_corporativo")
+
+# Presupuesto global de hashing: operaciones PBKDF2 admitidas a la vez. Por
+# encima de esto la cola del pool solo agrega latencia, así que se rechaza antes.
+AUTH_HASH_BUDGET = int(os.getenv("AUTH_HASH_BUDGET", PASSWORD_HASH_WORKERS * 4))
+# Intentos simultáneos permitidos por nombre de usuario y por IP
+AUTH_MAX_INFLIGHT_PER_USERNAME = int(os.getenv("AUTH_MAX_INFLIGHT_PER_USERNAME", 2))
+AUTH_MAX_INFLIGHT_PER_IP = int(os.getenv("AUTH_MAX_INFLIGHT_PER_IP", 8))
+# Contraseñas más largas se rechazan sin hashear (ningún usuario legítimo las usa)
+AUTH_MAX_PASSWORD_LENGTH = int(os.getenv("AUTH_MAX_PASSWORD_LENGTH", 256))
+AUTH_RETRY_AFTER = int(os.getenv("AUTH_RETRY_AFTER", 2))
+
+AUTH_EN_CURSO = Gauge("auth_inflight", "Solicitudes de autenticación admitidas en curso")
+AUTH_RECHAZOS = Counter("auth_admission_rejected_total", "Solicitudes de autenticación rechazadas", ["motivo"])
+
+
+class AuthAdmission:
+    """
+    Control de admisión para /login, /auth/login y los registros. Todas las
+    verificaciones son O(1) en memoria. Los handlers no declaran dependencia de
+    BD: piden la conexión con db_session() dentro de `admitir`, así que un
+    intento rechazado no toma conexión, cupo de admisión del pool ni hash, y
+    un ataque de credential stuffing no le quita capacidad al resto de la API.
+    """
+
+    def __init__(
+        self,
+        presupuesto: int = AUTH_HASH_BUDGET,
+        por_usuario: int = AUTH_MAX_INFLIGHT_PER_USERNAME,
+        por_ip: int = AUTH_MAX_INFLIGHT_PER_IP,
+    ):
+        self.presupuesto = presupuesto
+        self.por_usuario = por_usuario
+        self.por_ip = por_ip
+        self.en_curso = 0
+        self._usuarios: Dict[str, int] = defaultdict(int)
+        self._ips: Dict[str, int] = defaultdict(int)
+
+    def _rechazar(self, status_code: int, motivo: str, detail: str):
+        AUTH_RECHAZOS.labels(motivo=motivo).inc()
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(AUTH_RETRY_AFTER)})
+
+    @staticmethod
+    def _soltar(contador: Dict[str, int], clave: Optional[str]):
+        if clave is None:
+            return
+        contador[clave] -= 1
+        if contador[clave] <= 0:
+            del contador[clave]
+
+    @asynccontextmanager
+    async def admitir(self, username: Optional[str], ip: Optional[str], password: Optional[str] = None):
+        if password is not None and len(password) > AUTH_MAX_PASSWORD_LENGTH:
+            self._rechazar(400, "password_largo", "Contraseña demasiado larga")
+
+        usuario = username.strip().lower() if username else None
+        if usuario is not None and self._usuarios.get(usuario, 0) >= self.por_usuario:
+            self._rechazar(429, "usuario", "Demasiados intentos simultáneos para este usuario")
+        if ip is not None and self._ips.get(ip, 0) >= self.por_ip:
+            self._rechazar(429, "ip", "Demasiados intentos simultáneos desde esta dirección")
+        if self.en_curso >= self.presupuesto:
+            self._rechazar(503, "presupuesto", "Servicio de autenticación saturado, intente nuevamente")
+
+        self.en_curso += 1
+        if usuario is not None:
+            self._usuarios[usuario] += 1
+        if ip is not None:
+            self._ips[ip] += 1
+        AUTH_EN_CURSO.inc()
+        try:
+            yield
+        finally:
+            self.en_curso -= 1
+            self._soltar(self._usuarios, usuario)
+            self._soltar(self._ips, ip)
+            AUTH_EN_CURSO.dec()
+
+
+auth_admission = AuthAdmission()
+
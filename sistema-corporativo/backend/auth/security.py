@@ -1,27 +1,254 @@
 import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import jwt
-from passlib.context import CryptContext
-from dotenv import load_dotenv
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Tuple
+from fastapi import HTTPException, Request
+from prometheus_client import Counter, Gauge, Histogram
 
-load_dotenv()
+# El .env lo cargan los puntos de entrada (main.py, services/worker.py, scripts)
+# antes de importar este módulo: las constantes de abajo se leen al importar.
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from passlib.context import CryptContext
+
+logger = logging.getLogger("sistema_corporativo")
 
 # CONFIGURACIÓN DE SEGURIDAD
+# Se lee una sola vez: el resto de la app verifica tokens con get_request_claims y no la importa
 SECRET_KEY = os.getenv("JWT_SECRET", "tu_clave_secreta_muy_segura_cambiala_en_produccion")
 ALGORITHM = "HS256"
 
-# Usamos pbkdf2_sha256 para evitar incompatibilidades con bcrypt en algunas versiones de Python/Windows
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Claims verificados en memoria (LRU acotado; cada entrada expira con el `exp` del token)
+JWT_CLAIMS_CACHE_SIZE = int(os.getenv("JWT_CLAIMS_CACHE_SIZE", 10000))
+
+# Costo de PBKDF2. Subirlo no invalida hashes existentes: los que tengan menos
+# rondas se re-hashean de forma transparente en el siguiente login exitoso.
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", 29000))
+
+# Procesos dedicados al hashing y máximo de operaciones en espera antes de
+# responder 503 (mejor rechazar rápido que encolar logins por segundos).
+# Por defecto la mitad de los cores: el resto queda para servir la API.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+PASSWORD_HASH_RETRY_AFTER = 1
+
+# Usamos pbkdf2_sha256 para evitar incompatibilidades con bcrypt en algunas versiones de Python/Windows.
+# Se construye al primer hash: el cómputo corre en los procesos de _hash_pool,
+# así que el proceso de la API normalmente nunca importa passlib.
+@lru_cache(maxsize=None)
+def _pwd_context() -> "CryptContext":
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        deprecated="auto",
+        pbkdf2_sha256__default_rounds=PBKDF2_ROUNDS,
+        pbkdf2_sha256__min_rounds=PBKDF2_ROUNDS,
+    )
+
+JWT_CACHE = Counter("jwt_claims_cache_total", "Consultas al caché de claims JWT", ["resultado"])
+HASH_EN_COLA = Gauge("password_hash_queue_depth", "Operaciones de hashing en curso o en espera")
+HASH_RECHAZADOS = Counter("password_hash_rejected_total", "Operaciones de hashing rechazadas por cola llena")
+HASH_DURACION = Histogram(
+    "password_hash_duration_seconds",
+    "Tiempo total de hashing/verificación (espera + cómputo)",
+    ["operacion"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
+
+def verify_and_update(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """Verifica y, si el hash usa parámetros viejos, devuelve el hash nuevo."""
+    if not hashed_password:
+        return False, None
+    return _pwd_context().verify_and_update(plain_password, hashed_password)
+
+# jose (con el backend de cryptography) es lo más pesado de importar de este
+# módulo: se carga al primer token, o en el arranque con precargar_jwt().
+def __getattr__(nombre):
+    if nombre == "jwt":
+        from jose import jwt
+        return jwt
+    if nombre == "JWTError":
+        from jose import JWTError
+        return JWTError
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+def precargar_jwt():
+    from jose import jwt  # noqa: F401
+
+# ===================================================================
+# HASHING FUERA DEL EVENT LOOP
+# ===================================================================
+# PBKDF2 es CPU puro y retiene el GIL: en un thread seguiría frenando el loop.
+# Se ejecuta en un pool de procesos dedicado y acotado.
+_hash_pool: "Optional[ProcessPoolExecutor]" = None
+_pendientes = 0
+
+def _get_hash_pool() -> "ProcessPoolExecutor":
+    global _hash_pool
+    if _hash_pool is None:
+        # Import diferido (multiprocessing): el worker y los scripts no lo necesitan
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Nunca fork: a esta altura ya corren hilos (QueueListener de logs, I/O de
+        # uploads) y un hijo podría heredar uno de sus locks tomado y colgarse.
+        # forkserver arranca los hijos desde un proceso limpio; Windows solo tiene spawn.
+        metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context(metodo),
+        )
+    return _hash_pool
+
+def _preparar_proceso():
+    # passlib se importa en el proceso hijo, no en el de la API
+    _pwd_context()
+
+async def start_hash_pool():
+    """Levanta los procesos al arrancar para que el primer login no pague el fork ni el import de passlib."""
+    pool = _get_hash_pool()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(pool, _preparar_proceso) for _ in range(PASSWORD_HASH_WORKERS)))
+    logger.info(f"Pool de hashing iniciado ({PASSWORD_HASH_WORKERS} procesos, {PBKDF2_ROUNDS} rondas)")
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
+async def _en_pool(operacion: str, fn, *args):
+    global _pendientes
+    if _pendientes >= PASSWORD_HASH_MAX_QUEUE:
+        HASH_RECHAZADOS.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de autenticación saturado, intente nuevamente",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+        )
+
+    _pendientes += 1
+    HASH_EN_COLA.inc()
+    try:
+        with HASH_DURACION.labels(operacion=operacion).time():
+            return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), fn, *args)
+    finally:
+        _pendientes -= 1
+        HASH_EN_COLA.dec()
+
+async def verify_password_async(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """verify_and_update en el pool de procesos. Devuelve (válida, hash_nuevo|None)."""
+    return await _en_pool("verify", verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await _en_pool("hash", get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=1440))
     to_encode.update({"exp": expire})
+    from jose import jwt
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+# ===================================================================
+# VERIFICACIÓN DE JWT CON CACHÉ DE CLAIMS
+# ===================================================================
+class ClaimsCache:
+    """
+    LRU de claims ya verificados, indexado por el SHA-256 del token (no se
+    guarda el token en claro). Una entrada nunca sobrevive al `exp` del token.
+    """
+
+    def __init__(self, maxsize: int = JWT_CLAIMS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+
+    @staticmethod
+    def clave(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        clave = self.clave(token)
+        entrada = self._data.get(clave)
+        if entrada is None:
+            return None
+        claims, exp = entrada
+        if exp <= time.time():
+            del self._data[clave]
+            return None
+        self._data.move_to_end(clave)
+        return claims
+
+    def put(self, token: str, claims: dict):
+        exp = claims.get("exp")
+        # Sin `exp` no hay un límite seguro de vida: no se cachea
+        if not isinstance(exp, (int, float)) or self.maxsize <= 0:
+            return
+        clave = self.clave(token)
+        self._data[clave] = (claims, float(exp))
+        self._data.move_to_end(clave)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+claims_cache = ClaimsCache()
+
+def decode_token(token: str) -> dict:
+    """
+    Verifica un JWT HS256 y devuelve sus claims. Lanza JWTError si es inválido.
+    Los claims devueltos se comparten entre requests: no modificarlos.
+    """
+    claims = claims_cache.get(token)
+    if claims is not None:
+        JWT_CACHE.labels(resultado="hit").inc()
+        return claims
+
+    JWT_CACHE.labels(resultado="miss").inc()
+    from jose import jwt
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    claims_cache.put(token, claims)
+    return claims
+
+def bearer_token(request: Request) -> Optional[str]:
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    return auth_header.split(" ", 1)[1]
+
+def get_request_claims(request: Request) -> Optional[dict]:
+    """
+    Claims del token del request, decodificados una sola vez por request y
+    guardados en request.state.claims (None si falta o es inválido).
+    """
+    if hasattr(request.state, "claims"):
+        return request.state.claims
+
+    claims = None
+    token = bearer_token(request)
+    if token:
+        from jose import JWTError
+        try:
+            claims = decode_token(token)
+        except JWTError as e:
+            logger.error(f"Error decodificando JWT: {e}")
+            request.state.claims_error = str(e)
+    request.state.claims = claims
+    return claims
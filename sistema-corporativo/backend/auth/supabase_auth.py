@@ -1,27 +1,18 @@
-import os
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 
-# CONFIGURACIÓN JWT (Heredada del main)
-SECRET_KEY = os.getenv("JWT_SECRET", "tu_clave_secreta_muy_segura_cambiala_en_produccion")
-ALGORITHM = "HS256"
+# Verificación JWT centralizada en auth/security.py
+from auth.security import get_request_claims
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        return payload
-    except JWTError:
-        raise credentials_exception
-    except Exception:
+    payload = get_request_claims(request)
+    if payload is None or payload.get("sub") is None:
         raise credentials_exception
+    return payload
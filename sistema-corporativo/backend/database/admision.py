@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge, Histogram
+
+from middleware.context import request_scope_var
+
+# Prioridad de cada clase (menor = se atiende antes) y espera máxima por un cupo.
+# Las lecturas masivas esperan poco: bajo saturación son las primeras en ceder.
+CLASES = {"critica": 0, "normal": 1, "masiva": 2}
+DEADLINES = {
+    "critica": float(os.getenv("DB_ADMISSION_DEADLINE_CRITICA", 5)),
+    "normal": float(os.getenv("DB_ADMISSION_DEADLINE_NORMAL", 3)),
+    "masiva": float(os.getenv("DB_ADMISSION_DEADLINE_MASIVA", 1)),
+}
+# Sesiones esperando cupo; por encima se responde 503 sin esperar
+DB_ADMISSION_MAX_QUEUE = int(os.getenv("DB_ADMISSION_MAX_QUEUE", 100))
+DB_ADMISSION_RETRY_AFTER = int(os.getenv("DB_ADMISSION_RETRY_AFTER", 1))
+
+# Plantillas de ruta (con prefijo de router) por clase; el resto es "normal".
+# Login y registro son críticos: bajo saturación un usuario que entra no debe
+# quedar detrás de los listados. Un flood de credenciales no se lleva el pool
+# porque auth/admission.py acota los intentos en curso antes de pedir conexión,
+# y cada intento admitido la usa solo para consultas cortas (sin el hash).
+RUTAS_CRITICAS = {
+    ("GET", "/health"), ("GET", "/health/ready"),
+    ("POST", "/login"), ("POST", "/register"),
+    ("POST", "/auth/login"), ("POST", "/auth/register"), ("GET", "/auth/me"),
+    ("POST", "/api/auth/switch-organization"),
+}
+RUTAS_MASIVAS = {
+    ("GET", "/documentos"), ("GET", "/usuarios"), ("GET", "/users/all"), ("GET", "/gerencias"),
+}
+
+ADMISION_ESPERANDO = Gauge("db_admission_waiting", "Sesiones de BD esperando cupo en el pool")
+ADMISION_ESPERA = Histogram(
+    "db_admission_wait_seconds",
+    "Espera por un cupo del pool antes de adquirir la conexión",
+    ["clase"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+ADMISION_RECHAZOS = Counter(
+    "db_admission_rejected_total",
+    "Sesiones de BD rechazadas con 503",
+    ["clase", "motivo"],  # cola_llena | deadline | desplazada
+)
+
+
+def clase_actual() -> str:
+    """Clase de la ruta en curso; fuera de un request (worker, flush de actividad) es normal."""
+    scope = request_scope_var.get()
+    if not scope:
+        return "normal"
+    route = scope.get("route")
+    clave = (scope.get("method"), getattr(route, "path", None))
+    if clave in RUTAS_CRITICAS:
+        return "critica"
+    if clave in RUTAS_MASIVAS:
+        return "masiva"
+    return "normal"
+
+
+def _rechazo(clase: str, motivo: str) -> HTTPException:
+    ADMISION_RECHAZOS.labels(clase=clase, motivo=motivo).inc()
+    return HTTPException(
+        status_code=503,
+        detail="Servicio saturado, intente nuevamente",
+        headers={"Retry-After": str(DB_ADMISSION_RETRY_AFTER)},
+    )
+
+
+class PoolAdmission:
+    """
+    Control de admisión delante de db_session: como mucho `capacidad` sesiones
+    (el max_size del pool) tienen conexión; el resto espera en una cola acotada
+    ordenada por prioridad y luego por llegada.
+
+    - Cola llena: 503 inmediato, salvo que quien llega tenga más prioridad que
+      el peor de la cola; en ese caso se rechaza a ese y se encola al nuevo.
+    - Deadline por clase: al vencer, 503 con Retry-After en lugar de un 500
+      tardío por command_timeout.
+    """
+
+    def __init__(self, capacidad: int = 20, max_cola: int = DB_ADMISSION_MAX_QUEUE, deadlines=None):
+        self.capacidad = capacidad
+        self.max_cola = max_cola
+        self.deadlines = deadlines or DEADLINES
+        self.en_uso = 0
+        self._cola: List[Tuple[int, int, asyncio.Future, str]] = []
+        self._esperando = 0
+        self._orden = itertools.count()
+
+    def _desplazar(self, prioridad: int) -> bool:
+        """Rechaza al waiter de menor prioridad si es peor que `prioridad`."""
+        peor = None
+        for entrada in self._cola:
+            if entrada[2].done():
+                continue
+            if peor is None or (entrada[0], entrada[1]) > (peor[0], peor[1]):
+                peor = entrada
+        if peor is None or peor[0] <= prioridad:
+            return False
+        peor[2].set_exception(_rechazo(peor[3], "desplazada"))
+        self._esperando -= 1
+        return True
+
+    async def entrar(self, clase: Optional[str] = None):
+        clase = clase or clase_actual()
+        if self.en_uso < self.capacidad and self._esperando == 0:
+            self.en_uso += 1
+            ADMISION_ESPERA.labels(clase=clase).observe(0)
+            return
+
+        prioridad = CLASES[clase]
+        if self._esperando >= self.max_cola and not self._desplazar(prioridad):
+            raise _rechazo(clase, "cola_llena")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._cola, (prioridad, next(self._orden), fut, clase))
+        self._esperando += 1
+        ADMISION_ESPERANDO.set(self._esperando)
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.deadlines[clase])
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                if fut.exception() is not None:
+                    raise fut.exception()
+                # El cupo llegó justo al vencer el deadline: se usa
+                ADMISION_ESPERA.labels(clase=clase).observe(time.perf_counter() - inicio)
+                return
+            if not fut.done():
+                fut.cancel()
+                self._esperando -= 1
+            raise _rechazo(clase, "deadline")
+        except BaseException:
+            # Cancelado (cliente desconectado): si ya tenía cupo, se devuelve
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self.salir()
+            elif not fut.done():
+                fut.cancel()
+                self._esperando -= 1
+            raise
+        finally:
+            ADMISION_ESPERANDO.set(self._esperando)
+        ADMISION_ESPERA.labels(clase=clase).observe(time.perf_counter() - inicio)
+
+    def salir(self):
+        """Libera el cupo y lo pasa directamente al mejor waiter vivo."""
+        while self._cola:
+            _, _, fut, _ = heapq.heappop(self._cola)
+            if not fut.done():
+                self._esperando -= 1
+                ADMISION_ESPERANDO.set(self._esperando)
+                fut.set_result(None)  # el cupo (en_uso) pasa sin liberarse
+                return
+        self.en_uso -= 1
+
+
+pool_admission = PoolAdmission()
@@ -4,11 +4,27 @@ import logging
 import os
 from typing import AsyncGenerator
 from contextlib import asynccontextmanager
-from middleware.context import get_current_tenant_id
+from fastapi import HTTPException, Request
+from auth.security import get_request_claims
+from middleware.context import get_current_tenant_id, get_current_user_id
+from database import metricas, sentencias
+from database.admision import pool_admission
+from database.conexion import DB_SSL, Conexion
+from database.replicas import DB_REPLICA_ACQUIRE_TIMEOUT, LECTURAS_RUTEADAS, replicas
 
 logger = logging.getLogger("sistema_corporativo")
 init_lock = asyncio.Lock()
 pool: asyncpg.Pool = None
+# Espera máxima por una conexión antes de responder 503 (sin límite, un pool
+# saturado acumulaba requests colgados indefinidamente)
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+# Conexiones ociosas más de esto se cierran (también las abiertas por el calentamiento)
+DB_POOL_MAX_INACTIVE = float(os.getenv("DB_POOL_MAX_INACTIVE", 60))
+
+metricas.registrar_pool("primaria", lambda: pool)
+metricas.registrar_pool("replica", lambda: replicas.pool)
 
 async def init_db_pool():
     global pool
@@ -18,7 +34,6 @@ async def init_db_pool():
             return
 
         db_url = os.getenv("SUPABASE_DB_URL")
-        print(f"\n>>> DB_URL: {'EXISTS' if db_url else 'NONE'}")
         
         for attempt in range(5):
             try:
@@ -26,17 +41,23 @@ async def init_db_pool():
                     raise ValueError("SUPABASE_DB_URL no configurada")
                 
                 logger.info(f"Intento {attempt + 1}/5")
-                
+
+                # Sentencias preparadas solo si el destino las soporta (database/sentencias.py)
+                modo = await sentencias.detectar_modo(db_url, ssl=DB_SSL)
                 pool = await asyncpg.create_pool(
                     dsn=db_url,
-                    min_size=2,
-                    max_size=20,
-                    statement_cache_size=0,
-                    max_inactive_connection_lifetime=60.0,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE,
                     command_timeout=60.0,
-                    ssl='require'  # Necesario para el Transaction Pooler de Supabase
+                    ssl=DB_SSL,  # require: necesario para el Transaction Pooler de Supabase
+                    connection_class=Conexion,
+                    init=sentencias.precalentar,
+                    **sentencias.configurar(modo),
                 )
-                logger.info("✅ CONEXIÓN EXITOSA - SISTEMA LISTO 🚀")
+                # Un cupo de admisión por conexión: quien lo obtiene no espera en el pool
+                pool_admission.capacidad = pool.get_max_size()
+                logger.info(f"✅ CONEXIÓN EXITOSA - SISTEMA LISTO 🚀 (sentencias: {modo})")
                 return
             except Exception as e:
                 logger.error(f"❌ Error: {e}")
@@ -46,23 +67,96 @@ async def init_db_pool():
 
 @asynccontextmanager
 async def db_session():
-    """Context manager para uso interno (ej: middlewares)"""
+    """
+    Context manager para uso interno (ej: middlewares).
+
+    Con tenant en contexto todo el bloque corre en una transacción cuyo BEGIN
+    fija app.current_tenant_id (un solo round trip) y el COMMIT lo descarta, así
+    que no hace falta RESET ni la consulta de reset del pool. Un error dentro
+    del bloque hace ROLLBACK de lo escrito.
+    """
     if pool is None:
         await init_db_pool()
-    
-    async with pool.acquire() as conn:
-        tenant_id = get_current_tenant_id()
+
+    # Cola con prioridad por ruta y deadline (database/admision.py): 503 rápido
+    # en lugar de requests colgados en pool.acquire()
+    await pool_admission.entrar()
+    try:
+        try:
+            conn, obtenida = await metricas.adquirir(pool, "primaria", DB_POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Base de datos saturada, intente nuevamente",
+                                headers={"Retry-After": "1"})
         try:
+            tenant_id = get_current_tenant_id()
             if tenant_id:
-                await conn.execute("SELECT set_config('app.current_tenant_id', $1, true)", str(tenant_id))
-            yield conn
+                async with conn.transaccion_tenant(tenant_id):
+                    yield conn
+            else:
+                yield conn
+            # Solo se llega aquí sin excepción: no quedó estado de sesión que limpiar
+            conn.omitir_reset()
+        except BaseException as e:
+            metricas.registrar_error("primaria", e)
+            raise
         finally:
-            try:
-                await conn.execute("RESET app.current_tenant_id")
-            except:
-                pass
+            metricas.registrar_retencion("primaria", obtenida)
+            await pool.release(conn)
+    finally:
+        pool_admission.salir()
 
 async def get_db_connection() -> AsyncGenerator[asyncpg.Connection, None]:
-    """Generador para dependencias de FastAPI"""
+    """
+    Generador para dependencias de FastAPI. Declararlo siempre con
+    `Depends(get_db_connection, scope="function")`: con el scope por defecto la
+    dependencia termina después de enviar la respuesta, y el COMMIT (y la
+    liberación de la conexión) llegarían cuando el cliente ya recibió un 2xx.
+    """
     async with db_session() as conn:
-        yield conn
\ No newline at end of file
+        yield conn
+
+
+@asynccontextmanager
+async def read_session(user_id=None):
+    """
+    Sesión de solo lectura: va a la réplica si su lag y el read-your-writes del
+    usuario lo permiten (database/replicas.py); si no, a la primaria.
+    """
+    usar_replica, motivo = replicas.decidir(user_id or get_current_user_id())
+    if usar_replica:
+        try:
+            conn, obtenida = await metricas.adquirir(replicas.pool, "replica", DB_REPLICA_ACQUIRE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Réplica sin conexiones disponibles, lectura a la primaria: {e}")
+            usar_replica, motivo = False, "caida"
+
+    if not usar_replica:
+        LECTURAS_RUTEADAS.labels(destino="primaria", motivo=motivo).inc()
+        async with db_session() as conn:
+            yield conn
+        return
+
+    LECTURAS_RUTEADAS.labels(destino="replica", motivo=motivo).inc()
+    try:
+        tenant_id = get_current_tenant_id()
+        if tenant_id:
+            async with conn.transaccion_tenant(tenant_id, readonly=True):
+                yield conn
+        else:
+            yield conn
+        conn.omitir_reset()
+    except BaseException as e:
+        metricas.registrar_error("replica", e)
+        raise
+    finally:
+        metricas.registrar_retencion("replica", obtenida)
+        await replicas.pool.release(conn)
+
+async def get_read_connection(request: Request) -> AsyncGenerator[asyncpg.Connection, None]:
+    """
+    Dependencia para handlers de solo lectura (réplica con fallback a la
+    primaria). También con scope="function", como get_db_connection.
+    """
+    claims = get_request_claims(request) or {}
+    async with read_session(claims.get("sub")) as conn:
+        yield conn
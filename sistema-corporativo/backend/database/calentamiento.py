@@ -0,0 +1,100 @@
+import asyncio
+import os
+import re
+import time
+import logging
+from typing import Optional
+
+import asyncpg
+from prometheus_client import Gauge
+
+from database import sentencias
+
+logger = logging.getLogger("sistema_corporativo")
+
+# Conexiones que se abren en paralelo al arrancar (acotado por el max_size del pool)
+DB_POOL_WARM_SIZE = int(os.getenv("DB_POOL_WARM_SIZE", 10))
+# Pasado este tiempo el proceso se declara listo con las conexiones que haya
+DB_POOL_WARMUP_TIMEOUT = float(os.getenv("DB_POOL_WARMUP_TIMEOUT", 30))
+
+CALENTAMIENTO_DURACION = Gauge("db_pool_warmup_seconds", "Duración del calentamiento del pool al arrancar")
+CALENTAMIENTO_CONEXIONES = Gauge("db_pool_warm_connections", "Conexiones abiertas por el calentamiento")
+CALENTAMIENTO_LISTO = Gauge("db_pool_warm", "1 cuando terminó el calentamiento del pool")
+
+_PARAMETRO = re.compile(r"\$(\d+)")
+
+
+def _cantidad_parametros(sql: str) -> int:
+    return max((int(n) for n in _PARAMETRO.findall(sql)), default=0)
+
+
+class PoolWarmup:
+    """
+    Calentamiento del pool primario al arrancar, en segundo plano: /health/live
+    responde de inmediato y /health/ready falla hasta que termina.
+
+    Abre en paralelo hasta `objetivo` conexiones (cada una paga su handshake TLS
+    al mismo tiempo, no en serie con el primer pico de tráfico) y en cada una
+    ejecuta las consultas calientes con parámetros NULL: sin filas, pero con el
+    catálogo, los índices y los planes ya cargados en el backend del servidor.
+    """
+
+    def __init__(self):
+        self.listo = False
+        self.duracion: Optional[float] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def start(self, pool: asyncpg.Pool, objetivo: int = DB_POOL_WARM_SIZE, timeout: float = DB_POOL_WARMUP_TIMEOUT):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._calentar(pool, objetivo, timeout))
+
+    async def stop(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    async def _calentar(self, pool: asyncpg.Pool, objetivo: int, timeout: float):
+        objetivo = max(1, min(objetivo, pool.get_max_size()))
+        inicio = time.perf_counter()
+        conexiones = []
+        try:
+            resultados = await asyncio.wait_for(
+                asyncio.gather(*(self._abrir(pool, conexiones) for _ in range(objetivo)), return_exceptions=True),
+                timeout,
+            )
+            fallidas = [r for r in resultados if isinstance(r, Exception)]
+            if fallidas:
+                logger.warning(f"Calentamiento: {len(fallidas)}/{objetivo} conexiones fallaron: {fallidas[0]}")
+        except asyncio.TimeoutError:
+            logger.warning(f"Calentamiento incompleto tras {timeout:.0f}s: {len(conexiones)}/{objetivo} conexiones")
+        finally:
+            # Se devuelven todas juntas: cada acquire debe abrir una conexión nueva
+            for conn in conexiones:
+                await pool.release(conn)
+        self.duracion = time.perf_counter() - inicio
+        CALENTAMIENTO_DURACION.set(self.duracion)
+        CALENTAMIENTO_CONEXIONES.set(len(conexiones))
+        CALENTAMIENTO_LISTO.set(1)
+        self.listo = True
+        logger.info(
+            f"Pool calentado: {len(conexiones)} conexiones en {self.duracion:.2f}s",
+            extra={"duration_ms": int(self.duracion * 1000)},
+        )
+
+    async def _abrir(self, pool: asyncpg.Pool, conexiones: list):
+        conn = await pool.acquire()
+        conexiones.append(conn)
+        for consulta in sentencias.CONSULTAS_CALIENTES.values():
+            if not consulta.sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue  # solo lecturas: con NULL no hay filas, pero nunca se escribe
+            try:
+                await sentencias.fetch(conn, consulta, *([None] * _cantidad_parametros(consulta.sql)))
+            except Exception as e:
+                logger.warning(f"Calentamiento: no se pudo ejecutar '{consulta.nombre}': {e}")
+
+
+pool_warmup = PoolWarmup()
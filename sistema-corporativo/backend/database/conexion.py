@@ -0,0 +1,93 @@
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import asyncpg
+
+from database import instrumentacion
+
+# sslmode de las conexiones (require para Supabase; disable para Postgres locales)
+DB_SSL = os.getenv("DB_SSL", "require")
+
+
+def _literal(valor: str) -> str:
+    # standard_conforming_strings está activo por defecto: basta duplicar las comillas
+    return "'" + valor.replace("'", "''") + "'"
+
+
+class Conexion(asyncpg.Connection):
+    """
+    Conexión de los pools de la BD (primaria y réplica de lectura).
+
+    - Guarda las sentencias preparadas explícitamente por database/sentencias.py
+      (sql -> PreparedStatement): viven mientras viva la conexión física.
+    - `transaccion_tenant` abre la transacción y fija app.current_tenant_id en
+      el mismo round trip (`BEGIN; SET LOCAL ...`); el COMMIT/ROLLBACK lo limpia.
+    - `omitir_reset` evita la consulta de reset del pool al devolverla, cuando
+      la sesión no dejó estado (todo lo del tenant era local a la transacción).
+    - fetch/fetchrow/fetchval/execute/executemany se miden por consulta
+      (database/instrumentacion.py); el control de transacción no. La SQL
+      armada por request debe pasar `nombre=`: si no, cada variante del texto
+      sería una serie distinta de db_query_seconds.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sentencias: "OrderedDict[str, asyncpg.prepared_stmt.PreparedStatement]" = OrderedDict()
+        self._contexto_begin: Optional[str] = None
+        self._sin_reset = False
+
+    async def execute(self, query: str, *args, timeout: float = None) -> str:
+        contexto = self._contexto_begin
+        if contexto is not None and not args and query.startswith("BEGIN"):
+            # El BEGIN lo emite asyncpg.Transaction.start(); se le agrega el SET LOCAL
+            # para que viaje en el mismo mensaje (protocolo simple, varias sentencias).
+            # Es un detalle interno de asyncpg: la versión está fijada en requirements.txt
+            self._contexto_begin = None
+            query = f"{query} {contexto}"
+        if instrumentacion.es_control(query):
+            return await super().execute(query, *args, timeout=timeout)
+        return await instrumentacion.medir(query, args, super().execute(query, *args, timeout=timeout))
+
+    async def executemany(self, command: str, args, *, timeout: float = None):
+        return await instrumentacion.medir(command, (), super().executemany(command, args, timeout=timeout))
+
+    async def fetch(self, query: str, *args, timeout: float = None, record_class=None, nombre: str = None) -> list:
+        return await instrumentacion.medir(
+            query, args, super().fetch(query, *args, timeout=timeout, record_class=record_class), nombre=nombre
+        )
+
+    async def fetchrow(self, query: str, *args, timeout: float = None, record_class=None, nombre: str = None):
+        return await instrumentacion.medir(
+            query, args, super().fetchrow(query, *args, timeout=timeout, record_class=record_class), nombre=nombre
+        )
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout: float = None, nombre: str = None):
+        return await instrumentacion.medir(
+            query, args, super().fetchval(query, *args, column=column, timeout=timeout), nombre=nombre
+        )
+
+    @asynccontextmanager
+    async def transaccion_tenant(self, tenant_id, **opciones):
+        """
+        Transacción gestionada por asyncpg (las conn.transaction() internas pasan a
+        ser savepoints) cuyo BEGIN ya trae el tenant para RLS.
+        """
+        self._contexto_begin = f"SET LOCAL app.current_tenant_id = {_literal(str(tenant_id))};"
+        try:
+            async with self.transaction(**opciones):
+                yield self
+        finally:
+            # Si el BEGIN falló, el contexto no debe quedar para otra transacción
+            self._contexto_begin = None
+
+    def omitir_reset(self):
+        self._sin_reset = True
+
+    def get_reset_query(self) -> str:
+        # asyncpg siempre hace ROLLBACK de una transacción abierta antes de esto
+        if self._sin_reset:
+            self._sin_reset = False
+            return ""
+        return super().get_reset_query()
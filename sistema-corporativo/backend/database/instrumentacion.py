@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from prometheus_client import Histogram
+
+logger = logging.getLogger("sistema_corporativo")
+
+
+class _Config:
+    """Ajustable en caliente con PUT /admin/diagnostico/consultas (por proceso)."""
+
+    def __init__(self):
+        self.activo = os.getenv("DB_QUERY_METRICS", "true").lower() == "true"
+        # Consultas por encima de este umbral se loguean con trace_id y tenant
+        self.umbral_ms = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+        # Fracción de consultas lentas (solo lectura) a las que se les captura el plan
+        self.muestreo_explain = float(os.getenv("DB_EXPLAIN_SAMPLE_RATE", 0.05))
+        # Como mucho un EXPLAIN por consulta en este intervalo (segundos)
+        self.explain_intervalo = float(os.getenv("DB_EXPLAIN_INTERVAL", 60))
+
+    def como_dict(self) -> dict:
+        return {
+            "activo": self.activo,
+            "umbral_ms": self.umbral_ms,
+            "muestreo_explain": self.muestreo_explain,
+            "explain_intervalo": self.explain_intervalo,
+        }
+
+
+config = _Config()
+
+CONSULTA_DURACION = Histogram(
+    "db_query_seconds",
+    "Duración de cada sentencia por nombre estable de consulta",
+    ["consulta"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# Control de transacción y reset del pool: lo emite asyncpg y no aporta
+# información por consulta
+_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "RESET", "SELECT pg_advisory_unlock_all")
+_SOLO_LECTURA = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_ESCRITURA = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b|\bFOR\s+(UPDATE|SHARE)\b|nextval\s*\(", re.IGNORECASE)
+_TABLA = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([a-z_][a-z0-9_.]*)", re.IGNORECASE)
+_ESPACIOS = re.compile(r"\s+")
+
+# Nombres de las consultas calientes de database/sentencias.py: un conjunto fijo
+# registrado al importar, sin desalojo. Los calculados para el resto de la SQL
+# inline van en el LRU `_nombres`. La SQL armada por request (p. ej. el listado
+# de documentos) no debe llegar aquí: pasa un `nombre=` fijo a medir(), porque
+# cada nombre es una serie de db_query_seconds que no se libera.
+_MAX_NOMBRES = 2048
+_registrados: Dict[str, str] = {}
+_nombres: "OrderedDict[str, str]" = OrderedDict()
+# nombre -> último EXPLAIN (monotonic); LRU con el mismo límite que `_nombres`
+_ultimo_explain: "OrderedDict[str, float]" = OrderedDict()
+_tareas = set()
+
+
+def registrar_nombre(sql: str, nombre: str):
+    """Solo para SQL fija (consulta_caliente): este registro no se desaloja."""
+    _registrados[sql] = nombre
+
+
+def nombre_consulta(sql: str) -> str:
+    """
+    Nombre estable de una SQL: el de su Consulta si la tiene; si no, verbo,
+    primera tabla y hash del texto normalizado, p. ej. "update:documentos:3fa2c1d0".
+    No cambia entre despliegues mientras no cambie la consulta.
+    """
+    nombre = _registrados.get(sql) or _nombres.get(sql)
+    if nombre is not None:
+        return nombre
+    normalizada = _ESPACIOS.sub(" ", sql).strip()
+    verbo = normalizada.split(" ", 1)[0].lower() or "sql"
+    tabla = _TABLA.search(normalizada)
+    resumen = hashlib.sha1(normalizada.encode()).hexdigest()[:8]
+    nombre = f"{verbo}:{tabla.group(1).lower() if tabla else '-'}:{resumen}"
+    _nombres[sql] = nombre
+    if len(_nombres) > _MAX_NOMBRES:
+        _nombres.popitem(last=False)
+    return nombre
+
+
+def es_control(sql: str) -> bool:
+    return sql.lstrip().startswith(_CONTROL)
+
+
+async def medir(sql: str, args, operacion, nombre: Optional[str] = None):
+    """Ejecuta `operacion` (corrutina de asyncpg) midiendo su duración."""
+    if not config.activo:
+        return await operacion
+    inicio = time.perf_counter()
+    try:
+        return await operacion
+    finally:
+        duracion = time.perf_counter() - inicio
+        nombre = nombre or nombre_consulta(sql)
+        CONSULTA_DURACION.labels(consulta=nombre).observe(duracion)
+        if duracion * 1000 >= config.umbral_ms:
+            _consulta_lenta(nombre, sql, args, duracion)
+
+
+def _consulta_lenta(nombre: str, sql: str, args, duracion: float):
+    # trace_id, tenant_id y user_id los agrega el formatter desde los contextvars
+    logger.warning(
+        f"Consulta lenta {nombre}: {duracion * 1000:.1f} ms",
+        extra={"duration_ms": int(duracion * 1000), "query": nombre},
+    )
+    if not _SOLO_LECTURA.match(sql) or _ESCRITURA.search(sql):
+        return  # EXPLAIN ANALYZE ejecuta la sentencia: nunca sobre escrituras
+    ahora = time.monotonic()
+    if ahora - _ultimo_explain.get(nombre, float("-inf")) < config.explain_intervalo:
+        return
+    if random.random() >= config.muestreo_explain:
+        return
+    _ultimo_explain[nombre] = ahora
+    _ultimo_explain.move_to_end(nombre)
+    if len(_ultimo_explain) > _MAX_NOMBRES:
+        _ultimo_explain.popitem(last=False)
+    # Tarea aparte con su propia conexión: hereda el contexto (tenant y trace_id)
+    tarea = asyncio.get_running_loop().create_task(_capturar_plan(nombre, sql, args))
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+
+
+async def _capturar_plan(nombre: str, sql: str, args):
+    from database.async_db import db_session
+
+    try:
+        async with db_session() as conn:
+            filas = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", *args, nombre=f"explain:{nombre}")
+        plan = "\n".join(f[0] for f in filas)
+        logger.warning(f"Plan de consulta lenta {nombre}:\n{plan}", extra={"query": nombre, "plan": plan})
+    except Exception as e:
+        logger.error(f"No se pudo capturar el plan de {nombre}: {e}")
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Callable, Optional
+
+import asyncpg
+from prometheus_client import Counter, Gauge, Histogram
+
+from middleware.context import get_current_route
+
+# Costo por sesión: dos perf_counter y dos observe (unos µs frente a ms de la query)
+
+_BUCKETS_ESPERA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_BUCKETS_RETENCION = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+POOL_ESPERA = Histogram(
+    "db_pool_acquire_seconds", "Espera para obtener una conexión del pool", ["pool"], buckets=_BUCKETS_ESPERA
+)
+POOL_RETENCION = Histogram(
+    "db_pool_hold_seconds",
+    "Tiempo que una ruta retiene la conexión",
+    ["pool", "ruta"],  # ruta: plantilla de FastAPI (/documentos/{id}), no la URL concreta
+    buckets=_BUCKETS_RETENCION,
+)
+POOL_CONEXIONES = Gauge("db_pool_connections", "Conexiones del pool por estado", ["pool", "estado"])
+POOL_TIMEOUTS = Counter("db_pool_acquire_timeouts_total", "Esperas de conexión que agotaron el timeout", ["pool"])
+POOL_ERRORES = Counter(
+    "db_pool_errors_total",
+    "Errores de BD durante una sesión",
+    ["pool", "tipo"],  # postgres | conexion | timeout
+)
+
+
+def registrar_pool(nombre: str, obtener_pool: Callable[[], Optional[asyncpg.Pool]]):
+    """Gauges en uso/libres/máximo calculados al momento del scrape, sin costo por request."""
+
+    def leer(fn):
+        def valor():
+            pool = obtener_pool()
+            return fn(pool) if pool is not None else 0
+        return valor
+
+    POOL_CONEXIONES.labels(pool=nombre, estado="en_uso").set_function(
+        leer(lambda p: p.get_size() - p.get_idle_size())
+    )
+    POOL_CONEXIONES.labels(pool=nombre, estado="libres").set_function(leer(lambda p: p.get_idle_size()))
+    POOL_CONEXIONES.labels(pool=nombre, estado="max").set_function(leer(lambda p: p.get_max_size()))
+
+
+def _tipo_error(e: BaseException) -> Optional[str]:
+    # TimeoutError hereda de OSError: va primero
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(e, asyncpg.PostgresError):
+        return "postgres"
+    if isinstance(e, (asyncpg.InterfaceError, OSError)):
+        return "conexion"
+    return None  # HTTPException y demás errores de la aplicación no cuentan
+
+
+async def adquirir(pool: asyncpg.Pool, nombre: str, timeout: Optional[float]):
+    """pool.acquire con la espera medida. Devuelve (conexión, instante de obtención)."""
+    inicio = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=timeout)
+    except asyncio.TimeoutError:
+        POOL_TIMEOUTS.labels(pool=nombre).inc()
+        raise
+    except BaseException as e:
+        registrar_error(nombre, e)
+        raise
+    obtenida = time.perf_counter()
+    POOL_ESPERA.labels(pool=nombre).observe(obtenida - inicio)
+    return conn, obtenida
+
+
+def registrar_error(nombre: str, e: BaseException):
+    tipo = _tipo_error(e)
+    if tipo is not None:
+        POOL_ERRORES.labels(pool=nombre, tipo=tipo).inc()
+
+
+def registrar_retencion(nombre: str, obtenida: float):
+    POOL_RETENCION.labels(pool=nombre, ruta=get_current_route()).observe(time.perf_counter() - obtenida)
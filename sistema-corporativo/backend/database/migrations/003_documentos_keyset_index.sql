@@ -0,0 +1,13 @@
+-- =============================================================================
+-- MIGRACIÓN: 003_DOCUMENTOS_KEYSET_INDEX
+-- Objetivo: Índice compuesto para la paginación keyset de GET /documentos.
+-- =============================================================================
+
+BEGIN;
+
+-- El listado ordena por (fecha_creacion DESC, id DESC) filtrando por tenant_id.
+-- Con este índice cada página es un range scan acotado en vez de un sort completo.
+CREATE INDEX IF NOT EXISTS idx_documentos_tenant_fecha_creacion
+    ON documentos(tenant_id, fecha_creacion DESC, id DESC);
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- =============================================================================
+-- MIGRACIÓN: 004_DOCUMENTOS_EXPIRACION_INDEX
+-- Objetivo: Índice para el barrido de expiración del worker (services/worker.py).
+-- =============================================================================
+
+BEGIN;
+
+-- El barrido busca por estado y antigüedad de la última actividad:
+--   WHERE estado = $1 AND fecha_ultima_actividad < now() - interval
+CREATE INDEX IF NOT EXISTS idx_documentos_estado_actividad
+    ON documentos(estado, fecha_ultima_actividad);
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- =============================================================================
+-- MIGRACIÓN: 005_DOCUMENTO_ADJUNTOS_METADATA
+-- Objetivo: Metadatos de adjuntos e índice para la carga por lote (services/adjuntos.py).
+-- =============================================================================
+
+BEGIN;
+
+-- 1. Metadatos expuestos en el listado en lugar de solo la URL
+ALTER TABLE documento_adjuntos ADD COLUMN IF NOT EXISTS nombre_archivo TEXT;
+ALTER TABLE documento_adjuntos ADD COLUMN IF NOT EXISTS mime_type TEXT;
+ALTER TABLE documento_adjuntos ADD COLUMN IF NOT EXISTS tamano_bytes BIGINT;
+ALTER TABLE documento_adjuntos ADD COLUMN IF NOT EXISTS fecha_creacion TIMESTAMPTZ DEFAULT NOW();
+
+-- 2. Índice para WHERE documento_id = ANY($1) (una consulta por página)
+CREATE INDEX IF NOT EXISTS idx_documento_adjuntos_documento
+    ON documento_adjuntos(documento_id);
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- =============================================================================
+-- MIGRACIÓN: 006_DOCUMENTO_CORRELATIVOS
+-- Objetivo: Contador por (tenant, siglas, año) para generar correlativos en O(1).
+-- =============================================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS documento_correlativos (
+    tenant_id UUID NOT NULL,
+    siglas TEXT NOT NULL,
+    anio INTEGER NOT NULL,
+    ultimo INTEGER NOT NULL DEFAULT 0,
+    actualizado_en TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, siglas, anio)
+);
+
+COMMIT;
+
+-- Después de aplicar: sembrar contadores con scripts/backfill_correlativos.py
@@ -0,0 +1,16 @@
+-- =============================================================================
+-- MIGRACIÓN: 007_DOCUMENTO_ADJUNTOS_SHA256
+-- Objetivo: Adjuntos direccionados por contenido (services/storage.py).
+-- Cada fila de documento_adjuntos es una referencia al blob con ese SHA-256;
+-- el recolector del worker borra los blobs sin referencias.
+-- =============================================================================
+
+BEGIN;
+
+ALTER TABLE documento_adjuntos ADD COLUMN IF NOT EXISTS sha256 CHAR(64);
+
+-- Conteo de referencias / reenvíos por hash
+CREATE INDEX IF NOT EXISTS idx_documento_adjuntos_sha256
+    ON documento_adjuntos(sha256) WHERE sha256 IS NOT NULL;
+
+COMMIT;
@@ -0,0 +1,108 @@
+-- =============================================================================
+-- MIGRACIÓN: 008_DOCUMENTO_CONTADORES
+-- Objetivo: Contadores del buzón por (tenant, destino, estado, leido) mantenidos
+--           por triggers, para que los badges no requieran escanear documentos.
+-- =============================================================================
+
+BEGIN;
+
+-- Destino del documento: el receptor directo si existe; si no, la gerencia
+-- receptora. Un documento cuenta en un solo destino (sin doble conteo).
+CREATE TABLE IF NOT EXISTS documento_contadores (
+    tenant_id UUID NOT NULL,
+    destino_tipo TEXT NOT NULL CHECK (destino_tipo IN ('usuario', 'gerencia')),
+    destino_id TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    leido BOOLEAN NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    actualizado_en TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, destino_tipo, destino_id, estado, leido)
+);
+
+ALTER TABLE documento_contadores ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "tenant_isolation_documento_contadores" ON documento_contadores;
+CREATE POLICY "tenant_isolation_documento_contadores" ON documento_contadores
+    FOR SELECT TO authenticated
+    USING (tenant_id = get_current_tenant_id());
+
+-- Triggers por sentencia con tablas de transición: un barrido de expiración que
+-- toca 500 filas aplica un solo UPSERT agregado, no 500. Las claves se aplican
+-- ordenadas para que dos transacciones concurrentes no se bloqueen en cruz.
+CREATE OR REPLACE FUNCTION documento_contadores_aplicar() RETURNS TRIGGER AS $$
+DECLARE
+    fuente TEXT;
+    cols CONSTANT TEXT := 'tenant_id, receptor_id::text AS receptor_id, receptor_gerencia_id::text AS receptor_gerencia_id, estado, leido';
+BEGIN
+    -- Las tablas de transición visibles dependen de la operación
+    IF TG_OP = 'INSERT' THEN
+        fuente := format('SELECT %s, 1 AS delta FROM nuevas', cols);
+    ELSIF TG_OP = 'DELETE' THEN
+        fuente := format('SELECT %s, -1 AS delta FROM viejas', cols);
+    ELSE
+        fuente := format('SELECT %s, 1 AS delta FROM nuevas UNION ALL SELECT %s, -1 FROM viejas', cols, cols);
+    END IF;
+
+    EXECUTE format($q$
+        INSERT INTO documento_contadores AS c (tenant_id, destino_tipo, destino_id, estado, leido, total)
+        SELECT tenant_id,
+               CASE WHEN receptor_id IS NOT NULL THEN 'usuario' ELSE 'gerencia' END,
+               COALESCE(receptor_id, receptor_gerencia_id),
+               COALESCE(estado, ''),
+               COALESCE(leido, FALSE),
+               SUM(delta)
+        FROM (%s) d
+        WHERE tenant_id IS NOT NULL
+          AND COALESCE(receptor_id, receptor_gerencia_id) IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+        HAVING SUM(delta) <> 0
+        ORDER BY 1, 2, 3, 4, 5
+        ON CONFLICT (tenant_id, destino_tipo, destino_id, estado, leido)
+        DO UPDATE SET total = c.total + EXCLUDED.total, actualizado_en = NOW()
+    $q$, fuente);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS trg_documento_contadores_insert ON documentos;
+CREATE TRIGGER trg_documento_contadores_insert
+    AFTER INSERT ON documentos
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION documento_contadores_aplicar();
+
+DROP TRIGGER IF EXISTS trg_documento_contadores_update ON documentos;
+CREATE TRIGGER trg_documento_contadores_update
+    AFTER UPDATE ON documentos
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION documento_contadores_aplicar();
+
+DROP TRIGGER IF EXISTS trg_documento_contadores_delete ON documentos;
+CREATE TRIGGER trg_documento_contadores_delete
+    AFTER DELETE ON documentos
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION documento_contadores_aplicar();
+
+-- Siembra inicial. El lock impide escrituras entre la creación de los triggers
+-- y el conteo, así que no se pierde ni se duplica ningún documento.
+LOCK TABLE documentos IN SHARE ROW EXCLUSIVE MODE;
+
+DELETE FROM documento_contadores;
+INSERT INTO documento_contadores (tenant_id, destino_tipo, destino_id, estado, leido, total)
+SELECT tenant_id,
+       CASE WHEN receptor_id IS NOT NULL THEN 'usuario' ELSE 'gerencia' END,
+       COALESCE(receptor_id::text, receptor_gerencia_id::text),
+       COALESCE(estado, ''),
+       COALESCE(leido, FALSE),
+       COUNT(*)
+FROM documentos
+WHERE tenant_id IS NOT NULL
+  AND COALESCE(receptor_id::text, receptor_gerencia_id::text) IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5;
+
+COMMIT;
+
+-- Reconciliación posterior (si se sospecha deriva): scripts/rebuild_contadores.py
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import asyncpg
+from fastapi import Request
+from prometheus_client import Counter, Gauge
+
+from auth.security import get_request_claims
+from database import sentencias
+from database.conexion import DB_SSL, Conexion
+
+logger = logging.getLogger("sistema_corporativo")
+
+# Réplica de lectura opcional; sin ella todo sigue yendo a la primaria.
+# Para probar en local sirve el mismo DSN de la primaria (lag siempre 0).
+DB_REPLICA_URL = os.getenv("SUPABASE_DB_REPLICA_URL")
+# Por encima de este lag (segundos) las lecturas vuelven a la primaria
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 1))
+# Holgura de read-your-writes: cubre commits que la réplica aún no recibió
+# cuando reporta estar al día (receive LSN == replay LSN)
+DB_READ_YOUR_WRITES_MARGIN = float(os.getenv("DB_READ_YOUR_WRITES_MARGIN", 1))
+DB_REPLICA_MAX_SIZE = int(os.getenv("DB_REPLICA_MAX_SIZE", 20))
+DB_REPLICA_ACQUIRE_TIMEOUT = float(os.getenv("DB_REPLICA_ACQUIRE_TIMEOUT", 1))
+_MAX_ESCRITORES = 50000
+
+# Sin recuperación (la "réplica" es una primaria) o ya al día: lag 0
+_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+    END::float8
+"""
+
+REPLICA_LAG = Gauge("db_replica_lag_seconds", "Lag de replicación medido en la réplica de lectura")
+LECTURAS_RUTEADAS = Counter(
+    "db_read_routing_total",
+    "Sesiones de lectura por destino",
+    ["destino", "motivo"],  # replica|primaria ; ok|sin_replica|caida|lag|escritura_reciente
+)
+
+
+class ReplicaRouter:
+    """
+    Decide si una lectura puede ir a la réplica.
+
+    - Lag: un ciclo en segundo plano mide el lag cada
+      DB_REPLICA_LAG_CHECK_INTERVAL; sin medición reciente o con lag mayor a
+      DB_REPLICA_MAX_LAG se lee de la primaria.
+    - Read-your-writes: tras una escritura (método no seguro) del usuario, sus
+      lecturas van a la primaria hasta que la réplica haya reproducido hasta ese
+      instante. Se registra por proceso: con varias réplicas de la API un usuario
+      puede caer en otra instancia y ver la réplica dentro de DB_REPLICA_MAX_LAG.
+    """
+
+    def __init__(self, max_lag: float = DB_REPLICA_MAX_LAG, intervalo: float = DB_REPLICA_LAG_CHECK_INTERVAL,
+                 margen: float = DB_READ_YOUR_WRITES_MARGIN, reloj=time.monotonic):
+        self.max_lag = max_lag
+        self.intervalo = intervalo
+        self.margen = margen
+        self.reloj = reloj
+        self.pool: Optional[asyncpg.Pool] = None
+        self.lag: Optional[float] = None
+        self.medido_en = 0.0
+        # Instante (reloj local) hasta el que la réplica ya reprodujo los commits
+        self.visible_hasta = float("-inf")
+        self._escrituras: "OrderedDict[str, float]" = OrderedDict()
+        self._monitor: Optional[asyncio.Task] = None
+
+    def actualizar_lag(self, lag: Optional[float], medido_en: float):
+        self.lag = lag
+        self.medido_en = medido_en
+        if lag is None:
+            return
+        REPLICA_LAG.set(lag)
+        self.visible_hasta = max(self.visible_hasta, medido_en - lag - self.margen)
+
+    def registrar_escritura(self, user_id):
+        if not user_id:
+            return
+        clave = str(user_id)
+        self._escrituras[clave] = self.reloj()
+        self._escrituras.move_to_end(clave)
+        while len(self._escrituras) > _MAX_ESCRITORES:
+            self._escrituras.popitem(last=False)
+
+    def decidir(self, user_id=None) -> Tuple[bool, str]:
+        """(usar réplica, motivo)."""
+        if self.pool is None:
+            return False, "sin_replica"
+        ahora = self.reloj()
+        if self.lag is None or ahora - self.medido_en > self.intervalo * 3:
+            return False, "caida"
+        if self.lag > self.max_lag:
+            return False, "lag"
+        if user_id:
+            clave = str(user_id)
+            escrita = self._escrituras.get(clave)
+            if escrita is not None:
+                if escrita >= self.visible_hasta:
+                    return False, "escritura_reciente"
+                # La réplica ya la alcanzó: no hace falta recordarla más
+                del self._escrituras[clave]
+        return True, "ok"
+
+    async def medir(self):
+        inicio = self.reloj()
+        try:
+            async with self.pool.acquire(timeout=self.intervalo) as conn:
+                lag = await conn.fetchval(_LAG_QUERY, timeout=self.intervalo)
+        except Exception as e:
+            if self.lag is not None:
+                logger.warning(f"Réplica de lectura no disponible, lecturas a la primaria: {e}")
+            self.actualizar_lag(None, inicio)
+            return
+        self.actualizar_lag(lag, inicio)
+
+    async def _vigilar(self):
+        while True:
+            await self.medir()
+            await asyncio.sleep(self.intervalo)
+
+    async def start(self, dsn: Optional[str] = DB_REPLICA_URL):
+        if not dsn or self.pool is not None:
+            return
+        modo = await sentencias.detectar_modo(dsn, ssl=DB_SSL)
+
+        async def _init(conn):
+            if modo == "session":
+                await sentencias.precalentar(conn)
+            else:
+                # Réplica detrás de un pooler transaccional: sin preparadas explícitas
+                conn.sentencias = None
+
+        try:
+            self.pool = await asyncpg.create_pool(
+                dsn=dsn,
+                min_size=1,
+                max_size=DB_REPLICA_MAX_SIZE,
+                max_inactive_connection_lifetime=60.0,
+                command_timeout=60.0,
+                ssl=DB_SSL,
+                connection_class=Conexion,
+                init=_init,
+                statement_cache_size=sentencias.DB_STATEMENT_CACHE_SIZE if modo == "session" else 0,
+            )
+        except Exception as e:
+            # Sin réplica la API funciona igual contra la primaria
+            logger.error(f"No se pudo abrir el pool de la réplica: {e}")
+            return
+        await self.medir()
+        self._monitor = asyncio.create_task(self._vigilar(), name="replica-lag")
+        logger.info(f"Réplica de lectura activa (sentencias: {modo}, lag: {self.lag})")
+
+    async def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+
+replicas = ReplicaRouter()
+
+
+METODOS_SEGUROS = ("GET", "HEAD", "OPTIONS")
+
+
+async def read_your_writes_middleware(request: Request, call_next):
+    """Registra al autor de cada escritura exitosa para que sus lecturas vean lo escrito."""
+    response = await call_next(request)
+    if replicas.pool is not None and request.method not in METODOS_SEGUROS and response.status_code < 400:
+        claims = get_request_claims(request) or {}
+        replicas.registrar_escritura(claims.get("sub"))
+    return response
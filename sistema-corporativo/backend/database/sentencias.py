@@ -0,0 +1,203 @@
+import os
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict
+from urllib.parse import urlparse
+
+import asyncpg
+from prometheus_client import Counter, Gauge, Histogram
+
+from database import instrumentacion
+
+logger = logging.getLogger("sistema_corporativo")
+
+# auto: lo decide la sonda de arranque; session: conexión directa o pooler en modo
+# sesión (sentencias preparadas seguras); transaction: pooler transaccional
+# (puerto 6543 de Supabase), donde cada query se parsea y planifica de nuevo.
+DB_STATEMENT_MODE = os.getenv("DB_STATEMENT_MODE", "auto").lower()
+# Caché LRU de asyncpg para todas las queries (solo en modo session)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256))
+# Sentencias nombradas preparadas por conexión (variantes de queries dinámicas incluidas)
+DB_PREPARED_PER_CONNECTION = int(os.getenv("DB_PREPARED_PER_CONNECTION", 64))
+PUERTO_POOLER_TRANSACCIONAL = 6543
+MODOS = ("session", "transaction")
+
+MODO_ACTIVO = Gauge("db_statement_mode", "Modo de sentencias activo (1 = activo)", ["modo"])
+PREPARACION = Histogram(
+    "db_statement_prepare_seconds",
+    "Duración de preparar (parse + describe) una consulta caliente",
+    ["consulta"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+AHORRO = Counter(
+    "db_statement_planning_saved_seconds_total",
+    "Tiempo de parse/planificación evitado al reutilizar la sentencia preparada (estimado)",
+    ["consulta"],
+)
+EJECUCIONES = Counter(
+    "db_statement_executions_total",
+    "Ejecuciones de consultas calientes",
+    ["consulta", "via"],  # preparada | simple
+)
+
+modo = "transaction"
+_costo_preparacion: Dict[str, float] = {}
+
+
+@dataclass(frozen=True)
+class Consulta:
+    """
+    SQL fija con nombre estable para métricas y para el registro de preparadas.
+    No usar con SQL armada por request: cada variante se prepararía en cada
+    conexión y desalojaría a las calientes (DB_PREPARED_PER_CONNECTION).
+    """
+
+    nombre: str
+    sql: str
+
+
+# Consultas fijas del camino caliente; se preparan al abrir cada conexión
+CONSULTAS_CALIENTES: Dict[str, Consulta] = {}
+
+
+def consulta_caliente(nombre: str, sql: str) -> Consulta:
+    """Registra una consulta fija para precalentarla en cada conexión nueva."""
+    consulta = Consulta(nombre, sql)
+    existente = CONSULTAS_CALIENTES.get(nombre)
+    if existente is not None and existente.sql != sql:
+        raise ValueError(f"Consulta caliente duplicada: {nombre!r}")
+    CONSULTAS_CALIENTES[nombre] = consulta
+    # Las ejecuciones sin preparar (Conexion.fetch, modo transaction) se miden con
+    # este nombre. Solo consultas fijas: la SQL dinámica queda en el LRU acotado.
+    instrumentacion.registrar_nombre(sql, nombre)
+    return consulta
+
+
+def modo_por_dsn(dsn: str):
+    """Modo implícito en el DSN, o None si hay que sondear."""
+    try:
+        puerto = urlparse(dsn).port
+    except ValueError:
+        return None
+    if puerto == PUERTO_POOLER_TRANSACCIONAL:
+        return "transaction"
+    return None
+
+
+async def detectar_modo(dsn: str, **connect_kwargs) -> str:
+    """
+    Sonda de arranque: decide si es seguro usar sentencias preparadas.
+
+    En un pooler transaccional dos statements consecutivos fuera de una
+    transacción pueden llegar a backends distintos (pid cambia) y una sentencia
+    preparada en uno no existe en el otro. Ante cualquier duda: transaction.
+    """
+    if DB_STATEMENT_MODE in MODOS:
+        return DB_STATEMENT_MODE
+    if DB_STATEMENT_MODE != "auto":
+        logger.warning(f"DB_STATEMENT_MODE inválido ({DB_STATEMENT_MODE!r}), se usa auto")
+
+    implicito = modo_por_dsn(dsn)
+    if implicito:
+        return implicito
+
+    try:
+        conn = await asyncpg.connect(dsn=dsn, statement_cache_size=0, **connect_kwargs)
+    except Exception as e:
+        logger.warning(f"Sonda de sentencias sin conexión ({e}); modo transaction")
+        return "transaction"
+    try:
+        pids = {await conn.fetchval("SELECT pg_backend_pid()") for _ in range(5)}
+        if len(pids) > 1:
+            return "transaction"
+        stmt = await conn.prepare("SELECT $1::int + 1")
+        for i in range(3):
+            if await stmt.fetchval(i) != i + 1:
+                return "transaction"
+        return "session"
+    except Exception as e:
+        logger.info(f"Sentencias preparadas no disponibles ({e}); modo transaction")
+        return "transaction"
+    finally:
+        await conn.close()
+
+
+def configurar(nuevo_modo: str) -> dict:
+    """Fija el modo activo y devuelve las opciones de create_pool correspondientes."""
+    global modo
+    modo = nuevo_modo
+    for m in MODOS:
+        MODO_ACTIVO.labels(modo=m).set(1 if m == modo else 0)
+    return {"statement_cache_size": DB_STATEMENT_CACHE_SIZE if modo == "session" else 0}
+
+
+async def _preparar(conn, consulta: Consulta):
+    inicio = time.perf_counter()
+    stmt = await conn.prepare(consulta.sql)
+    duracion = time.perf_counter() - inicio
+    PREPARACION.labels(consulta=consulta.nombre).observe(duracion)
+    # Media móvil: el costo evitado por reutilización se estima con ella
+    previo = _costo_preparacion.get(consulta.nombre)
+    _costo_preparacion[consulta.nombre] = duracion if previo is None else previo * 0.9 + duracion * 0.1
+
+    cache = conn.sentencias
+    cache[consulta.sql] = stmt
+    while len(cache) > DB_PREPARED_PER_CONNECTION:
+        cache.popitem(last=False)
+    return stmt
+
+
+async def precalentar(conn):
+    """Callback `init` del pool: prepara las consultas calientes registradas."""
+    if modo != "session" or not hasattr(conn, "sentencias"):
+        return
+    for consulta in CONSULTAS_CALIENTES.values():
+        try:
+            await _preparar(conn, consulta)
+        except Exception as e:
+            # Una consulta rota no debe impedir abrir la conexión; se ejecutará sin preparar
+            logger.warning(f"No se pudo preparar '{consulta.nombre}': {e}")
+
+
+async def _sentencia(conn, consulta: Consulta):
+    cache = getattr(conn, "sentencias", None) if modo == "session" else None
+    if cache is None:
+        return None
+    stmt = cache.get(consulta.sql)
+    if stmt is not None:
+        cache.move_to_end(consulta.sql)
+        AHORRO.labels(consulta=consulta.nombre).inc(_costo_preparacion.get(consulta.nombre, 0.0))
+        return stmt
+    return await _preparar(conn, consulta)
+
+
+async def _ejecutar(conn, consulta: Consulta, metodo: str, args):
+    stmt = await _sentencia(conn, consulta)
+    if stmt is not None:
+        try:
+            resultado = await instrumentacion.medir(
+                consulta.sql, args, getattr(stmt, metodo)(*args), nombre=consulta.nombre
+            )
+            EJECUCIONES.labels(consulta=consulta.nombre, via="preparada").inc()
+            return resultado
+        except (asyncpg.exceptions.InvalidCachedStatementError, asyncpg.exceptions.OutdatedSchemaCacheError):
+            # Cambió el esquema (migración): se descarta y se reintenta sin preparar,
+            # salvo dentro de una transacción, que ya quedó abortada
+            conn.sentencias.pop(consulta.sql, None)
+            if conn.is_in_transaction():
+                raise
+    EJECUCIONES.labels(consulta=consulta.nombre, via="simple").inc()
+    return await getattr(conn, metodo)(consulta.sql, *args)
+
+
+async def fetch(conn, consulta: Consulta, *args):
+    return await _ejecutar(conn, consulta, "fetch", args)
+
+
+async def fetchrow(conn, consulta: Consulta, *args):
+    return await _ejecutar(conn, consulta, "fetchrow", args)
+
+
+async def fetchval(conn, consulta: Consulta, *args):
+    return await _ejecutar(conn, consulta, "fetchval", args)
@@ -5,21 +5,16 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional, List
 from dotenv import load_dotenv
-from pathlib import Path
 
-# Cargar .env explícitamente desde la carpeta backend
+# Cargar .env explícitamente desde la carpeta backend. Debe ir antes de importar
+# los módulos de la app: sus constantes de configuración se leen al importarlos.
 env_path = Path(__file__).parent / ".env"
-print(f"\n🔍 Buscando .env en: {env_path}")
-print(f"📁 Existe: {env_path.exists()}\n")
-
 load_dotenv(dotenv_path=env_path)
 
-from fastapi import FastAPI, Depends, HTTPException, status, Security, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Security, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
-from jose import jwt
-from passlib.context import CryptContext
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import traceback
 
 # Asegurar que el directorio backend esté en el PYTHONPATH
@@ -28,47 +23,31 @@ if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
 # AHORA sí importar módulos que dependen de variables de entorno
-from database.async_db import get_db_connection, init_db_pool, pool
+from database.async_db import get_db_connection, get_read_connection, db_session, read_session, init_db_pool
+from database import async_db
+from database.calentamiento import pool_warmup
+from database.replicas import read_your_writes_middleware, replicas
 from middleware.tenant import get_tenant_context, trace_id_var
-from services.rate_limiter import rate_limiter_middleware
+from middleware.context import request_scope_var
+from services.rate_limiter import rate_limit_middleware
+from services import documentos as documentos_service
+from services.correlativos import correlativos
 from src import schemas
-from routers import auth_router, users_router, gerencias_router
+from routers import auth_router, users_router, gerencias_router, diagnostico_router
 
 import json
 
 # ===================================================================
 # CONFIGURACIÓN DE LOGGING ESTRUCTURADO JSON ENTERPRISE
 # ===================================================================
-from middleware.context import (
-    get_current_tenant_id, 
-    get_current_user_id, 
-    get_current_trace_id, 
-)
+# Formato JSON, cola con escritura en un hilo aparte, muestreo y deduplicación
+# de errores en services/logs.py
+from services.logs import configurar_logging, detener_logging
 import time
 import uuid
 
-class JSONFormatter(logging.Formatter):
-    def format(self, record):
-        log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "level": record.levelname,
-            "message": record.getMessage(),
-            "module": record.module,
-            "tenant_id": get_current_tenant_id(),
-            "user_id": get_current_user_id(),
-            "trace_id": get_current_trace_id(),
-        }
-        if hasattr(record, 'duration_ms'):
-            log_entry["duration_ms"] = record.duration_ms
-            
-        if record.exc_info:
-            log_entry["exception"] = self.formatException(record.exc_info)
-        return json.dumps(log_entry)
-
 logger = logging.getLogger("sistema_corporativo")
-handler = logging.StreamHandler()
-handler.setFormatter(JSONFormatter())
-logger.addHandler(handler)
+configurar_logging(logger)
 logger.setLevel(logging.INFO)
 logger.propagate = False
 
@@ -78,29 +57,48 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# Rate limiting por tenant/usuario/IP (services/rate_limiter.py). Se registra
+# antes que el de observabilidad para quedar por dentro: los 429 también se loguean.
+app.middleware("http")(rate_limit_middleware)
+app.middleware("http")(read_your_writes_middleware)
+
 # Middleware de Observabilidad (Trace ID y Duración)
+# Logger propio para la línea de acceso: se puede muestrear con LOG_SAMPLE_RATES
+access_logger = logging.getLogger("sistema_corporativo.access")
+
 @app.middleware("http")
 async def add_observability_context(request: Request, call_next):
     start_time = time.time()
     trace_id = str(uuid.uuid4())
     token = trace_id_var.set(trace_id)
+    scope_token = request_scope_var.set(request.scope)
     
     try:
         response = await call_next(request)
         duration_ms = int((time.time() - start_time) * 1000)
         
-        logger.info(
+        access_logger.info(
             f"HTTP {request.method} {request.url.path} - {response.status_code}",
             extra={"duration_ms": duration_ms}
         )
         return response
     finally:
         trace_id_var.reset(token)
+        request_scope_var.reset(scope_token)
 
 # ===================================================================
 # CONFIGURACIÓN DE SEGURIDAD
 # ===================================================================
-from auth.security import verify_password, get_password_hash, create_access_token
+from auth.security import (
+    verify_password_async, get_password_hash_async, create_access_token,
+    start_hash_pool, shutdown_hash_pool, bearer_token, get_request_claims, precargar_jwt,
+)
+
+from auth.admission import auth_admission
+from services.rate_limiter import ip_cliente
+from services.activity import ultima_conexion
+from services.membresias import membresias
+from services.redis_client import close_redis
 
 # ===================================================================
 # MIDDLEWARES
@@ -119,22 +117,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor",
+        "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After",
+    ],
 )
 
-# Servir archivos estáticos para adjuntos
+# Los adjuntos ya no se sirven con StaticFiles: se descargan por
+# GET /documentos/adjuntos/{id}, que valida tenant y destinatario
 uploads_dir = Path("uploads")
 uploads_dir.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # INCLUSIÓN DE ROUTERS
 app.include_router(auth_router.router)
 app.include_router(users_router.router)
 app.include_router(gerencias_router.router)
+app.include_router(diagnostico_router.router)
 
 @app.on_event("startup")
 async def startup():
     await init_db_pool()
     logger.info("Database Connection Pool Initialized")
+    # En segundo plano: /health/ready responde 503 hasta que termine
+    pool_warmup.start(async_db.pool)
+    # Imports diferidos (scripts/import_budget.py): se cargan mientras el pool
+    # calienta, antes de que /health/ready deje pasar tráfico
+    precargar_jwt()
+    await replicas.start()
+    await start_hash_pool()
+    ultima_conexion.start()
+    membresias.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await pool_warmup.stop()
+    try:
+        await ultima_conexion.stop()
+    except Exception as e:
+        logger.error(f"No se pudo vaciar la actividad pendiente: {e}")
+    await membresias.stop()
+    await replicas.stop()
+    await close_redis()
+    shutdown_hash_pool()
+    detener_logging()
 
 # ===================================================================
 # UTILIDADES
@@ -144,14 +169,13 @@ async def startup():
 # ===================================================================
 # GLOBAL EXCEPTION HANDLER
 # ===================================================================
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    error_trace = traceback.format_exc()
-    # Print explícito para asegurar que se ve en la terminal
-    print(f"\n❌ CRITICAL GLOBAL ERROR: {str(exc)}\n{error_trace}\n")
-    logger.error(f"GLOBAL ERROR: {str(exc)}\n{error_trace}")
+    # Pasa por ContextQueueHandler como el resto de los logs: nada de escrituras
+    # síncronas a stdout desde el event loop
+    logger.exception(f"GLOBAL ERROR: {exc}", exc_info=exc)
     
     response_content = {
         "detail": "Internal Server Error",
@@ -161,7 +185,7 @@ async def global_exception_handler(request: Request, exc: Exception):
     
     # En desarrollo, enviamos el trace al frontend para diagnóstico rápido
     if os.getenv("DEBUG", "true").lower() == "true":
-        response_content["trace"] = error_trace
+        response_content["trace"] = "".join(traceback.format_exception(exc))
 
     response = JSONResponse(
         status_code=500,
@@ -184,7 +208,7 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 @app.get("/db-check")
 @app.get("/health")
-async def health_check(conn = Depends(get_db_connection)):
+async def health_check(conn = Depends(get_db_connection, scope="function")):
     try:
         await conn.execute("SELECT 1")
         return {"status": "ok", "message": "Conectado al Backend y Base de Datos (Enterprise Mode)", "database": "connected"}
@@ -195,92 +219,106 @@ async def health_check(conn = Depends(get_db_connection)):
 @app.post("/register", response_model=schemas.UsuarioResponse)
 async def register_user(
     user: schemas.UsuarioCreate, 
-    conn = Depends(get_db_connection)
+    request: Request,
 ):
-    try:
-        existing = await conn.fetchrow(
-            "SELECT id FROM profiles WHERE username = $1 OR email = $2", 
-            user.username, user.email
-        )
-        if existing:
-            raise HTTPException(status_code=400, detail="Usuario o Email ya registrado")
-
-        # Mapear gerencia si viene por nombre
-        g_id = user.gerencia_id
-        if not g_id and user.gerencia_nombre:
-            g_id = await conn.fetchval("SELECT id FROM gerencias WHERE nombre = $1", user.gerencia_nombre)
-            if not g_id:
-                # Si no existe, crearla dinámicamente
-                g_id = await conn.fetchval(
-                    "INSERT INTO gerencias (nombre) VALUES ($1) RETURNING id", 
-                    user.gerencia_nombre
-                )
-
-        hashed_pw = get_password_hash(user.password)
+    # Admisión antes de tomar una conexión o calcular el hash (auth/admission.py):
+    # bajo un flood los rechazos no ocupan el pool
+    async with auth_admission.admitir(user.username, ip_cliente(request), user.password):
+        try:
+            hashed_pw = await get_password_hash_async(user.password)
 
-        query = """
-            INSERT INTO profiles (username, nombre, apellido, email, password_hash, rol_id, gerencia_id, estado)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            RETURNING id, username, nombre, apellido, email, rol_id, gerencia_id, estado, tenant_id
-        """
-        default_rol = 3
-        row = await conn.fetchrow(
-            query, 
-            user.username, user.nombre, user.apellido, user.email, 
-            hashed_pw, user.rol_id or default_rol, g_id, True
-        )
+            async with db_session() as conn:
+                existing = await conn.fetchrow(
+                    "SELECT id FROM profiles WHERE username = $1 OR email = $2", 
+                    user.username, user.email
+                )
+                if existing:
+                    raise HTTPException(status_code=400, detail="Usuario o Email ya registrado")
+
+                # Mapear gerencia si viene por nombre
+                g_id = user.gerencia_id
+                if not g_id and user.gerencia_nombre:
+                    g_id = await conn.fetchval("SELECT id FROM gerencias WHERE nombre = $1", user.gerencia_nombre)
+                    if not g_id:
+                        # Si no existe, crearla dinámicamente
+                        g_id = await conn.fetchval(
+                            "INSERT INTO gerencias (nombre) VALUES ($1) RETURNING id", 
+                            user.gerencia_nombre
+                        )
+
+                query = """
+                    INSERT INTO profiles (username, nombre, apellido, email, password_hash, rol_id, gerencia_id, estado)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                    RETURNING id, username, nombre, apellido, email, rol_id, gerencia_id, estado, tenant_id
+                """
+                default_rol = 3
+                row = await conn.fetchrow(
+                    query, 
+                    user.username, user.nombre, user.apellido, user.email, 
+                    hashed_pw, user.rol_id or default_rol, g_id, True
+                )
         
-        return dict(row)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Registration error: {e}")
-        raise HTTPException(status_code=500, detail=f"Error interno durante el registro: {str(e)}")
+            return dict(row)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Registration error: {e}")
+            raise HTTPException(status_code=500, detail=f"Error interno durante el registro: {str(e)}")
 
 @app.post("/login")
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    conn = Depends(get_db_connection)
 ):
-    query = """
-        SELECT p.id, p.username, p.password_hash, p.nombre, p.apellido, p.email, p.rol_id, r.nombre_rol, p.tenant_id,
-               p.gerencia_id, g.nombre as gerencia_nombre
-        FROM profiles p
-        LEFT JOIN roles r ON p.rol_id = r.id
-        LEFT JOIN gerencias g ON p.gerencia_id = g.id
-        WHERE p.username = $1 AND p.estado = TRUE
-    """
-    user = await conn.fetchrow(query, form_data.username)
-
-    if not user or not verify_password(form_data.password, user['password_hash']):
-        raise HTTPException(status_code=401, detail="Credenciales incorrectas")
+    # Admisión antes de tomar una conexión o calcular el hash (auth/admission.py):
+    # bajo un flood los rechazos no ocupan el pool
+    async with auth_admission.admitir(form_data.username, ip_cliente(request), form_data.password):
+        query = """
+            SELECT p.id, p.username, p.password_hash, p.nombre, p.apellido, p.email, p.rol_id, r.nombre_rol, p.tenant_id,
+                   p.gerencia_id, g.nombre as gerencia_nombre
+            FROM profiles p
+            LEFT JOIN roles r ON p.rol_id = r.id
+            LEFT JOIN gerencias g ON p.gerencia_id = g.id
+            WHERE p.username = $1 AND p.estado = TRUE
+        """
+        # La conexión se devuelve antes del hash: PBKDF2 no retiene el pool
+        async with db_session() as conn:
+            user = await conn.fetchrow(query, form_data.username)
+        if not user:
+            raise HTTPException(status_code=401, detail="Credenciales incorrectas")
+
+        valida, nuevo_hash = await verify_password_async(form_data.password, user['password_hash'])
+        if not valida:
+            raise HTTPException(status_code=401, detail="Credenciales incorrectas")
+        if nuevo_hash:
+            # Parámetros de hash actualizados (PBKDF2_ROUNDS): se re-hashea en el login
+            async with db_session() as conn:
+                await conn.execute("UPDATE profiles SET password_hash = $1 WHERE id = $2", nuevo_hash, user['id'])
+
+        access_token = create_access_token(
+            data={
+                "sub": str(user['id']), 
+                "role": user['nombre_rol'],
+                "tenant_id": str(user['tenant_id']) if user['tenant_id'] else None,
+                "gerencia_id": user['gerencia_id']
+            }
+        )
 
-    access_token = create_access_token(
-        data={
-            "sub": str(user['id']), 
-            "role": user['nombre_rol'],
-            "tenant_id": str(user['tenant_id']) if user['tenant_id'] else None,
-            "gerencia_id": user['gerencia_id']
-        }
-    )
+        # Write-behind: se escribe en lote desde services/activity.py, fuera del request
+        ultima_conexion.registrar(user['id'])
 
-    await conn.execute(
-        "UPDATE profiles SET ultima_conexion = $1 WHERE id = $2", 
-        datetime.now(), user['id']
-    )
-
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": {
-            "id": str(user['id']),
-            "username": user['username'],
-            "role": user['nombre_rol'],
-            "tenant_id": user['tenant_id'],
-            "gerencia_id": user['gerencia_id'],
-            "gerencia_depto": user['gerencia_nombre']
+        return {
+            "access_token": access_token,
+            "token_type": "bearer",
+            "user": {
+                "id": str(user['id']),
+                "username": user['username'],
+                "role": user['nombre_rol'],
+                "tenant_id": user['tenant_id'],
+                "gerencia_id": user['gerencia_id'],
+                "gerencia_depto": user['gerencia_nombre']
+            }
         }
-    }
 
 # ===================================================================
 # HEALTH CHECKS ENTERPRISE
@@ -291,20 +329,35 @@ async def liveness():
     return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
 
 @app.get("/health/ready")
-async def readiness(conn = Depends(get_db_connection)):
+async def readiness():
+    if not pool_warmup.listo:
+        # Un despliegue progresivo no debe mandar tráfico a un pool frío. Se revisa
+        # antes de pedir conexión: el probe no espera admisión durante el calentamiento
+        raise HTTPException(status_code=503, detail="Service Not Ready: warming up")
     try:
-        await conn.execute("SELECT 1")
+        async with db_session() as conn:
+            await conn.execute("SELECT 1")
         return {
             "status": "ready",
             "components": {
                 "database": "ok",
-                "pool_size": pool.get_size() if pool else 0
+                "pool_size": async_db.pool.get_size() if async_db.pool else 0,
+                "warmup_seconds": round(pool_warmup.duracion, 3),
+                # RUNBOOK §3: sin Redis se sigue atendiendo con consultas directas a la BD
+                "membership_cache": "degradado" if membresias.degradado else "ok",
+                # Sin réplica sana las lecturas siguen en la primaria
+                "read_replica": replicas.decidir()[1],
             }
         }
     except Exception as e:
         logger.error(f"Readiness check failed: {e}")
         raise HTTPException(status_code=503, detail="Service Not Ready")
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato de texto Prometheus."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # ===================================================================
 # ENDPOINTS DE AUTENTICACIÓN Y TENANCY
 # ===================================================================
@@ -313,34 +366,26 @@ async def readiness(conn = Depends(get_db_connection)):
 async def switch_organization(
     org_id: schemas.SwitchOrgRequest,
     request: Request,
-    conn = Depends(get_db_connection)
+    conn = Depends(get_db_connection, scope="function")
 ):
-    user_id = request.state.user_id if hasattr(request.state, 'user_id') else None
-    
+    claims = get_request_claims(request)
+    user_id = claims.get("sub") if claims else None
+
     if not user_id:
         raise HTTPException(status_code=401, detail="Token inválido")
     
-    query = """
-        SELECT EXISTS(
-            SELECT 1 FROM user_organizations 
-            WHERE user_id = $1 AND organization_id = $2
-        )
-    """
-    exists = await conn.fetchval(query, user_id, org_id.organization_id)
-    
-    if not exists:
+    # Membresía y rol desde el caché L1/Redis (services/membresias.py); sin Redis
+    # cae a una consulta directa a user_organizations
+    membresias_usuario = await membresias.obtener(conn, user_id)
+    if str(org_id.organization_id) not in membresias_usuario:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta organización")
-    
-    role_row = await conn.fetchrow(
-        "SELECT role FROM user_organizations WHERE user_id = $1 AND organization_id = $2",
-        user_id, org_id.organization_id
-    )
+    role = membresias_usuario[str(org_id.organization_id)]
 
     new_token = create_access_token(
         data={
             "sub": user_id,
             "tenant_id": str(org_id.organization_id),
-            "role": role_row['role'] if role_row else 'member'
+            "role": role or 'member'
         }
     )
     
@@ -353,71 +398,73 @@ async def switch_organization(
     }
 
 @app.get("/documentos", dependencies=[Depends(get_tenant_context)])
-async def list_documentos(conn = Depends(get_db_connection)):
+async def list_documentos(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=documentos_service.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+):
     try:
-        # 1. Ejecutar máquina de estados automática
-        await conn.execute("""
-            UPDATE documentos 
-            SET estado = 'pendiente' 
-            WHERE estado = 'en-proceso' 
-            AND now() - fecha_ultima_actividad > INTERVAL '3 days'
-        """)
-        
-        await conn.execute("""
-            UPDATE documentos 
-            SET estado = 'omitido' 
-            WHERE estado = 'pendiente' 
-            AND now() - fecha_ultima_actividad > INTERVAL '6 days'
-        """)
+        # La máquina de estados (en-proceso -> pendiente -> omitido) la ejecuta
+        # el worker (services/worker.py); la lectura del buzón no escribe.
 
-        # 2. Query mejorada para sistema de correo con multi-adjuntos
-        query = """
-            SELECT 
-                d.id, 
-                COALESCE(d.titulo, d.title, 'Sin Asunto') as name, 
-                d.correlativo as idDoc,
-                d.tipo_documento as category,
-                d.estado as signatureStatus,
-                d.prioridad,
-                d.remitente_id,
-                COALESCE(p_rem.nombre || ' ' || p_rem.apellido, 'Desconocido') as uploadedBy,
-                COALESCE(p_rem.nombre || ' ' || p_rem.apellido, 'Desconocido') as remitente_nombre,
-                d.receptor_id,
-                d.receptor_gerencia_id,
-                COALESCE(p_rec.nombre || ' ' || p_rec.apellido, g.nombre, 'Sin Asignar') as receptor_nombre,
-                COALESCE(g.nombre, 'Mensaje Personal') as targetDepartment,
-                d.url_archivo as fileUrl,
-                (SELECT array_agg(da.url_archivo) FROM documento_adjuntos da WHERE da.documento_id = d.id) as archivos,
-                d.fecha_creacion,
-                TO_CHAR(d.fecha_creacion, 'DD/MM/YYYY') as uploadDate,
-                TO_CHAR(d.fecha_creacion, 'HH24:MI') as uploadTime,
-                d.fecha_caducidad,
-                d.tenant_id,
-                d.contenido,
-                d.leido
-            FROM documentos d
-            LEFT JOIN profiles p_rem ON d.remitente_id = p_rem.id
-            LEFT JOIN profiles p_rec ON d.receptor_id = p_rec.id
-            LEFT JOIN gerencias g ON d.receptor_gerencia_id = g.id
-            ORDER BY d.fecha_creacion DESC
-        """
-        rows = await conn.fetch(query)
-        # Convertir record a dict y manejar el campo archivos
-        result = []
-        for r in rows:
-            d = dict(r)
-            # Asegurar que archivos no sea None
-            if d.get("archivos") is None:
-                d["archivos"] = [d["fileUrl"]] if d.get("fileUrl") else []
-            result.append(d)
-        return result
+        # 1. Query keyset (fecha_creacion, id) con proyección opcional de columnas
+        if cursor and limit is None:
+            limit = documentos_service.DEFAULT_PAGE_SIZE
+        try:
+            columnas = documentos_service.parse_fields(fields)
+            query, args = documentos_service.build_list_query(
+                columnas,
+                tenant_id=request.state.tenant_id,
+                cursor=cursor,
+                limit=limit,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # 2. Modo streaming opt-in: NDJSON por Accept o array JSON por chunks (?stream=true)
+        ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+        if ndjson or stream:
+            return StreamingResponse(
+                documentos_service.stream_documentos(query, args, columnas, ndjson=ndjson, limit=limit),
+                media_type="application/x-ndjson" if ndjson else "application/json",
+            )
+
+        # La conexión se toma aquí y no como dependencia: en modo streaming el
+        # generador abre su propia sesión y no debe retener una segunda conexión
+        async with read_session() as conn:
+            # SQL armada por request (proyección/cursor): va por la caché de sentencias
+            # de asyncpg, no por database/sentencias.py, que es solo para consultas fijas.
+            # Se mide con un nombre fijo para no abrir una serie por variante
+            rows = await conn.fetch(query, *args, nombre=documentos_service.CONSULTA_LISTADO)
+
+            # 3. Cursor opaco para la siguiente página (solo en modo paginado)
+            siguiente = documentos_service.next_cursor(rows, limit)
+            if siguiente:
+                response.headers["X-Next-Cursor"] = siguiente
+                rows = rows[:limit]
+
+            # 4. Adjuntos de toda la página en un único query
+            return await documentos_service.materializar_documentos(conn, rows, columnas)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error listando correos/documentos: {e}")
-        traceback.print_exc()
+        logger.exception(f"Error listando correos/documentos: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+from services.contadores import resumen_buzon
+
+@app.get("/documentos/summary", dependencies=[Depends(get_tenant_context)])
+async def documentos_summary(request: Request, conn = Depends(get_db_connection, scope="function")):
+    """Badges del buzón (no leídos y conteo por estado) desde documento_contadores."""
+    return await resumen_buzon(conn, request.state.tenant_id, request.state.user_id)
+
 from fastapi import UploadFile, File as FastAPIFile, Form
-import shutil
+from services.uploads import UploadBudget, guardar_upload
+from services.storage import get_blob_store
+from services.descargas import obtener_adjunto_autorizado, obtener_archivo_documento, responder_adjunto
 
 @app.post("/documentos", dependencies=[Depends(get_tenant_context)])
 async def create_documento(
@@ -430,22 +477,17 @@ async def create_documento(
     receptor_id: Optional[uuid.UUID] = Form(None),
     contenido: Optional[str] = Form(None),
     archivos: List[UploadFile] = FastAPIFile(None),
-    conn = Depends(get_db_connection)
+    adjuntos_sha256: Optional[List[str]] = Form(None),
 ):
     try:
-        # ========== 1. EXTRAER Y VALIDAR TOKEN ==========
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
+        # ========== 1. CLAIMS DEL TOKEN (ya verificados por get_tenant_context) ==========
+        if not bearer_token(request):
             raise HTTPException(status_code=401, detail="Token no proporcionado")
-        
-        token = auth_header.split(" ")[1]
-        secret_key = os.getenv("JWT_SECRET", "tu_clave_secreta_muy_segura_cambiala_en_produccion")
-        
-        try:
-            payload = jwt.decode(token, secret_key, algorithms=["HS256"])
-        except Exception as e:
-            raise HTTPException(status_code=401, detail=f"Token inválido: {str(e)}")
-        
+
+        payload = get_request_claims(request)
+        if payload is None:
+            raise HTTPException(status_code=401, detail=f"Token inválido: {getattr(request.state, 'claims_error', '')}")
+
         user_id_raw = payload.get("sub")
         tenant_id_raw = payload.get("tenant_id")
         
@@ -454,88 +496,135 @@ async def create_documento(
         
         user_id = uuid.UUID(str(user_id_raw))
         
-        # ========== 2. OBTENER TENANT_ID ==========
+        # ========== 2. PROCESAR MÚLTIPLES ARCHIVOS ==========
+        # Se escriben antes de tomar la conexión para no retener el pool ni locks durante el I/O.
+        # La copia corre por chunks fuera del event loop (services/uploads.py) y luego
+        # se publica en el almacén direccionado por contenido: un archivo idéntico
+        # ya almacenado no se vuelve a guardar.
+        store = get_blob_store()
+        nuevos = []
+        if archivos:
+            presupuesto = UploadBudget()
+            staging = []
+            try:
+                for archivo in archivos:
+                    if archivo and archivo.filename:
+                        staging.append(await guardar_upload(archivo, Path("uploads/tmp"), presupuesto))
+                for adjunto in staging:
+                    await store.put(adjunto.sha256, adjunto.path, adjunto.mime_type)
+                    nuevos.append((store.url(adjunto.sha256), adjunto.nombre, adjunto.mime_type, adjunto.tamano, adjunto.sha256))
+            except BaseException:
+                for adjunto in staging:
+                    adjunto.path.unlink(missing_ok=True)
+                raise
+
+        # ========== 3. TENANT Y SIGLAS EN UNA SOLA CONSULTA ==========
+        async with db_session() as conn:
+            user_info = await conn.fetchrow("""
+                SELECT p.tenant_id, g.siglas FROM profiles p 
+                LEFT JOIN gerencias g ON p.gerencia_id = g.id 
+                WHERE p.id = $1
+            """, user_id)
+        siglas = user_info['siglas'] if user_info and user_info['siglas'] else 'COR'
+
         tenant_id = None
         if tenant_id_raw and tenant_id_raw != "None":
             try:
                 tenant_id = uuid.UUID(str(tenant_id_raw))
-            except:
+            except ValueError:
                 pass
-        
         if not tenant_id:
-            tenant_id_raw = await conn.fetchval("SELECT tenant_id FROM profiles WHERE id = $1", user_id)
-            tenant_id = uuid.UUID(str(tenant_id_raw)) if tenant_id_raw else uuid.UUID("00000000-0000-0000-0000-000000000001")
-        
-        # ========== 3. GENERAR CORRELATIVO ==========
-        try:
-            user_info = await conn.fetchrow("""
-                SELECT g.siglas FROM profiles p 
-                LEFT JOIN gerencias g ON p.gerencia_id = g.id 
-                WHERE p.id = $1
-            """, user_id)
-            siglas = user_info['siglas'] if user_info and user_info['siglas'] else 'COR'
-        except:
-            siglas = 'COR'
-        
-        year = datetime.now().year
-        count = await conn.fetchval("""
-            SELECT COUNT(*) FROM documentos 
-            WHERE correlativo LIKE $1 || '-%-' || $2 AND tenant_id = $3
-        """, siglas, str(year), tenant_id)
-        
-        auto_correlativo = f"{siglas}-{str((count or 0) + 1).zfill(3)}-{year}"
-        
-        # ========== 4. PROCESAR MÚLTIPLES ARCHIVOS ==========
-        file_urls = []
-        if archivos:
-            folder = Path("uploads")
-            folder.mkdir(exist_ok=True)
-            for archivo in archivos:
-                if archivo and archivo.filename:
-                    ext = Path(archivo.filename).suffix
-                    file_id = f"{uuid.uuid4()}{ext}"
-                    filepath = folder / file_id
-                    with filepath.open("wb") as buffer:
-                        shutil.copyfileobj(archivo.file, buffer)
-                    file_urls.append(f"/uploads/{file_id}")
-
-        # Guardamos la primera URL en la tabla principal para compatibilidad legacy
-        primary_file_url = file_urls[0] if file_urls else None
-
-        # ========== 5. INSERTAR EN BD ==========
-        fecha_creacion = datetime.now()
-        fecha_caducidad = fecha_creacion + timedelta(days=6)
-
-        doc_id = await conn.fetchval("""
-            INSERT INTO documentos (
-                titulo, title, correlativo, tipo_documento, estado, prioridad,
-                remitente_id, receptor_id, receptor_gerencia_id, url_archivo,
-                contenido, leido, fecha_creacion, fecha_caducidad, 
-                fecha_ultima_actividad, tenant_id, user_id
-            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17)
-            RETURNING id
-        """, 
-            titulo, titulo, auto_correlativo, tipo_documento, 'en-proceso', prioridad,
-            user_id, receptor_id, receptor_gerencia_id, primary_file_url,
-            contenido, False, fecha_creacion, fecha_caducidad, fecha_creacion, tenant_id, user_id
-        )
+            perfil_tenant = user_info['tenant_id'] if user_info else None
+            tenant_id = uuid.UUID(str(perfil_tenant)) if perfil_tenant else uuid.UUID("00000000-0000-0000-0000-000000000001")
 
-        # ========== 6. INSERTAR ADJUNTOS EN TABLA RELACIONADA ==========
-        for url in file_urls:
-            await conn.execute("""
-                INSERT INTO documento_adjuntos (documento_id, url_archivo)
-                VALUES ($1, $2)
-            """, doc_id, url)
-        
+        # Gerencias con bloques (CORRELATIVO_BLOQUES): el número se toma antes de abrir
+        # la sesión del documento, porque reservar un bloque nuevo usa su propia conexión
+        year = datetime.now().year
+        reservado = await correlativos.reservar(tenant_id, siglas, year)
+
+        async with db_session() as conn, conn.transaction():
+            # ========== 3b. REENVÍOS: ADJUNTOS YA ALMACENADOS (SOLO METADATOS) ==========
+            reutilizados = []
+            if adjuntos_sha256:
+                rows = await conn.fetch("""
+                    SELECT DISTINCT ON (da.sha256) da.sha256, da.url_archivo, da.nombre_archivo,
+                           da.mime_type, da.tamano_bytes
+                    FROM documento_adjuntos da
+                    JOIN documentos d ON d.id = da.documento_id
+                    WHERE da.sha256 = ANY($1) AND d.tenant_id = $2
+                """, list(set(adjuntos_sha256)), tenant_id)
+                encontrados = {r['sha256']: r for r in rows}
+                faltantes = [sha for sha in adjuntos_sha256 if sha not in encontrados]
+                if faltantes:
+                    raise HTTPException(status_code=400, detail=f"Adjuntos no encontrados: {', '.join(faltantes)}")
+                reutilizados = [
+                    (r['url_archivo'], r['nombre_archivo'], r['mime_type'], r['tamano_bytes'], r['sha256'])
+                    for r in (encontrados[sha] for sha in dict.fromkeys(adjuntos_sha256))
+                ]
+
+            filas_adjuntos = nuevos + reutilizados
+            # Guardamos la primera URL en la tabla principal para compatibilidad legacy
+            primary_file_url = filas_adjuntos[0][0] if filas_adjuntos else None
+
+            # ========== 4. GENERAR CORRELATIVO ==========
+            auto_correlativo = await correlativos.generar(conn, tenant_id, siglas, year, reservado)
+
+            # ========== 5. INSERTAR EN BD ==========
+            fecha_creacion = datetime.now()
+            fecha_caducidad = fecha_creacion + timedelta(days=6)
+
+            doc_id = await conn.fetchval("""
+                INSERT INTO documentos (
+                    titulo, title, correlativo, tipo_documento, estado, prioridad,
+                    remitente_id, receptor_id, receptor_gerencia_id, url_archivo,
+                    contenido, leido, fecha_creacion, fecha_caducidad, 
+                    fecha_ultima_actividad, tenant_id, user_id
+                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16, $17)
+                RETURNING id
+            """, 
+                titulo, titulo, auto_correlativo, tipo_documento, 'en-proceso', prioridad,
+                user_id, receptor_id, receptor_gerencia_id, primary_file_url,
+                contenido, False, fecha_creacion, fecha_caducidad, fecha_creacion, tenant_id, user_id
+            )
+
+            # ========== 6. INSERTAR ADJUNTOS EN UN SOLO LOTE ==========
+            # Cada fila es una referencia al blob: si la transacción falla, el blob
+            # queda sin referencias y lo elimina el recolector del worker.
+            if filas_adjuntos:
+                await conn.executemany("""
+                    INSERT INTO documento_adjuntos (documento_id, url_archivo, nombre_archivo, mime_type, tamano_bytes, sha256)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                """, [(doc_id, *fila) for fila in filas_adjuntos])
+    
         return {"id": doc_id, "correlativo": auto_correlativo, "status": "success"}
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error enviando mensaje: {e}")
-        traceback.print_exc()
+        logger.exception(f"Error enviando mensaje: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/documentos/adjuntos/{adjunto_id}", dependencies=[Depends(get_tenant_context)])
+async def descargar_adjunto(adjunto_id: str, request: Request):
+    # Sesión corta solo para autorizar: la transferencia del archivo no retiene
+    # conexión, cupo de admisión ni transacción
+    async with db_session() as conn:
+        adjunto = await obtener_adjunto_autorizado(
+            conn, adjunto_id, request.state.tenant_id, request.state.user_id
+        )
+    return responder_adjunto(request, adjunto)
+
+@app.get("/documentos/{id}/archivo", dependencies=[Depends(get_tenant_context)])
+async def descargar_archivo_documento(id: str, request: Request):
+    """Archivo legacy (documentos.url_archivo) de documentos sin filas en documento_adjuntos."""
+    async with db_session() as conn:
+        archivo = await obtener_archivo_documento(
+            conn, id, request.state.tenant_id, request.state.user_id
+        )
+    return responder_adjunto(request, archivo)
+
 @app.patch("/documentos/{id}/leido")
-async def mark_as_read(id: int, conn = Depends(get_db_connection)):
+async def mark_as_read(id: int, conn = Depends(get_db_connection, scope="function")):
     try:
         await conn.execute("UPDATE documentos SET leido = TRUE WHERE id = $1", id)
         return {"status": "success"}
@@ -546,7 +635,7 @@ async def mark_as_read(id: int, conn = Depends(get_db_connection)):
 async def update_doc_status(
     id: int,
     status_data: dict,
-    conn = Depends(get_db_connection)
+    conn = Depends(get_db_connection, scope="function")
 ):
     try:
         nuevo_estado = status_data.get("estado")
@@ -560,12 +649,12 @@ async def update_doc_status(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/gerencias")
-async def list_gerencias(conn = Depends(get_db_connection)):
+async def list_gerencias(conn = Depends(get_read_connection, scope="function")):
     rows = await conn.fetch("SELECT id, nombre, siglas FROM gerencias ORDER BY nombre")
     return [dict(r) for r in rows]
 
 @app.get("/usuarios")
-async def list_usuarios(conn = Depends(get_db_connection)):
+async def list_usuarios(conn = Depends(get_read_connection, scope="function")):
     rows = await conn.fetch("""
         SELECT p.id, p.username as usuario_corp, p.nombre, p.apellido, p.email,
                p.gerencia_id, COALESCE(g.nombre, 'Sin Asignar') as gerencia_depto,
@@ -1,15 +1,18 @@
 from contextvars import ContextVar
 from fastapi import Request
-from jose import jwt
-import os
 import logging
 
-logger = logging.getLogger("sistema_corporativo")
+from auth.security import get_request_claims
+
+# Líneas por request: muestreadas por defecto (LOG_SAMPLE_RATES en services/logs.py)
+logger = logging.getLogger("sistema_corporativo.contexto")
 
 # Contextvars
 tenant_id_var: ContextVar[str] = ContextVar("tenant_id", default=None)
 user_id_var: ContextVar[str] = ContextVar("user_id", default=None)
 trace_id_var: ContextVar[str] = ContextVar("trace_id", default=None)
+# Scope ASGI del request: la plantilla de ruta se conoce recién después del routing
+request_scope_var: ContextVar[dict] = ContextVar("request_scope", default=None)
 
 def get_current_tenant_id():
     return tenant_id_var.get()
@@ -20,6 +23,12 @@ def get_current_user_id():
 def get_current_trace_id():
     return trace_id_var.get()
 
+def get_current_route():
+    """Plantilla de la ruta en curso (p. ej. /documentos/{id}); 'sin_ruta' fuera de un request."""
+    scope = request_scope_var.get()
+    route = scope.get("route") if scope else None
+    return getattr(route, "path", None) or "sin_ruta"
+
 async def extract_user_from_token(request: Request):
     """
     Función de extracción robusta para asegurar que el tenant_id 
@@ -32,15 +41,10 @@ async def extract_user_from_token(request: Request):
             return "00000000-0000-0000-0000-000000000000", "00000000-0000-0000-0000-000000000001"
         return None, None
     
-    token = auth_header.split(" ")[1]
-    # Sincronizado con auth/security.py
-    secret_key = os.getenv("JWT_SECRET", "tu_clave_secreta_muy_segura_cambiala_en_produccion")
-    
-    try:
-        payload = jwt.decode(token, secret_key, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        logger.info(f"🔑 user_id extraído: {user_id}")
-        return user_id, payload.get("tenant_id")
-    except Exception as e:
-        logger.error(f"Error decodificando JWT: {e}")
+    # Claims verificados una vez por request (caché compartido en auth/security.py)
+    payload = get_request_claims(request)
+    if payload is None:
         return None, None
+    user_id = payload.get("sub")
+    logger.info(f"🔑 user_id extraído: {user_id}")
+    return user_id, payload.get("tenant_id")
@@ -3,7 +3,8 @@ from middleware.context import tenant_id_var, user_id_var, trace_id_var, extract
 import uuid
 import logging
 
-logger = logging.getLogger("sistema_corporativo")
+# Líneas por request: muestreadas por defecto (LOG_SAMPLE_RATES en services/logs.py)
+logger = logging.getLogger("sistema_corporativo.contexto")
 
 async def get_tenant_context(request: Request):
     """
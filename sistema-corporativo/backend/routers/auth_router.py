@@ -1,18 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 import uuid
-from database.async_db import get_db_connection
-from auth.security import verify_password, get_password_hash, create_access_token
+import logging
+from database.async_db import db_session, get_db_connection
+from auth.security import verify_password_async, get_password_hash_async, create_access_token
 from auth.supabase_auth import get_current_user
+from services.activity import ultima_conexion
+from services.rate_limiter import ip_cliente
+from auth.admission import auth_admission
 from datetime import datetime
 
+logger = logging.getLogger("sistema_corporativo")
+
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.get("/me")
 async def get_user_profile(
     current_user: dict = Depends(get_current_user),
-    conn = Depends(get_db_connection)
+    conn = Depends(get_db_connection, scope="function")
 ):
     user_id = current_user.get("sub")
     if not user_id:
@@ -34,7 +40,7 @@ async def get_user_profile(
         return dict(profile)
             
     except Exception as e:
-        print(f"Error fetching profile: {e}")
+        logger.exception(f"Error fetching profile: {e}")
         raise HTTPException(status_code=500, detail="Error al obtener perfil")
 
 class UserRegister(BaseModel):
@@ -51,90 +57,108 @@ class UserLogin(BaseModel):
     password: str
 
 @router.post("/register")
-async def register(user_data: UserRegister, conn = Depends(get_db_connection)):
-    try:
-        existing = await conn.fetchrow(
-            "SELECT id FROM profiles WHERE username = $1 OR email = $2", 
-            user_data.username, user_data.email
-        )
-        if existing:
-            raise HTTPException(status_code=400, detail="Usuario o Email ya registrado")
+async def register(user_data: UserRegister, request: Request):
+    # Admisión antes de tomar una conexión o calcular el hash (auth/admission.py):
+    # bajo un flood los rechazos no ocupan el pool
+    async with auth_admission.admitir(user_data.username, ip_cliente(request), user_data.password):
+        try:
+            hashed_pw = await get_password_hash_async(user_data.password)
 
-        hashed_pw = get_password_hash(user_data.password)
-        
-        # Mapear gerencia si es posible
-        g_id = await conn.fetchval("SELECT id FROM gerencias WHERE nombre = $1", user_data.gerencia_nombre)
-        if not g_id:
-            g_id = await conn.fetchval(
-                "INSERT INTO gerencias (nombre) VALUES ($1) RETURNING id", 
-                user_data.gerencia_nombre
-            )
+            async with db_session() as conn:
+                existing = await conn.fetchrow(
+                    "SELECT id FROM profiles WHERE username = $1 OR email = $2", 
+                    user_data.username, user_data.email
+                )
+                if existing:
+                    raise HTTPException(status_code=400, detail="Usuario o Email ya registrado")
 
-        query = """
-            INSERT INTO profiles (username, nombre, apellido, email, password_hash, rol_id, gerencia_id, estado)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            RETURNING id, username, email
-        """
-        row = await conn.fetchrow(
-            query, 
-            user_data.username, user_data.nombre, user_data.apellido, 
-            user_data.email, hashed_pw, 3, g_id, True
-        )
+                # Mapear gerencia si es posible
+                g_id = await conn.fetchval("SELECT id FROM gerencias WHERE nombre = $1", user_data.gerencia_nombre)
+                if not g_id:
+                    g_id = await conn.fetchval(
+                        "INSERT INTO gerencias (nombre) VALUES ($1) RETURNING id", 
+                        user_data.gerencia_nombre
+                    )
+
+                query = """
+                    INSERT INTO profiles (username, nombre, apellido, email, password_hash, rol_id, gerencia_id, estado)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                    RETURNING id, username, email
+                """
+                row = await conn.fetchrow(
+                    query, 
+                    user_data.username, user_data.nombre, user_data.apellido, 
+                    user_data.email, hashed_pw, 3, g_id, True
+                )
         
-        return {
-            "message": "User registered successfully",
-            "user_id": str(row['id']),
-            "email": row['email']
-        }
-    except Exception as e:
-        print(f"Error registering user: {e}")
-        raise HTTPException(status_code=400, detail=str(e))
+            return {
+                "message": "User registered successfully",
+                "user_id": str(row['id']),
+                "email": row['email']
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception(f"Error registering user: {e}")
+            raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/login")
-async def login(login_data: UserLogin, conn = Depends(get_db_connection)):
-    query = """
-        SELECT p.id, p.username, p.nombre, p.apellido, p.password_hash, p.email, 
-               p.rol_id, r.nombre_rol, p.tenant_id, p.gerencia_id, g.nombre as gerencia_nombre
-        FROM profiles p
-        LEFT JOIN roles r ON p.rol_id = r.id
-        LEFT JOIN gerencias g ON p.gerencia_id = g.id
-        WHERE (p.email = $1 OR p.username = $1) AND p.estado = TRUE
-    """
-    identifier = login_data.email or login_data.username
-    if not identifier:
-        raise HTTPException(status_code=400, detail="Email or Username required")
+async def login(login_data: UserLogin, request: Request):
+    # Admisión antes de tomar una conexión o calcular el hash (auth/admission.py):
+    # bajo un flood los rechazos no ocupan el pool
+    async with auth_admission.admitir(login_data.email or login_data.username, ip_cliente(request), login_data.password):
+        query = """
+            SELECT p.id, p.username, p.nombre, p.apellido, p.password_hash, p.email, 
+                   p.rol_id, r.nombre_rol, p.tenant_id, p.gerencia_id, g.nombre as gerencia_nombre
+            FROM profiles p
+            LEFT JOIN roles r ON p.rol_id = r.id
+            LEFT JOIN gerencias g ON p.gerencia_id = g.id
+            WHERE (p.email = $1 OR p.username = $1) AND p.estado = TRUE
+        """
+        identifier = login_data.email or login_data.username
+        if not identifier:
+            raise HTTPException(status_code=400, detail="Email or Username required")
         
-    user = await conn.fetchrow(query, identifier)
+        # La conexión se devuelve antes del hash: PBKDF2 no retiene el pool
+        async with db_session() as conn:
+            user = await conn.fetchrow(query, identifier)
+        if not user:
+            raise HTTPException(status_code=401, detail="Credenciales incorrectas")
 
-    if not user or not verify_password(login_data.password, user['password_hash']):
-        raise HTTPException(status_code=401, detail="Credenciales incorrectas")
+        valida, nuevo_hash = await verify_password_async(login_data.password, user['password_hash'])
+        if not valida:
+            raise HTTPException(status_code=401, detail="Credenciales incorrectas")
+        if nuevo_hash:
+            # Parámetros de hash actualizados (PBKDF2_ROUNDS): se re-hashea en el login
+            async with db_session() as conn:
+                await conn.execute("UPDATE profiles SET password_hash = $1 WHERE id = $2", nuevo_hash, user['id'])
 
-    access_token = create_access_token(
-        data={
-            "sub": str(user['id']), 
-            "role": user['nombre_rol'],
-            "tenant_id": str(user['tenant_id']) if user['tenant_id'] else None,
-            "gerencia_id": user['gerencia_id']
-        }
-    )
+        access_token = create_access_token(
+            data={
+                "sub": str(user['id']), 
+                "role": user['nombre_rol'],
+                "tenant_id": str(user['tenant_id']) if user['tenant_id'] else None,
+                "gerencia_id": user['gerencia_id']
+            }
+        )
     
-    # Actualizar última conexión
-    await conn.execute("UPDATE profiles SET ultima_conexion = NOW() WHERE id = $1", user['id'])
+        # Actualizar última conexión (write-behind, ver services/activity.py)
+        ultima_conexion.registrar(user['id'])
     
-    return {
-        "access_token": access_token, 
-        "token_type": "bearer",
-        "user": {
-            "id": str(user['id']),
-            "username": user['username'],
-            "nombre": user['nombre'],
-            "apellido": user['apellido'],
-            "email": user['email'],
-            "role": user['nombre_rol'],
-            "gerencia_id": user['gerencia_id'],
-            "gerencia_depto": user['gerencia_nombre']
+        return {
+            "access_token": access_token, 
+            "token_type": "bearer",
+            "user": {
+                "id": str(user['id']),
+                "username": user['username'],
+                "nombre": user['nombre'],
+                "apellido": user['apellido'],
+                "email": user['email'],
+                "role": user['nombre_rol'],
+                "gerencia_id": user['gerencia_id'],
+                "gerencia_depto": user['gerencia_nombre']
+            }
         }
-    }
 
 @router.post("/logout")
 async def logout():
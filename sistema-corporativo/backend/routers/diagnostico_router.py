@@ -0,0 +1,35 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+from auth.supabase_auth import get_current_user
+from database import instrumentacion
+from src import schemas
+
+logger = logging.getLogger("sistema_corporativo")
+
+router = APIRouter(prefix="/admin/diagnostico", tags=["diagnostico"])
+
+# La configuración es por proceso: con varios workers hay que repetir el PUT en cada uno
+ROLES_DIAGNOSTICO = {"Desarrollador"}
+
+
+def require_diagnostico(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") not in ROLES_DIAGNOSTICO:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    return current_user
+
+
+@router.get("/consultas")
+async def get_instrumentacion(current_user: dict = Depends(require_diagnostico)):
+    return instrumentacion.config.como_dict()
+
+
+@router.put("/consultas")
+async def update_instrumentacion(
+    data: schemas.DiagnosticoConsultasUpdate,
+    current_user: dict = Depends(require_diagnostico),
+):
+    cambios = data.model_dump(exclude_none=True)
+    for campo, valor in cambios.items():
+        setattr(instrumentacion.config, campo, valor)
+    logger.info(f"Instrumentación de consultas actualizada por {current_user.get('sub')}: {cambios}")
+    return instrumentacion.config.como_dict()
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
-from database.async_db import get_db_connection
+from database.async_db import get_read_connection
 from typing import List
 
 router = APIRouter(prefix="/gerencias", tags=["gerencias"])
 
 @router.get("")
-async def list_gerencias(conn = Depends(get_db_connection)):
+async def list_gerencias(conn = Depends(get_read_connection, scope="function")):
     try:
         rows = await conn.fetch("SELECT id, nombre, siglas, categoria FROM gerencias ORDER BY nombre")
         return rows
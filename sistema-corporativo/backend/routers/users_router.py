@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
-from database.async_db import get_db_connection
+from database.async_db import get_db_connection, get_read_connection
 from src import schemas
 from typing import List
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/all")
-async def list_all_users(conn = Depends(get_db_connection)):
+async def list_all_users(conn = Depends(get_read_connection, scope="function")):
     try:
         query = """
             SELECT p.id, p.username, p.nombre, p.apellido, p.email, p.rol_id, r.nombre_rol as role, p.estado
@@ -20,7 +20,7 @@ async def list_all_users(conn = Depends(get_db_connection)):
         raise HTTPException(status_code=500, detail=f"Error al obtener usuarios: {str(e)}")
 
 @router.put("/{user_id}/role")
-async def update_user_role(user_id: str, data: dict, conn = Depends(get_db_connection)):
+async def update_user_role(user_id: str, data: dict, conn = Depends(get_db_connection, scope="function")):
     try:
         rol_id = data.get("rol_id")
         if not rol_id:
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import sys
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Permite ejecutar el script desde la carpeta backend: python scripts/backfill_correlativos.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.correlativos import BACKFILL_QUERY
+
+
+async def backfill_correlativos():
+    """Siembra documento_correlativos con el mayor correlativo existente por (tenant, siglas, año)."""
+    load_dotenv()
+    db_url = os.getenv("SUPABASE_DB_URL")
+    if not db_url:
+        print("Error: SUPABASE_DB_URL not found in .env")
+        return
+
+    conn = await asyncpg.connect(db_url, statement_cache_size=0)
+    try:
+        async with conn.transaction():
+            status = await conn.execute(BACKFILL_QUERY)
+        print(f"Contadores sembrados/actualizados: {status.split()[-1]}")
+
+        rows = await conn.fetch(
+            "SELECT tenant_id, siglas, anio, ultimo FROM documento_correlativos ORDER BY tenant_id, siglas, anio"
+        )
+        for r in rows:
+            print(f"{r['tenant_id']} | {r['siglas']}-{r['anio']}: {r['ultimo']}")
+        print("\n✅ Backfill completado.")
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_correlativos())
@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+# Permite ejecutar el script desde la carpeta backend: python scripts/bench_auth.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes de importar la app: su configuración se lee al importar los módulos
+load_dotenv()
+
+from jose import jwt
+from starlette.requests import Request
+
+from auth import security
+
+# Antes: get_tenant_context, create_documento y get_current_user decodificaban
+# y verificaban el mismo token por separado, leyendo JWT_SECRET cada vez
+DECODIFICACIONES_POR_REQUEST = 3
+
+
+def _request(token: str) -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    })
+
+
+def antes(token: str):
+    for _ in range(DECODIFICACIONES_POR_REQUEST):
+        secret = os.getenv("JWT_SECRET", "tu_clave_secreta_muy_segura_cambiala_en_produccion")
+        jwt.decode(token, secret, algorithms=["HS256"])
+
+
+def despues(token: str):
+    request = _request(token)
+    for _ in range(DECODIFICACIONES_POR_REQUEST):
+        security.get_request_claims(request)
+
+
+def medir(nombre, fn, tokens, requests):
+    inicio = time.perf_counter()
+    for i in range(requests):
+        fn(tokens[i % len(tokens)])
+    duracion = time.perf_counter() - inicio
+    print(f"{nombre:>8} | {duracion / requests * 1e6:8.1f} µs por request | {requests / duracion:10.0f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo de autenticación JWT por request, antes y después del caché")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--usuarios", type=int, default=500, help="Tokens distintos en circulación")
+    args = parser.parse_args()
+
+    tokens = [security.create_access_token({"sub": f"user-{i}", "tenant_id": "t"}) for i in range(args.usuarios)]
+    medir("antes", antes, tokens, args.requests)
+    security.claims_cache.clear()
+    medir("después", despues, tokens, args.requests)
+    print(f"Entradas en caché: {len(security.claims_cache)}")
+
+
+if __name__ == "__main__":
+    main()
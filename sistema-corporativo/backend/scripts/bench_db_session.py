@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Permite ejecutar el script desde la carpeta backend: python scripts/bench_db_session.py --tenant <uuid>
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes de importar la app: su configuración (DB_SSL, ...) se lee al importar los módulos
+load_dotenv()
+
+from database.conexion import Conexion
+from services import documentos as documentos_service
+
+# Mide la sesión de BD de GET /documentos (primera página, proyección por defecto)
+# con el patrón anterior de db_session y con el actual. La diferencia de p50 es
+# aproximadamente un round trip a la BD: conviene correrlo contra la BD real
+# (Supabase), no contra un Postgres local con RTT ~0.
+
+
+async def antes(pool, tenant_id, query, args):
+    # set_config fuera de transacción + query + RESET + reset completo del pool al liberar
+    async with pool.acquire() as conn:
+        await conn.execute("SELECT set_config('app.current_tenant_id', $1, true)", tenant_id)
+        try:
+            return await conn.fetch(query, *args)
+        finally:
+            await conn.execute("RESET app.current_tenant_id")
+
+
+async def despues(pool, tenant_id, query, args):
+    # BEGIN + SET LOCAL en un mensaje, query, COMMIT; sin reset al liberar
+    async with pool.acquire() as conn:
+        async with conn.transaccion_tenant(tenant_id):
+            rows = await conn.fetch(query, *args)
+        conn.omitir_reset()
+        return rows
+
+
+async def medir(nombre, fn, pool, tenant_id, query, args, iteraciones):
+    for _ in range(10):  # calentamiento (conexiones y caché de sentencias)
+        await fn(pool, tenant_id, query, args)
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        await fn(pool, tenant_id, query, args)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    p50 = statistics.median(tiempos)
+    p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+    print(f"{nombre:>8} | p50={p50:7.2f} ms | p95={p95:7.2f} ms | n={iteraciones}")
+    return p50
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Round trips de contexto de tenant por sesión de BD")
+    parser.add_argument("--tenant", required=True, help="tenant_id con documentos")
+    parser.add_argument("--iteraciones", type=int, default=300)
+    args = parser.parse_args()
+
+    db_url = os.getenv("SUPABASE_DB_URL")
+    if not db_url:
+        print("Error: SUPABASE_DB_URL not found in .env")
+        return
+
+    columnas = documentos_service.parse_fields(None)
+    query, query_args = documentos_service.build_list_query(
+        columnas, tenant_id=args.tenant, limit=documentos_service.DEFAULT_PAGE_SIZE
+    )
+
+    # Una conexión por pool: se mide latencia secuencial, no throughput
+    opciones = dict(min_size=1, max_size=1, statement_cache_size=0, ssl="require")
+    pool_antes = await asyncpg.create_pool(db_url, **opciones)
+    pool_despues = await asyncpg.create_pool(db_url, connection_class=Conexion, **opciones)
+    try:
+        p50_antes = await medir("antes", antes, pool_antes, args.tenant, query, query_args, args.iteraciones)
+        p50_despues = await medir("después", despues, pool_despues, args.tenant, query, query_args, args.iteraciones)
+    finally:
+        await pool_antes.close()
+        await pool_despues.close()
+    print(f"p50 ahorrado por request: {p50_antes - p50_despues:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+# Permite ejecutar el script desde la carpeta backend: python scripts/bench_password_hashing.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes de importar la app: su configuración se lee al importar los módulos
+load_dotenv()
+
+from auth import security
+
+
+async def latido(intervalo: float, stop: asyncio.Event) -> float:
+    """Mide el mayor retraso del event loop mientras corren los logins."""
+    peor = 0.0
+    while not stop.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        peor = max(peor, time.perf_counter() - inicio - intervalo)
+    return peor
+
+
+async def bench(modo: str, logins: int, concurrencia: int):
+    hashed = security.get_password_hash("Admin123!")
+    sem = asyncio.Semaphore(concurrencia)
+
+    async def login():
+        async with sem:
+            if modo == "inline":
+                security.verify_password("Admin123!", hashed)
+            else:
+                await security.verify_password_async("Admin123!", hashed)
+
+    if modo == "pool":
+        await security.start_hash_pool()
+
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(latido(0.005, stop))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    duracion = time.perf_counter() - inicio
+    stop.set()
+    bloqueo = await monitor
+
+    workers = 1 if modo == "inline" else security.PASSWORD_HASH_WORKERS
+    print(
+        f"{modo:>6} | {logins / duracion:8.1f} logins/s | {logins / duracion / workers:7.1f} logins/s por core "
+        f"| retraso máx. del loop: {bloqueo * 1000:7.1f} ms"
+    )
+    security.shutdown_hash_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de login (PBKDF2) inline vs pool de procesos")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"PBKDF2_ROUNDS={security.PBKDF2_ROUNDS} PASSWORD_HASH_WORKERS={security.PASSWORD_HASH_WORKERS}")
+    # La cola no debe rechazar durante el benchmark
+    security.PASSWORD_HASH_MAX_QUEUE = max(security.PASSWORD_HASH_MAX_QUEUE, args.concurrencia)
+    for modo in ("inline", "pool"):
+        asyncio.run(bench(modo, args.logins, args.concurrencia))
+
+
+if __name__ == "__main__":
+    main()
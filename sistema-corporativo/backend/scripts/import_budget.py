@@ -0,0 +1,79 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Perfil de arranque: importa un módulo en un intérprete limpio con
+# `python -X importtime` y falla (exit 1) si supera el presupuesto.
+#
+#   python scripts/import_budget.py                      # main, presupuesto por defecto
+#   python scripts/import_budget.py --modulo services.worker --presupuesto-ms 500
+#
+# Cada respawn de worker y cada arranque por autoescalado paga este tiempo antes
+# de atender. Lo pesado que no hace falta para importar la app (redis, jose,
+# ProcessPoolExecutor) se carga al primer uso o en el startup.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", 1000))
+
+_LINEA = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def perfilar(modulo: str):
+    """[(módulo, propio_us, acumulado_us, profundidad)] en el orden de -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-2000:])
+        raise SystemExit(f"No se pudo importar {modulo}")
+    filas = []
+    for linea in proc.stderr.splitlines():
+        m = _LINEA.match(linea)
+        if m:
+            propio, acumulado, sangria, nombre = m.groups()
+            filas.append((nombre, int(propio), int(acumulado), len(sangria) // 2))
+    return filas
+
+
+def subarbol(filas, modulo: str):
+    """Filas del import de `modulo` (-X importtime lista los hijos antes que el padre)."""
+    fin = next(i for i, f in enumerate(filas) if f[0] == modulo and f[3] == 0)
+    inicio = fin
+    while inicio > 0 and filas[inicio - 1][3] > 0:
+        inicio -= 1
+    return filas[inicio:fin], filas[fin][2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de import al arrancar")
+    parser.add_argument("--modulo", default="main")
+    parser.add_argument("--presupuesto-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    # Lo que importa site (.pth del entorno) antes del módulo no cuenta
+    filas, total = subarbol(perfilar(args.modulo), args.modulo)
+
+    print(f"Más costosos por tiempo acumulado (importados desde {args.modulo}):")
+    directos = [f for f in filas if f[3] == 1]
+    for nombre, _, acumulado, _ in sorted(directos, key=lambda f: -f[2])[: args.top]:
+        print(f"  {acumulado / 1000:8.1f} ms  {nombre}")
+
+    print("Más costosos por tiempo propio:")
+    for nombre, propio, _, _ in sorted(filas, key=lambda f: -f[1])[: args.top]:
+        print(f"  {propio / 1000:8.1f} ms  {nombre}")
+
+    print(f"\nTotal {args.modulo}: {total / 1000:.1f} ms (presupuesto {args.presupuesto_ms:.0f} ms)")
+    if total / 1000 > args.presupuesto_ms:
+        print("❌ Excede el presupuesto de import")
+        sys.exit(1)
+    print("✅ Dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
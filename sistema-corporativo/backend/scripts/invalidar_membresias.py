@@ -0,0 +1,31 @@
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# Permite ejecutar el script desde la carpeta backend: python scripts/invalidar_membresias.py <user_id> [...]
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from services.membresias import membresias
+from services.redis_client import close_redis
+
+
+async def invalidar(user_ids):
+    """Descarta las membresías cacheadas tras editar user_organizations a mano."""
+    try:
+        for user_id in user_ids:
+            await membresias.invalidar(user_id)
+            print(f"Invalidado: {user_id}")
+        if membresias.degradado:
+            print("Aviso: Redis no disponible; las entradas expiran solas por TTL.")
+    finally:
+        await close_redis()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python scripts/invalidar_membresias.py <user_id> [<user_id> ...]")
+        sys.exit(1)
+    asyncio.run(invalidar(sys.argv[1:]))
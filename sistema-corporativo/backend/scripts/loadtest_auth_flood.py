@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+import httpx
+from dotenv import load_dotenv
+
+# Escenario: un credential stuffing contra /login mientras un usuario legítimo
+# usa el buzón. Se mide la latencia de /documentos antes y durante la inundación.
+#
+#   python scripts/loadtest_auth_flood.py --url http://localhost:8000 --token <JWT válido>
+#
+# Con admisión (auth/admission.py) el p95 de /documentos debe quedar cerca de la
+# línea base y la inundación debe recibir 429/503 en lugar de saturar los cores.
+
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def medir_buzon(client, token, duracion, intervalo):
+    latencias, errores = [], 0
+    fin = time.perf_counter() + duracion
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            r = await client.get(
+                "/documentos",
+                params={"limit": 50, "fields": "id,name,signaturestatus"},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            if r.status_code != 200:
+                errores += 1
+        except httpx.HTTPError:
+            errores += 1
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        await asyncio.sleep(intervalo)
+    return latencias, errores
+
+
+async def inundar(client, concurrencia, stop, usuarios):
+    estados = Counter()
+
+    async def atacante(i):
+        n = 0
+        while not stop.is_set():
+            usuario = f"{usuarios}{(i * 7919 + n) % 1000}"
+            n += 1
+            try:
+                r = await client.post(
+                    "/login",
+                    data={"username": usuario, "password": "incorrecta-123"},
+                    # IP simulada distinta por atacante (requiere RATE_LIMIT_TRUST_PROXY=true)
+                    headers={"X-Forwarded-For": f"10.0.{i // 250}.{i % 250}"},
+                )
+                estados[r.status_code] += 1
+            except httpx.HTTPError:
+                estados["error"] += 1
+
+    await asyncio.gather(*(atacante(i) for i in range(concurrencia)))
+    return estados
+
+
+def resumen(nombre, latencias, errores):
+    print(
+        f"{nombre:>18} | n={len(latencias):5d} | p50={percentil(latencias, 0.5):7.1f} ms "
+        f"| p95={percentil(latencias, 0.95):7.1f} ms | p99={percentil(latencias, 0.99):7.1f} ms "
+        f"| media={statistics.fmean(latencias) if latencias else float('nan'):7.1f} ms | errores={errores}"
+    )
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Latencia de /documentos durante una inundación de logins")
+    parser.add_argument("--url", default=os.getenv("LOADTEST_URL", "http://localhost:8000"))
+    parser.add_argument("--token", default=os.getenv("LOADTEST_TOKEN"), help="JWT de un usuario legítimo")
+    parser.add_argument("--duracion", type=float, default=20, help="Segundos por fase")
+    parser.add_argument("--concurrencia", type=int, default=200, help="Atacantes simultáneos")
+    parser.add_argument("--usuarios", default="victima", help="Prefijo de los usernames atacados")
+    args = parser.parse_args()
+
+    if not args.token:
+        print("Error: se requiere --token (o LOADTEST_TOKEN) de un usuario válido")
+        sys.exit(1)
+
+    limites = httpx.Limits(max_connections=args.concurrencia + 10)
+    async with httpx.AsyncClient(base_url=args.url, timeout=30, limits=limites) as client:
+        print(f"Fase 1: línea base ({args.duracion:.0f}s)")
+        base, base_err = await medir_buzon(client, args.token, args.duracion, 0.05)
+
+        print(f"Fase 2: {args.concurrencia} atacantes contra /login ({args.duracion:.0f}s)")
+        stop = asyncio.Event()
+        ataque = asyncio.create_task(inundar(client, args.concurrencia, stop, args.usuarios))
+        await asyncio.sleep(1)  # dejar que la inundación llegue a régimen
+        durante, durante_err = await medir_buzon(client, args.token, args.duracion, 0.05)
+        stop.set()
+        estados = await ataque
+
+    print()
+    resumen("base", base, base_err)
+    resumen("durante inundación", durante, durante_err)
+    total = sum(estados.values())
+    print(f"\nRespuestas a /login ({total}): " + ", ".join(f"{k}={v}" for k, v in sorted(estados.items(), key=str)))
+    if base and durante:
+        print(f"Degradación p95: x{percentil(durante, 0.95) / percentil(base, 0.95):.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Permite ejecutar el script desde la carpeta backend: python scripts/rebuild_contadores.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.contadores import reconstruir_contadores
+
+
+async def rebuild_contadores():
+    """Recalcula documento_contadores desde documentos (reconciliación de deriva)."""
+    load_dotenv()
+    db_url = os.getenv("SUPABASE_DB_URL")
+    if not db_url:
+        print("Error: SUPABASE_DB_URL not found in .env")
+        return
+
+    conn = await asyncpg.connect(db_url, statement_cache_size=0)
+    try:
+        filas = await reconstruir_contadores(conn)
+        print(f"Contadores reconstruidos: {filas} filas")
+
+        rows = await conn.fetch("""
+            SELECT tenant_id, SUM(total) AS total, SUM(total) FILTER (WHERE NOT leido) AS no_leidos
+            FROM documento_contadores
+            GROUP BY tenant_id
+            ORDER BY tenant_id
+        """)
+        for r in rows:
+            print(f"{r['tenant_id']} | total: {r['total']} | no leídos: {r['no_leidos'] or 0}")
+        print("\n✅ Reconstrucción completada.")
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_contadores())
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import re
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+from database.async_db import db_session
+
+logger = logging.getLogger("sistema_corporativo")
+
+# Máximo de segundos de actividad que se puede perder si el proceso muere sin
+# un shutdown ordenado (en un shutdown normal se vacía el buffer completo)
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", 5))
+# Con tantas entradas pendientes se vacía antes de cumplir el intervalo
+ACTIVITY_MAX_PENDING = int(os.getenv("ACTIVITY_MAX_PENDING", 5000))
+
+ACTIVIDAD_PENDIENTE = Gauge("activity_pending", "Marcas de actividad en memoria sin escribir", ["recorder"])
+ACTIVIDAD_ESCRITA = Counter("activity_flushed_total", "Marcas de actividad escritas a la BD", ["recorder"])
+ACTIVIDAD_ERRORES = Counter("activity_flush_errors_total", "Flushes de actividad fallidos", ["recorder"])
+
+_IDENTIFICADOR = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class ActivityRecorder:
+    """
+    Buffer write-behind de marcas "visto por última vez": guarda en memoria el
+    timestamp más reciente por id y lo escribe en lote con un solo UPDATE.
+
+    Reutilizable para cualquier columna timestamp de una tabla indexada por id,
+    p. ej. ActivityRecorder("ultima_conexion", "profiles", "ultima_conexion").
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        tabla: str,
+        columna: str,
+        columna_id: str = "id",
+        tipo_id: str = "uuid",
+        intervalo: float = ACTIVITY_FLUSH_SECONDS,
+        max_pendientes: int = ACTIVITY_MAX_PENDING,
+    ):
+        for ident in (tabla, columna, columna_id, tipo_id):
+            if not _IDENTIFICADOR.match(ident):
+                raise ValueError(f"Identificador SQL inválido: {ident!r}")
+        self.nombre = nombre
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        # GREATEST: un flush atrasado nunca retrocede un valor más nuevo ya escrito
+        self.query = f"""
+            UPDATE {tabla} t
+            SET {columna} = GREATEST(t.{columna}, v.ts)
+            FROM unnest($1::{tipo_id}[], $2::timestamptz[]) AS v(id, ts)
+            WHERE t.{columna_id} = v.id
+        """
+        self._pendientes: Dict[object, datetime] = {}
+        self._despertar: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def registrar(self, item_id, cuando: Optional[datetime] = None):
+        """Anota actividad sin tocar la BD (O(1), no bloquea el request)."""
+        if item_id is None:
+            return
+        cuando = cuando or datetime.now(timezone.utc)
+        anterior = self._pendientes.get(item_id)
+        if anterior is None or cuando > anterior:
+            self._pendientes[item_id] = cuando
+        ACTIVIDAD_PENDIENTE.labels(recorder=self.nombre).set(len(self._pendientes))
+        if len(self._pendientes) >= self.max_pendientes and self._despertar is not None:
+            self._despertar.set()
+
+    def _reencolar(self, lote: Dict[object, datetime]):
+        for item_id, cuando in lote.items():
+            actual = self._pendientes.get(item_id)
+            if actual is None or cuando > actual:
+                self._pendientes[item_id] = cuando
+
+    async def flush(self) -> int:
+        """Escribe todo lo pendiente en un solo UPDATE. Devuelve filas enviadas."""
+        if not self._pendientes:
+            return 0
+        lote, self._pendientes = self._pendientes, {}
+        ids: List[object] = list(lote)
+        try:
+            async with db_session() as conn:
+                await conn.execute(self.query, ids, [lote[i] for i in ids])
+        except Exception as e:
+            # Se conservan para el próximo intento; no se pierde actividad por un error transitorio
+            self._reencolar(lote)
+            ACTIVIDAD_ERRORES.labels(recorder=self.nombre).inc()
+            logger.error(f"Error escribiendo actividad '{self.nombre}' ({len(ids)} marcas): {e}")
+            raise
+        finally:
+            ACTIVIDAD_PENDIENTE.labels(recorder=self.nombre).set(len(self._pendientes))
+        ACTIVIDAD_ESCRITA.labels(recorder=self.nombre).inc(len(ids))
+        return len(ids)
+
+    async def _bucle(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Ya registrado en flush; se reintenta en el siguiente ciclo
+                pass
+
+    def start(self):
+        if self._tarea is None:
+            # El Event se crea aquí para quedar asociado al loop que corre el ciclo
+            self._despertar = asyncio.Event()
+            self._tarea = asyncio.create_task(self._bucle(), name=f"activity-{self.nombre}")
+
+    async def stop(self):
+        """Detiene el ciclo y vacía el buffer (llamar en el shutdown)."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        await self.flush()
+
+
+# Última conexión de cada usuario (la escriben /login y /auth/login)
+ultima_conexion = ActivityRecorder("ultima_conexion", "profiles", "ultima_conexion")
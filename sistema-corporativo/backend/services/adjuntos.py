@@ -0,0 +1,75 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from database import sentencias
+from services.descargas import url_descarga, url_descarga_documento
+
+# Una sola consulta por página de documentos (en lugar de una subconsulta por fila).
+# Usa idx_documento_adjuntos_documento.
+_ADJUNTOS_QUERY = """
+    SELECT id, documento_id, url_archivo, nombre_archivo, mime_type,
+           tamano_bytes, sha256, fecha_creacion
+    FROM documento_adjuntos
+    WHERE documento_id = ANY($1)
+    ORDER BY documento_id, fecha_creacion, id
+"""
+_ADJUNTOS = sentencias.consulta_caliente("adjuntos_por_documento", _ADJUNTOS_QUERY)
+
+
+def _adjunto_to_dict(r) -> dict:
+    return {
+        "id": r["id"],
+        # Descarga autorizada por tenant/destinatario (GET /documentos/adjuntos/{id})
+        "url": url_descarga(r["id"]),
+        "nombre": r["nombre_archivo"],
+        "mime_type": r["mime_type"],
+        "tamano_bytes": r["tamano_bytes"],
+        "sha256": r["sha256"],
+        "fecha_creacion": r["fecha_creacion"],
+    }
+
+
+async def cargar_adjuntos(conn, documento_ids: Iterable) -> Dict[object, List[dict]]:
+    """Carga los adjuntos de un lote de documentos: documento_id -> [metadatos]."""
+    ids = list(dict.fromkeys(documento_ids))
+    if not ids:
+        return {}
+
+    rows = await sentencias.fetch(conn, _ADJUNTOS, ids)
+    por_documento = defaultdict(list)
+    for r in rows:
+        por_documento[r["documento_id"]].append(_adjunto_to_dict(r))
+    return por_documento
+
+
+def aplicar_adjuntos(documentos: List[dict], adjuntos: Dict[object, List[dict]], campos: Iterable[str]) -> List[dict]:
+    """
+    Completa `adjuntos` (metadatos) y `archivos` (solo URLs, para clientes
+    legacy) en cada documento. Si un documento no tiene filas en
+    documento_adjuntos se usa la columna legacy url_archivo.
+    """
+    campos = set(campos)
+    for d in documentos:
+        lista = adjuntos.get(d["id"])
+        if not lista:
+            url_legacy = d.get("fileurl")
+            lista = [{
+                "id": None,
+                "url": url_descarga_documento(d["id"]),
+                "nombre": None,
+                "mime_type": None,
+                "tamano_bytes": None,
+                "sha256": None,
+                "fecha_creacion": None,
+            }] if url_legacy else []
+        if "adjuntos" in campos:
+            d["adjuntos"] = lista
+        if "archivos" in campos:
+            d["archivos"] = [a["url"] for a in lista]
+    return documentos
+
+
+async def hidratar_documentos(conn, documentos: List[dict], campos: Iterable[str]) -> List[dict]:
+    """Carga e inserta los adjuntos de una página de documentos (1 round trip)."""
+    adjuntos = await cargar_adjuntos(conn, (d["id"] for d in documentos))
+    return aplicar_adjuntos(documentos, adjuntos, campos)
@@ -0,0 +1,90 @@
+import uuid
+from collections import defaultdict
+
+from fastapi import HTTPException
+
+from database import sentencias
+
+# documento_contadores se mantiene con triggers (migración 008): cualquier
+# INSERT/UPDATE/DELETE sobre documentos —creación, marcar leído, cambio de
+# estado o el barrido de expiración del worker— ajusta los contadores en la
+# misma transacción. Aquí solo se leen.
+_RESUMEN_QUERY = """
+    SELECT destino_tipo, estado, leido, total
+    FROM documento_contadores
+    WHERE tenant_id = $1
+      AND total <> 0
+      AND ((destino_tipo = 'usuario' AND destino_id = $2::text)
+           OR (destino_tipo = 'gerencia'
+               AND destino_id = (SELECT gerencia_id::text FROM profiles WHERE id = $2)))
+"""
+_RESUMEN = sentencias.consulta_caliente("resumen_buzon", _RESUMEN_QUERY)
+
+# Recalcula los contadores desde documentos. El lock evita que una escritura
+# concurrente quede contada dos veces o ninguna mientras se reconstruye.
+REBUILD_QUERIES = (
+    "LOCK TABLE documentos IN SHARE ROW EXCLUSIVE MODE",
+    "DELETE FROM documento_contadores",
+    """
+    INSERT INTO documento_contadores (tenant_id, destino_tipo, destino_id, estado, leido, total)
+    SELECT tenant_id,
+           CASE WHEN receptor_id IS NOT NULL THEN 'usuario' ELSE 'gerencia' END,
+           COALESCE(receptor_id::text, receptor_gerencia_id::text),
+           COALESCE(estado, ''),
+           COALESCE(leido, FALSE),
+           COUNT(*)
+    FROM documentos
+    WHERE tenant_id IS NOT NULL
+      AND COALESCE(receptor_id::text, receptor_gerencia_id::text) IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5
+    """,
+)
+
+
+def _vacio() -> dict:
+    return {"total": 0, "no_leidos": 0, "por_estado": {}}
+
+
+def agregar_resumen(rows) -> dict:
+    """
+    Arma la respuesta de /documentos/summary a partir de las filas de
+    contadores: totales del buzón personal, de la gerencia y combinados.
+    """
+    resumen = {"personal": _vacio(), "gerencia": _vacio()}
+    por_estado = defaultdict(int)
+    for r in rows:
+        bucket = resumen["personal" if r["destino_tipo"] == "usuario" else "gerencia"]
+        total = r["total"]
+        bucket["total"] += total
+        bucket["por_estado"][r["estado"]] = bucket["por_estado"].get(r["estado"], 0) + total
+        por_estado[r["estado"]] += total
+        if not r["leido"]:
+            bucket["no_leidos"] += total
+
+    resumen["total"] = resumen["personal"]["total"] + resumen["gerencia"]["total"]
+    resumen["no_leidos"] = resumen["personal"]["no_leidos"] + resumen["gerencia"]["no_leidos"]
+    resumen["por_estado"] = dict(por_estado)
+    return resumen
+
+
+async def resumen_buzon(conn, tenant_id, user_id) -> dict:
+    """Badges del buzón en una lectura indexada por PK, sin escanear documentos."""
+    if not user_id or not tenant_id:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    try:
+        tenant = uuid.UUID(str(tenant_id))
+        usuario = uuid.UUID(str(user_id))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    rows = await sentencias.fetch(conn, _RESUMEN, tenant, usuario)
+    return agregar_resumen(rows)
+
+
+async def reconstruir_contadores(conn) -> int:
+    """Reconstruye documento_contadores completo; devuelve las filas generadas."""
+    async with conn.transaction():
+        for query in REBUILD_QUERIES[:-1]:
+            await conn.execute(query)
+        status = await conn.execute(REBUILD_QUERIES[-1])
+    return int(status.split()[-1])
@@ -0,0 +1,111 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from database.async_db import db_session
+
+# Avanza el contador de (tenant, siglas, año) de forma atómica: O(1) y sin
+# carreras, a diferencia del COUNT(*) sobre documentos. $4 es la cantidad de
+# números reservados (1 normalmente, N para bloques preasignados).
+_AVANZAR_QUERY = """
+    INSERT INTO documento_correlativos (tenant_id, siglas, anio, ultimo)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (tenant_id, siglas, anio)
+    DO UPDATE SET ultimo = documento_correlativos.ultimo + EXCLUDED.ultimo,
+                  actualizado_en = NOW()
+    RETURNING ultimo
+"""
+
+# Semilla desde los correlativos existentes (formato SIGLAS-NNN-AAAA).
+# GREATEST hace que pueda ejecutarse varias veces sin retroceder contadores.
+BACKFILL_QUERY = """
+    INSERT INTO documento_correlativos (tenant_id, siglas, anio, ultimo)
+    SELECT tenant_id, partes[1], partes[3]::int, MAX(partes[2]::int)
+    FROM (
+        SELECT tenant_id, regexp_match(correlativo, '^(.+)-([0-9]+)-([0-9]{4})$') AS partes
+        FROM documentos
+        WHERE correlativo IS NOT NULL AND tenant_id IS NOT NULL
+    ) c
+    WHERE partes IS NOT NULL
+    GROUP BY tenant_id, partes[1], partes[3]::int
+    ON CONFLICT (tenant_id, siglas, anio)
+    DO UPDATE SET ultimo = GREATEST(documento_correlativos.ultimo, EXCLUDED.ultimo),
+                  actualizado_en = NOW()
+"""
+
+
+def formatear_correlativo(siglas: str, numero: int, anio: int) -> str:
+    return f"{siglas}-{str(numero).zfill(3)}-{anio}"
+
+
+def _parse_bloques(raw: str) -> Dict[str, int]:
+    """CORRELATIVO_BLOQUES="TIC=50,GG=20" -> {"TIC": 50, "GG": 20}"""
+    bloques = {}
+    for parte in (raw or "").split(","):
+        if "=" not in parte:
+            continue
+        siglas, tam = parte.split("=", 1)
+        if siglas.strip() and int(tam) > 1:
+            bloques[siglas.strip()] = int(tam)
+    return bloques
+
+
+class CorrelativoAllocator:
+    """
+    Generador de correlativos por (tenant, siglas, año).
+
+    Por defecto cada envío avanza el contador en la misma conexión (y
+    transacción) del documento, por lo que la numeración no tiene huecos.
+    Las gerencias de alto volumen configuradas en CORRELATIVO_BLOQUES reservan
+    bloques de N números por proceso: un solo round trip cada N envíos, a
+    cambio de posibles huecos si el proceso se reinicia con números sin usar.
+    """
+
+    def __init__(self, bloques: Dict[str, int] = None):
+        self._bloques = bloques if bloques is not None else _parse_bloques(os.getenv("CORRELATIVO_BLOQUES", ""))
+        # (tenant, siglas, año) -> (siguiente número libre, último número del bloque)
+        self._reservas: Dict[Tuple, Tuple[int, int]] = {}
+        self._locks = defaultdict(asyncio.Lock)
+
+    async def reservar(self, tenant_id, siglas: str, anio: int) -> Optional[int]:
+        """
+        Toma un número del bloque del proceso, o None si las siglas no usan bloques.
+        Cuando el bloque se agota, el siguiente se reserva en su propia sesión y
+        transacción: si la transacción del documento hace rollback, el bloque no
+        vuelve al contador y no se repiten números entre procesos. Por eso debe
+        llamarse sin retener otra conexión del pool (antes de abrir la sesión del
+        documento); si no, cada envío ocuparía dos cupos de admisión y bajo carga
+        todos podrían quedar esperando el segundo.
+        """
+        tam_bloque = self._bloques.get(siglas, 1)
+        if tam_bloque <= 1:
+            return None
+
+        clave = (tenant_id, siglas, anio)
+        async with self._locks[clave]:
+            actual, fin = self._reservas.get(clave, (1, 0))
+            if actual > fin:
+                async with db_session() as conn_bloque:
+                    fin = await conn_bloque.fetchval(_AVANZAR_QUERY, tenant_id, siglas, anio, tam_bloque)
+                actual = fin - tam_bloque + 1
+            self._reservas[clave] = (actual + 1, fin)
+            return actual
+
+    async def siguiente(self, conn, tenant_id, siglas: str, anio: int, reservado: Optional[int] = None) -> int:
+        """
+        Número del documento: el `reservado` con reservar() o, si no hay, el
+        siguiente del contador en la conexión (y transacción) del documento.
+        Nunca toma otra conexión: sin bloque reservado avanza de a uno aunque
+        las siglas usen bloques, y el contador compartido evita repeticiones.
+        """
+        if reservado is not None:
+            return reservado
+        return await conn.fetchval(_AVANZAR_QUERY, tenant_id, siglas, anio, 1)
+
+    async def generar(self, conn, tenant_id, siglas: str, anio: int, reservado: Optional[int] = None) -> str:
+        numero = await self.siguiente(conn, tenant_id, siglas, anio, reservado)
+        return formatear_correlativo(siglas, numero, anio)
+
+
+correlativos = CorrelativoAllocator()
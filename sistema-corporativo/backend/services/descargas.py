@@ -0,0 +1,163 @@
+import uuid
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
+
+from database import sentencias
+from services.storage import LocalBlobStore, S3BlobStore, get_blob_store
+
+LEGACY_UPLOADS_DIR = Path("uploads")
+
+# Los blobs direccionados por contenido nunca cambian: caché de un año.
+# `private` porque la descarga depende de la autorización del usuario.
+CACHE_INMUTABLE = "private, max-age=31536000, immutable"
+CACHE_LEGACY = "private, no-cache"
+
+# Un adjunto es visible si pertenece al tenant activo y el usuario es remitente,
+# receptor directo o miembro de la gerencia receptora. Una sola consulta.
+_ADJUNTO_AUTORIZADO_QUERY = """
+    SELECT da.id, da.url_archivo, da.nombre_archivo, da.mime_type,
+           da.tamano_bytes, da.sha256, da.fecha_creacion
+    FROM documento_adjuntos da
+    JOIN documentos d ON d.id = da.documento_id
+    WHERE da.id = $1
+      AND d.tenant_id = $2
+      AND (d.remitente_id = $3
+           OR d.receptor_id = $3
+           OR d.receptor_gerencia_id = (SELECT gerencia_id FROM profiles WHERE id = $3))
+"""
+
+# Documentos legacy sin filas en documento_adjuntos: el archivo vive en documentos.url_archivo
+_DOCUMENTO_AUTORIZADO_QUERY = """
+    SELECT d.id, d.url_archivo, NULL::text AS nombre_archivo, NULL::text AS mime_type,
+           NULL::bigint AS tamano_bytes, NULL::text AS sha256, d.fecha_creacion
+    FROM documentos d
+    WHERE d.id = $1
+      AND d.tenant_id = $2
+      AND d.url_archivo IS NOT NULL
+      AND (d.remitente_id = $3
+           OR d.receptor_id = $3
+           OR d.receptor_gerencia_id = (SELECT gerencia_id FROM profiles WHERE id = $3))
+"""
+_ADJUNTO_AUTORIZADO = sentencias.consulta_caliente("adjunto_autorizado", _ADJUNTO_AUTORIZADO_QUERY)
+_DOCUMENTO_AUTORIZADO = sentencias.consulta_caliente("documento_autorizado", _DOCUMENTO_AUTORIZADO_QUERY)
+
+
+def url_descarga(adjunto_id) -> str:
+    return f"/documentos/adjuntos/{adjunto_id}"
+
+
+def url_descarga_documento(documento_id) -> str:
+    return f"/documentos/{documento_id}/archivo"
+
+
+def _parse_id(adjunto_id: str):
+    # documento_adjuntos usa UUID; se aceptan ids enteros por el esquema legacy
+    if adjunto_id.isdigit():
+        return int(adjunto_id)
+    try:
+        return uuid.UUID(adjunto_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Adjunto no encontrado")
+
+
+async def _obtener_autorizado(conn, consulta: sentencias.Consulta, item_id: str, tenant_id, user_id):
+    if not user_id or not tenant_id:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    try:
+        tenant = uuid.UUID(str(tenant_id))
+        usuario = uuid.UUID(str(user_id))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    fila = await sentencias.fetchrow(conn, consulta, _parse_id(item_id), tenant, usuario)
+    if not fila:
+        # 404 y no 403: no revelar la existencia de adjuntos de otros tenants
+        raise HTTPException(status_code=404, detail="Adjunto no encontrado")
+    return fila
+
+
+async def obtener_adjunto_autorizado(conn, adjunto_id: str, tenant_id, user_id):
+    return await _obtener_autorizado(conn, _ADJUNTO_AUTORIZADO, adjunto_id, tenant_id, user_id)
+
+
+async def obtener_archivo_documento(conn, documento_id: str, tenant_id, user_id):
+    return await _obtener_autorizado(conn, _DOCUMENTO_AUTORIZADO, documento_id, tenant_id, user_id)
+
+
+def _no_modificado(request: Request, etag: str, last_modified: Optional[float]) -> bool:
+    """Evalúa If-None-Match (prioritario) e If-Modified-Since (RFC 9110 §13.2.2)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in etags or etag in etags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            fecha = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= int(fecha.timestamp())
+    return False
+
+
+def _ruta_legacy(url: str) -> Path:
+    """Adjuntos anteriores al almacén por contenido: /uploads/<archivo>."""
+    base = LEGACY_UPLOADS_DIR.resolve()
+    ruta = (base / url.removeprefix("/uploads/").lstrip("/")).resolve()
+    if base not in ruta.parents:
+        raise HTTPException(status_code=404, detail="Adjunto no encontrado")
+    return ruta
+
+
+def responder_adjunto(request: Request, adjunto) -> Response:
+    """
+    Responde el archivo con ETag fuerte (el SHA-256 calculado al subirlo),
+    304 para GET condicionales y rangos de bytes vía FileResponse, que usa
+    sendfile/pathsend cuando el servidor lo soporta.
+    """
+    sha256 = adjunto["sha256"]
+    nombre = adjunto["nombre_archivo"] or Path(adjunto["url_archivo"] or "adjunto").name
+    mime_type = adjunto["mime_type"] or "application/octet-stream"
+    store = get_blob_store()
+
+    if sha256:
+        etag = f'"{sha256}"'
+        cache_control = CACHE_INMUTABLE
+        creado: Optional[datetime] = adjunto["fecha_creacion"]
+        last_modified = creado.timestamp() if creado else None
+        if isinstance(store, S3BlobStore):
+            # El objeto lo sirve S3 directamente con una URL prefirmada de corta duración
+            return RedirectResponse(store.presigned_url(sha256, nombre, mime_type), status_code=302)
+        ruta = store.path(sha256) if isinstance(store, LocalBlobStore) else None
+    else:
+        ruta = _ruta_legacy(adjunto["url_archivo"] or "")
+        cache_control = CACHE_LEGACY
+        if not ruta.exists():
+            raise HTTPException(status_code=404, detail="Archivo no disponible")
+        stat = ruta.stat()
+        etag = f'"{int(stat.st_mtime)}-{stat.st_size}"'
+        last_modified = stat.st_mtime
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+    if _no_modificado(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if ruta is None or not ruta.exists():
+        raise HTTPException(status_code=404, detail="Archivo no disponible")
+
+    return FileResponse(
+        ruta,
+        media_type=mime_type,
+        filename=nombre,
+        content_disposition_type="inline",
+        headers=headers,
+    )
@@ -0,0 +1,307 @@
+import base64
+import json
+import uuid
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from database.async_db import read_session
+from services.adjuntos import hidratar_documentos
+from services.descargas import url_descarga_documento
+
+logger = logging.getLogger("sistema_corporativo")
+
+# Tamaño de página por defecto / máximo para GET /documentos paginado
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# JOINs opcionales: solo se agregan si alguna columna proyectada los necesita
+_JOINS = {
+    "p_rem": "LEFT JOIN profiles p_rem ON d.remitente_id = p_rem.id",
+    "p_rec": "LEFT JOIN profiles p_rec ON d.receptor_id = p_rec.id",
+    "g": "LEFT JOIN gerencias g ON d.receptor_gerencia_id = g.id",
+}
+
+# Columnas expuestas por el listado: alias -> (expresión SQL, joins requeridos).
+# Los alias se mantienen en minúsculas porque Postgres pliega los identificadores
+# sin comillas; así la respuesta conserva las mismas claves que antes.
+DOCUMENTO_COLUMNAS = {
+    "id": ("d.id", ()),
+    "name": ("COALESCE(d.titulo, d.title, 'Sin Asunto')", ()),
+    "iddoc": ("d.correlativo", ()),
+    "category": ("d.tipo_documento", ()),
+    "signaturestatus": ("d.estado", ()),
+    "prioridad": ("d.prioridad", ()),
+    "remitente_id": ("d.remitente_id", ()),
+    "uploadedby": ("COALESCE(p_rem.nombre || ' ' || p_rem.apellido, 'Desconocido')", ("p_rem",)),
+    "remitente_nombre": ("COALESCE(p_rem.nombre || ' ' || p_rem.apellido, 'Desconocido')", ("p_rem",)),
+    "receptor_id": ("d.receptor_id", ()),
+    "receptor_gerencia_id": ("d.receptor_gerencia_id", ()),
+    "receptor_nombre": ("COALESCE(p_rec.nombre || ' ' || p_rec.apellido, g.nombre, 'Sin Asignar')", ("p_rec", "g")),
+    "targetdepartment": ("COALESCE(g.nombre, 'Mensaje Personal')", ("g",)),
+    "fileurl": ("d.url_archivo", ()),
+    "fecha_creacion": ("d.fecha_creacion", ()),
+    "uploaddate": ("TO_CHAR(d.fecha_creacion, 'DD/MM/YYYY')", ()),
+    "uploadtime": ("TO_CHAR(d.fecha_creacion, 'HH24:MI')", ()),
+    "fecha_caducidad": ("d.fecha_caducidad", ()),
+    "tenant_id": ("d.tenant_id", ()),
+    "contenido": ("d.contenido", ()),
+    "leido": ("d.leido", ()),
+}
+
+# Campos que no salen del SELECT principal: se hidratan por lote desde
+# documento_adjuntos (services/adjuntos.py). `archivos` conserva la lista de
+# URLs legacy; `adjuntos` trae los metadatos.
+CAMPOS_HIDRATADOS = ("archivos", "adjuntos")
+
+# Orden canónico de la proyección (ver parse_fields)
+_ORDEN_CAMPOS = tuple(DOCUMENTO_COLUMNAS) + CAMPOS_HIDRATADOS
+
+# Nombre fijo del listado en db_query_seconds: la SQL cambia con `fields` y el
+# cursor, y no debe abrir una serie de métricas por variante
+CONSULTA_LISTADO = "documentos_listado"
+
+# Columnas que siempre se devuelven: son la clave del cursor keyset
+COLUMNAS_CURSOR = ("id", "fecha_creacion")
+
+# Modo streaming: filas leídas por viaje del cursor de servidor y
+# filas agrupadas por chunk HTTP
+STREAM_PREFETCH = 500
+STREAM_CHUNK_ROWS = 100
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """
+    Convierte el parámetro `fields=a,b,c` en la lista de columnas a proyectar.
+    Sin parámetro se devuelven todas las columnas (comportamiento legacy).
+    Las columnas salen en el orden de DOCUMENTO_COLUMNAS, no en el del cliente:
+    cada permutación de `fields` produce la misma SQL (y la misma sentencia
+    preparada en la caché de asyncpg).
+    """
+    if not fields:
+        return list(_ORDEN_CAMPOS)
+
+    pedidos = {f.strip().lower() for f in fields.split(",") if f.strip()}
+    desconocidos = sorted(f for f in pedidos if f not in DOCUMENTO_COLUMNAS and f not in CAMPOS_HIDRATADOS)
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}")
+
+    return list(COLUMNAS_CURSOR) + [c for c in _ORDEN_CAMPOS if c in pedidos and c not in COLUMNAS_CURSOR]
+
+
+def requiere_adjuntos(columnas: Iterable[str]) -> bool:
+    return any(c in CAMPOS_HIDRATADOS for c in columnas)
+
+
+def encode_cursor(fecha_creacion: datetime, doc_id) -> str:
+    """Cursor opaco (base64url) con la clave keyset (fecha_creacion, id)."""
+    raw = json.dumps([fecha_creacion.isoformat(), str(doc_id) if isinstance(doc_id, uuid.UUID) else doc_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, object]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        fecha_raw, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        fecha = datetime.fromisoformat(fecha_raw)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+    # Los ids pueden ser enteros (esquema legacy) o UUID (esquema multi-tenant)
+    if isinstance(doc_id, str):
+        try:
+            doc_id = uuid.UUID(doc_id)
+        except ValueError:
+            raise ValueError("Cursor inválido")
+    elif not isinstance(doc_id, int):
+        raise ValueError("Cursor inválido")
+    return fecha, doc_id
+
+
+def build_list_query(
+    columnas: Iterable[str],
+    tenant_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Tuple[str, list]:
+    """
+    Construye el SELECT del buzón con proyección y paginación keyset.
+    El orden (fecha_creacion DESC, id DESC) coincide con el índice
+    idx_documentos_tenant_fecha_creacion, por lo que cada página es
+    un range scan acotado sin importar la profundidad.
+    """
+    columnas = list(columnas)
+    hidratar = requiere_adjuntos(columnas)
+    columnas = [c for c in columnas if c not in CAMPOS_HIDRATADOS]
+    # La URL legacy es el respaldo cuando no hay filas en documento_adjuntos
+    if hidratar and "fileurl" not in columnas:
+        columnas.append("fileurl")
+
+    select_parts = []
+    joins = []
+    for alias in columnas:
+        expr, requeridos = DOCUMENTO_COLUMNAS[alias]
+        select_parts.append(f"{expr} AS {alias}")
+        for j in requeridos:
+            if j not in joins:
+                joins.append(j)
+
+    args: list = []
+    where = []
+    if tenant_id:
+        args.append(uuid.UUID(str(tenant_id)))
+        where.append(f"d.tenant_id = ${len(args)}")
+    if cursor:
+        fecha, doc_id = decode_cursor(cursor)
+        args.extend([fecha, doc_id])
+        where.append(f"(d.fecha_creacion, d.id) < (${len(args) - 1}, ${len(args)})")
+
+    query = "SELECT " + ",\n       ".join(select_parts) + "\nFROM documentos d"
+    for j in joins:
+        query += "\n" + _JOINS[j]
+    if where:
+        query += "\nWHERE " + " AND ".join(where)
+    query += "\nORDER BY d.fecha_creacion DESC, d.id DESC"
+    if limit is not None:
+        # Se pide una fila extra para saber si existe una página siguiente
+        args.append(limit + 1)
+        query += f"\nLIMIT ${len(args)}"
+    return query, args
+
+
+async def materializar_documentos(conn, records, columnas: List[str]) -> List[dict]:
+    """Convierte una página de filas en dicts e hidrata sus adjuntos en un solo query."""
+    documentos = [dict(r) for r in records]
+    if documentos and requiere_adjuntos(columnas):
+        await hidratar_documentos(conn, documentos, columnas)
+        if "fileurl" not in columnas:
+            for d in documentos:
+                d.pop("fileurl", None)
+    if "fileurl" in columnas:
+        # url_archivo guarda la ruta en disco (/uploads/...), que ya no se sirve
+        # estática: se expone la descarga autorizada, como en `archivos`
+        for d in documentos:
+            if d.get("fileurl"):
+                d["fileurl"] = url_descarga_documento(d["id"])
+    return documentos
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def documento_to_json(documento: dict) -> str:
+    return json.dumps(documento, default=_json_default, ensure_ascii=False)
+
+
+async def stream_documentos(
+    query: str,
+    args: list,
+    columnas: List[str],
+    ndjson: bool = True,
+    limit: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """
+    Recorre el listado con un cursor de servidor y emite las filas a medida que
+    llegan, en NDJSON (una fila por línea) o como un array JSON por chunks.
+    Usa su propia sesión porque el cuerpo se envía después de que el handler
+    retorna; la memoria queda acotada a STREAM_PREFETCH filas.
+    """
+    primero = True
+    enviadas = 0
+    lote = []
+
+    def serializar(documentos):
+        nonlocal primero
+        partes = []
+        for d in documentos:
+            linea = documento_to_json(d)
+            if ndjson:
+                partes.append(linea + "\n")
+            else:
+                partes.append(linea if primero else "," + linea)
+            primero = False
+        return "".join(partes)
+
+    if not ndjson:
+        yield "["
+    try:
+        async with read_session() as conn:
+            # Los cursores de servidor requieren una transacción abierta
+            async with conn.transaction():
+                async for record in conn.cursor(query, *args, prefetch=STREAM_PREFETCH):
+                    # build_list_query pide limit + 1 filas; aquí no hace falta la extra
+                    if limit is not None and enviadas >= limit:
+                        break
+                    lote.append(record)
+                    enviadas += 1
+                    if len(lote) >= STREAM_CHUNK_ROWS:
+                        # Los adjuntos se cargan por chunk, no por fila
+                        yield serializar(await materializar_documentos(conn, lote, columnas))
+                        lote = []
+                if lote:
+                    yield serializar(await materializar_documentos(conn, lote, columnas))
+    except Exception as e:
+        # El status 200 ya fue enviado: solo queda registrar y cortar el stream
+        logger.error(f"Error en streaming de documentos tras {enviadas} filas: {e}")
+        raise
+
+    if not ndjson:
+        yield "]"
+
+
+def next_cursor(rows: list, limit: Optional[int]) -> Optional[str]:
+    """Devuelve el cursor de la siguiente página si se obtuvo la fila extra."""
+    if limit is None or len(rows) <= limit:
+        return None
+    ultimo = rows[limit - 1]
+    return encode_cursor(ultimo["fecha_creacion"], ultimo["id"])
+
+
+# Transiciones automáticas del buzón: (estado origen, estado destino, días sin actividad)
+TRANSICIONES_EXPIRACION = (
+    ("en-proceso", "pendiente", 3),
+    ("pendiente", "omitido", 6),
+)
+
+_SWEEP_QUERY = """
+    WITH lote AS (
+        SELECT id FROM documentos
+        WHERE estado = $1
+          AND fecha_ultima_actividad < now() - make_interval(days => $3)
+        ORDER BY fecha_ultima_actividad
+        LIMIT $4
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE documentos d
+    SET estado = $2
+    FROM lote
+    WHERE d.id = lote.id
+"""
+
+
+async def expirar_documentos(conn, batch_size: int = 500) -> dict:
+    """
+    Aplica las transiciones por inactividad en lotes pequeños.
+    Cada lote es una sentencia independiente con SKIP LOCKED, así que nunca
+    espera por filas que un usuario esté modificando ni bloquea la tabla
+    completa. Devuelve cuántas filas tocó cada transición.
+    """
+    resultado = {}
+    for origen, destino, dias in TRANSICIONES_EXPIRACION:
+        total = 0
+        while True:
+            status = await conn.execute(_SWEEP_QUERY, origen, destino, dias, batch_size)
+            afectadas = int(status.split()[-1])
+            total += afectadas
+            if afectadas < batch_size:
+                break
+        resultado[f"{origen}->{destino}"] = total
+    return resultado
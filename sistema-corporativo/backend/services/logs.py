@@ -0,0 +1,201 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from prometheus_client import Counter
+
+from middleware.context import get_current_tenant_id, get_current_trace_id, get_current_user_id
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa json de la biblioteca estándar
+    orjson = None
+
+# Registros en espera de escritura; llena, se descartan en lugar de bloquear el
+# event loop. 0 = escritura síncrona (útil al depurar en local).
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Ventana en la que un mismo error (mismo origen y tipo) se loguea una sola vez
+LOG_DEDUP_WINDOW = float(os.getenv("LOG_DEDUP_WINDOW", 60))
+
+
+def _parse_muestreo(raw: str) -> Dict[str, float]:
+    """LOG_SAMPLE_RATES="sistema_corporativo.contexto=0.01,..." -> {logger: fracción}"""
+    tasas = {}
+    for parte in (raw or "").split(","):
+        if "=" not in parte:
+            continue
+        nombre, tasa = parte.split("=", 1)
+        tasas[nombre.strip()] = min(1.0, max(0.0, float(tasa)))
+    return tasas
+
+
+# Solo INFO y DEBUG se muestrean; WARNING y superiores siempre se escriben
+LOG_SAMPLE_RATES = _parse_muestreo(os.getenv("LOG_SAMPLE_RATES", "sistema_corporativo.contexto=0.01"))
+
+LOGS_DESCARTADOS = Counter(
+    "log_messages_dropped_total",
+    "Líneas de log no escritas",
+    ["motivo"],  # cola_llena | muestreo | duplicado
+)
+
+
+def _dumps(entrada: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(entrada, default=str).decode()
+    return json.dumps(entrada, default=str)
+
+
+class JSONFormatter(logging.Formatter):
+    # Extras opcionales que se copian al JSON si el registro los trae
+    EXTRAS = ("duration_ms", "query", "plan", "repeticiones", "muestreo")
+
+    def format(self, record):
+        log_entry = {
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "module": record.module,
+            # Capturados por ContextQueueHandler en el hilo del request; si no, del contexto actual
+            "tenant_id": getattr(record, "tenant_id", None) or get_current_tenant_id(),
+            "user_id": getattr(record, "user_id", None) or get_current_user_id(),
+            "trace_id": getattr(record, "trace_id", None) or get_current_trace_id(),
+        }
+        for campo in self.EXTRAS:
+            if hasattr(record, campo):
+                log_entry[campo] = getattr(record, campo)
+
+        if record.exc_info:
+            log_entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_entry["exception"] = record.exc_text
+        return _dumps(log_entry)
+
+
+class MuestreoFilter(logging.Filter):
+    """Deja pasar una fracción de los INFO/DEBUG de los loggers configurados."""
+
+    def __init__(self, tasas: Dict[str, float]):
+        super().__init__()
+        self.tasas = tasas
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        tasa = self.tasas.get(record.name)
+        if tasa is None or tasa >= 1:
+            return True
+        if random.random() < tasa:
+            record.muestreo = tasa  # para re-ponderar al contar líneas
+            return True
+        LOGS_DESCARTADOS.labels(motivo="muestreo").inc()
+        return False
+
+
+class DeduplicarErrores(logging.Filter):
+    """
+    Un mismo error (logger, línea del log, tipo de excepción y línea donde se
+    originó) se escribe una vez por ventana; el siguiente que pasa lleva
+    `repeticiones` con los omitidos. La clave no usa el mensaje: casi todos son
+    f-strings con datos variables. El origen importa porque todos los errores no
+    manejados se loguean desde la misma línea (global_exception_handler).
+    """
+
+    def __init__(self, ventana: float, max_claves: int = 1000):
+        super().__init__()
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self._vistos: "OrderedDict[tuple, list]" = OrderedDict()
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR or self.ventana <= 0:
+            return True
+        tipo = origen = None
+        if record.exc_info and record.exc_info[0]:
+            tipo = record.exc_info[0].__name__
+            tb = record.exc_info[2]
+            while tb is not None and tb.tb_next is not None:
+                tb = tb.tb_next
+            if tb is not None:
+                origen = (tb.tb_frame.f_code.co_filename, tb.tb_lineno)
+        clave = (record.name, record.pathname, record.lineno, tipo, origen)
+        ahora = time.monotonic()
+        visto = self._vistos.get(clave)
+        if visto is not None and ahora - visto[0] < self.ventana:
+            visto[1] += 1
+            LOGS_DESCARTADOS.labels(motivo="duplicado").inc()
+            return False
+        if visto is not None and visto[1]:
+            record.repeticiones = visto[1]
+        self._vistos[clave] = [ahora, 0]
+        self._vistos.move_to_end(clave)
+        if len(self._vistos) > self.max_claves:
+            self._vistos.popitem(last=False)
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Encola el registro sin formatearlo: el JSON y la escritura los hace el hilo
+    del QueueListener, fuera del event loop. Antes de encolar se fijan el
+    mensaje, la excepción y los contextvars (tenant, usuario, trace), que en el
+    otro hilo ya no existen.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _formatter_excepciones.formatException(record.exc_info)
+            record.exc_info = None
+        record.tenant_id = get_current_tenant_id()
+        record.user_id = get_current_user_id()
+        record.trace_id = get_current_trace_id()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DESCARTADOS.labels(motivo="cola_llena").inc()
+
+
+_formatter_excepciones = logging.Formatter()
+_listener: Optional[QueueListener] = None
+
+
+def configurar_logging(logger: logging.Logger):
+    """Handler JSON del logger de la app: encolado (LOG_QUEUE_SIZE > 0) o síncrono."""
+    global _listener
+    salida = logging.StreamHandler()
+    salida.setFormatter(JSONFormatter())
+    if LOG_QUEUE_SIZE > 0:
+        handler = ContextQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _listener = QueueListener(handler.queue, salida)
+        _listener.start()
+        atexit.register(detener_logging)
+    else:
+        handler = salida
+    handler.addFilter(MuestreoFilter(LOG_SAMPLE_RATES))
+    handler.addFilter(DeduplicarErrores(LOG_DEDUP_WINDOW))
+    logger.addHandler(handler)
+
+
+def detener_logging():
+    """Escribe lo pendiente en la cola y detiene el hilo (shutdown)."""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        try:
+            listener.stop()
+        except queue.Full:
+            pass  # sin lugar para el centinela: el hilo es daemon y muere con el proceso
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter
+
+from database import sentencias
+from services.redis_client import get_redis
+
+logger = logging.getLogger("sistema_corporativo")
+
+# L1 en proceso con TTL corto; L2 en Redis compartido por todas las réplicas
+MEMBERSHIP_L1_TTL = float(os.getenv("MEMBERSHIP_L1_TTL", 30))
+MEMBERSHIP_L1_SIZE = int(os.getenv("MEMBERSHIP_L1_SIZE", 20000))
+MEMBERSHIP_L2_TTL = int(os.getenv("MEMBERSHIP_L2_TTL", 300))
+# Tras un error de Redis, tiempo antes de volver a intentarlo
+MEMBERSHIP_REDIS_RETRY = float(os.getenv("MEMBERSHIP_REDIS_RETRY", 5))
+
+CANAL_INVALIDACION = "membresias:invalidacion"
+
+MEMBRESIA_CACHE = Counter(
+    "membership_cache_total",
+    "Consultas de membresía por nivel que las resolvió",
+    ["resultado"],  # l1_hit | l2_hit | miss | degradado
+)
+
+_MEMBRESIAS_QUERY = """
+    SELECT organization_id, role FROM user_organizations WHERE user_id = $1
+"""
+_MEMBRESIAS = sentencias.consulta_caliente("membresias", _MEMBRESIAS_QUERY)
+
+Membresias = Dict[str, str]
+
+
+def _clave(user_id) -> str:
+    return f"membresias:{user_id}"
+
+
+class MembershipCache:
+    """
+    Caché de membresías usuario -> {organization_id: role} en dos niveles.
+
+    Modo degradado (RUNBOOK §3): si Redis no responde se consulta la BD
+    directamente y tampoco se usa el L1, porque sin pub/sub las
+    invalidaciones de otras réplicas no llegarían.
+    """
+
+    def __init__(self):
+        self._l1: "OrderedDict[str, Tuple[float, Membresias]]" = OrderedDict()
+        self._redis_caido_hasta = 0.0
+        self._suscripcion: Optional[asyncio.Task] = None
+
+    @property
+    def degradado(self) -> bool:
+        return time.monotonic() < self._redis_caido_hasta
+
+    def _marcar_caido(self, e: Exception):
+        if not self.degradado:
+            logger.warning(f"Redis no disponible, caché de membresía en modo degradado: {e}")
+        self._redis_caido_hasta = time.monotonic() + MEMBERSHIP_REDIS_RETRY
+        self._l1.clear()
+
+    def _l1_get(self, clave: str) -> Optional[Membresias]:
+        entrada = self._l1.get(clave)
+        if entrada is None:
+            return None
+        expira, valor = entrada
+        if expira <= time.monotonic():
+            del self._l1[clave]
+            return None
+        self._l1.move_to_end(clave)
+        return valor
+
+    def _l1_put(self, clave: str, valor: Membresias):
+        self._l1[clave] = (time.monotonic() + MEMBERSHIP_L1_TTL, valor)
+        self._l1.move_to_end(clave)
+        while len(self._l1) > MEMBERSHIP_L1_SIZE:
+            self._l1.popitem(last=False)
+
+    @staticmethod
+    async def _desde_bd(conn, user_id) -> Membresias:
+        rows = await sentencias.fetch(conn, _MEMBRESIAS, user_id)
+        return {str(r["organization_id"]): r["role"] for r in rows}
+
+    async def obtener(self, conn, user_id) -> Membresias:
+        """Organizaciones y rol del usuario: L1 -> Redis -> BD."""
+        clave = _clave(user_id)
+
+        if self.degradado:
+            MEMBRESIA_CACHE.labels(resultado="degradado").inc()
+            return await self._desde_bd(conn, user_id)
+
+        valor = self._l1_get(clave)
+        if valor is not None:
+            MEMBRESIA_CACHE.labels(resultado="l1_hit").inc()
+            return valor
+
+        redis = get_redis()
+        try:
+            raw = await redis.get(clave)
+        except Exception as e:
+            self._marcar_caido(e)
+            MEMBRESIA_CACHE.labels(resultado="degradado").inc()
+            return await self._desde_bd(conn, user_id)
+
+        if raw is not None:
+            valor = json.loads(raw)
+            MEMBRESIA_CACHE.labels(resultado="l2_hit").inc()
+        else:
+            valor = await self._desde_bd(conn, user_id)
+            MEMBRESIA_CACHE.labels(resultado="miss").inc()
+            try:
+                await redis.set(clave, json.dumps(valor), ex=MEMBERSHIP_L2_TTL)
+            except Exception as e:
+                self._marcar_caido(e)
+                return valor
+        self._l1_put(clave, valor)
+        return valor
+
+    async def rol(self, conn, user_id, organization_id) -> Optional[str]:
+        """Rol del usuario en la organización, o None si no es miembro."""
+        return (await self.obtener(conn, user_id)).get(str(organization_id))
+
+    async def invalidar(self, user_id):
+        """
+        Llamar después de confirmar un cambio en user_organizations: borra el L2
+        y avisa a todas las réplicas (incluida esta) para que descarten su L1.
+        """
+        clave = _clave(user_id)
+        self._l1.pop(clave, None)
+        try:
+            redis = get_redis()
+            await redis.delete(clave)
+            await redis.publish(CANAL_INVALIDACION, str(user_id))
+        except Exception as e:
+            self._marcar_caido(e)
+
+    async def _escuchar(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(CANAL_INVALIDACION)
+                while True:
+                    mensaje = await pubsub.get_message(timeout=1.0)
+                    if mensaje and mensaje.get("type") == "message":
+                        user_id = mensaje["data"]
+                        if isinstance(user_id, bytes):
+                            user_id = user_id.decode()
+                        self._l1.pop(_clave(user_id), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Sin suscripción el L1 podría quedar obsoleto: modo degradado hasta reconectar
+                self._marcar_caido(e)
+                await asyncio.sleep(MEMBERSHIP_REDIS_RETRY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    def start(self):
+        if self._suscripcion is None:
+            self._suscripcion = asyncio.create_task(self._escuchar(), name="membresias-invalidacion")
+
+    async def stop(self):
+        if self._suscripcion is not None:
+            self._suscripcion.cancel()
+            try:
+                await self._suscripcion
+            except asyncio.CancelledError:
+                pass
+            self._suscripcion = None
+
+
+membresias = MembershipCache()
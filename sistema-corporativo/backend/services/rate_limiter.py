@@ -1,42 +1,288 @@
-from redis.asyncio import Redis
-from fastapi import Request, HTTPException
-import time
-from middleware.context import get_current_tenant_id
+import math
 import os
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter
+
+from auth.security import get_request_claims
+from services.redis_client import get_redis
+
+logger = logging.getLogger("sistema_corporativo")
+
+
+def _parse_limite(valor: str) -> Tuple[int, float]:
+    """'100/s', '600/m', '5000/h' -> (solicitudes, período en segundos)."""
+    cantidad, _, unidad = valor.strip().partition("/")
+    periodo = {"s": 1, "m": 60, "h": 3600}.get(unidad.strip().lower() or "s")
+    if periodo is None or int(cantidad) <= 0:
+        raise ValueError(f"Límite inválido: {valor!r}")
+    return int(cantidad), float(periodo)
+
+
+# Límites por dimensión (RATE_LIMIT_<DIM>=N/s|m|h). Ráfaga = N salvo que se indique.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+LIMITES = {
+    "tenant": _parse_limite(os.getenv("RATE_LIMIT_TENANT", "100/s")),
+    "user": _parse_limite(os.getenv("RATE_LIMIT_USER", "20/s")),
+    "ip": _parse_limite(os.getenv("RATE_LIMIT_IP", "30/s")),
+}
+# Fichas que cada consulta a Redis reserva para el proceso (0 = sin leasing)
+RATE_LIMIT_LEASE = int(os.getenv("RATE_LIMIT_LEASE", 5))
+RATE_LIMIT_LEASE_TTL = float(os.getenv("RATE_LIMIT_LEASE_TTL", 0.5))
+# Tras un error de Redis se usa el limitador local durante este tiempo
+RATE_LIMIT_REDIS_RETRY = float(os.getenv("RATE_LIMIT_REDIS_RETRY", 5))
+RATE_LIMIT_LOCAL_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_KEYS", 10000))
+# Detrás de un proxy de confianza, la IP real viene en X-Forwarded-For
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+
+RUTAS_EXENTAS = ("/health", "/metrics", "/docs", "/openapi.json")
+
+RATE_LIMIT_DECISIONES = Counter(
+    "rate_limit_decisions_total",
+    "Decisiones del rate limiter",
+    ["resultado", "origen"],  # permitido|rechazado ; lease|redis|local
+)
+
+# GCRA atómico sobre N claves: solo consume si todas lo permiten (una ida a Redis).
+# KEYS[i] = clave; ARGV = costo, luego (intervalo_ms, ráfaga) por clave.
+# Devuelve {permitido, restante mínimo, retry_after_ms, reset_ms}.
+GCRA_LUA = """
+local costo = tonumber(ARGV[1])
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local nuevos = {}
+local restante = -1
+local reset = 0
+for i, clave in ipairs(KEYS) do
+    local intervalo = tonumber(ARGV[2 * i])
+    local rafaga = tonumber(ARGV[2 * i + 1])
+    local tat = tonumber(redis.call('GET', clave) or ahora)
+    if tat < ahora then tat = ahora end
+    local nuevo_tat = tat + intervalo * costo
+    local diff = ahora - (nuevo_tat - intervalo * rafaga)
+    -- Tolerancia de 1 µs: intervalos no enteros (1000/3 ms) acumulan error de redondeo
+    if diff < -0.001 then
+        return {0, 0, -diff, tat - ahora}
+    end
+    nuevos[i] = nuevo_tat
+    local r = math.floor(diff / intervalo)
+    if r < 0 then r = 0 end
+    if restante < 0 or r < restante then restante = r end
+    if nuevo_tat - ahora > reset then reset = nuevo_tat - ahora end
+end
+for i, clave in ipairs(KEYS) do
+    redis.call('SET', clave, nuevos[i], 'PX', math.ceil(nuevos[i] - ahora))
+end
+return {1, restante, 0, reset}
+"""
 
-# Configuración Redis
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-redis_client = Redis.from_url(REDIS_URL)
 
-async def rate_limiter_middleware(request: Request):
+@dataclass
+class Decision:
+    permitido: bool
+    limite: int
+    restante: int
+    retry_after: float = 0.0
+    reset: float = 0.0
+
+    def headers(self) -> Dict[str, str]:
+        h = {
+            "X-RateLimit-Limit": str(self.limite),
+            "X-RateLimit-Remaining": str(max(self.restante, 0)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.permitido:
+            h["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return h
+
+
+class LocalGCRA:
     """
-    Middleware de Rate Limiting que limita por tenant_id.
-    Standard: 100 requests por segundo por empresa.
+    GCRA en memoria con el mismo algoritmo que el script Lua. Acotado a
+    `max_claves` (LRU) para que el fallback no crezca sin límite.
+    """
+
+    def __init__(self, max_claves: int = RATE_LIMIT_LOCAL_KEYS, reloj=time.monotonic):
+        self.max_claves = max_claves
+        self.reloj = reloj
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+
+    def verificar(self, claves: List[Tuple[str, int, float]], costo: int = 1) -> Tuple[bool, int, float, float]:
+        ahora = self.reloj()
+        nuevos = []
+        restante, reset = None, 0.0
+        for clave, rafaga, intervalo in claves:
+            tat = max(self._tat.get(clave, ahora), ahora)
+            nuevo_tat = tat + intervalo * costo
+            diff = ahora - (nuevo_tat - intervalo * rafaga)
+            if diff < -1e-6:
+                return False, 0, -diff, tat - ahora
+            nuevos.append((clave, nuevo_tat))
+            r = max(int(diff // intervalo), 0)
+            restante = r if restante is None else min(restante, r)
+            reset = max(reset, nuevo_tat - ahora)
+        for clave, nuevo_tat in nuevos:
+            self._tat[clave] = nuevo_tat
+            self._tat.move_to_end(clave)
+        while len(self._tat) > self.max_claves:
+            self._tat.popitem(last=False)
+        return True, restante or 0, 0.0, reset
+
+
+class _Lease:
+    __slots__ = ("fichas", "expira", "limite", "restante", "reset")
+
+    def __init__(self, fichas, expira, limite, restante, reset):
+        self.fichas = fichas
+        self.expira = expira
+        self.limite = limite
+        self.restante = restante
+        self.reset = reset
+
+
+class RateLimiter:
     """
-    tenant_id = get_current_tenant_id()
-    if not tenant_id:
-        return # Si no hay tenant_id (public endpoints), no limitamos aquí o limitamos por IP
-    
-    key = f"rate_limit:{tenant_id}"
-    limit = 100 # Req/seg
-    window = 1 # segundo
-    
-    current_time = int(time.time())
-    
-    # Pipeline para asegurar atomicidad
-    async with redis_client.pipeline(transaction=True) as pipe:
-        try:
-            await pipe.incr(key)
-            await pipe.expire(key, window)
-            results = await pipe.execute()
-            count = results[0]
-            
-            if count > limit:
-                raise HTTPException(
-                    status_code=429, 
-                    detail="Demasiadas solicitudes. Límite excedido para su organización."
-                )
-        except Exception as e:
-            if isinstance(e, HTTPException): raise e
-            # Log error pero permitir request si Redis falla (fail-open)
-            print(f"Redis Rate Limiter Error: {e}")
+    Limitador distribuido: GCRA en Redis con claves por tenant, usuario e IP.
+
+    - Leasing: cada ida a Redis reserva RATE_LIMIT_LEASE fichas para esta
+      identidad; las siguientes solicitudes las consumen localmente hasta que
+      se agotan o vencen (RATE_LIMIT_LEASE_TTL). Las fichas no usadas se
+      pierden, lo que solo puede hacer al limitador más estricto, nunca más laxo.
+    - Fallback: si Redis no responde, un GCRA local acotado aplica los mismos
+      límites por proceso hasta que Redis vuelve.
+    """
+
+    def __init__(
+        self,
+        limites: Dict[str, Tuple[int, float]] = LIMITES,
+        lease: int = RATE_LIMIT_LEASE,
+        lease_ttl: float = RATE_LIMIT_LEASE_TTL,
+        redis_factory=get_redis,
+    ):
+        self.limites = limites
+        self.lease = lease
+        self.lease_ttl = lease_ttl
+        self.redis_factory = redis_factory
+        self.local = LocalGCRA()
+        self._leases: "OrderedDict[Tuple[str, ...], _Lease]" = OrderedDict()
+        self._script = None
+        self._redis_caido_hasta = 0.0
+
+    def claves(self, tenant_id: Optional[str], user_id: Optional[str], ip: Optional[str]) -> List[Tuple[str, int, float]]:
+        """(clave, ráfaga, intervalo en segundos) de cada dimensión aplicable."""
+        dims = []
+        for dim, valor in (("tenant", tenant_id), ("user", user_id), ("ip", ip)):
+            if valor:
+                cantidad, periodo = self.limites[dim]
+                dims.append((f"rl:{dim}:{valor}", cantidad, periodo / cantidad))
+        return dims
+
+    def _usar_lease(self, identidad) -> Optional[Decision]:
+        lease = self._leases.get(identidad)
+        if lease is None:
+            return None
+        if lease.fichas <= 0 or lease.expira <= time.monotonic():
+            del self._leases[identidad]
+            return None
+        lease.fichas -= 1
+        return Decision(True, lease.limite, lease.restante + lease.fichas, reset=lease.reset)
+
+    def _guardar_lease(self, identidad, fichas, limite, restante, reset):
+        if fichas <= 0:
+            return
+        self._leases[identidad] = _Lease(fichas, time.monotonic() + self.lease_ttl, limite, restante, reset)
+        self._leases.move_to_end(identidad)
+        while len(self._leases) > RATE_LIMIT_LOCAL_KEYS:
+            self._leases.popitem(last=False)
+
+    async def _redis(self, claves, costo: int):
+        if self._script is None:
+            self._script = self.redis_factory().register_script(GCRA_LUA)
+        args = [costo]
+        for _, rafaga, intervalo in claves:
+            args.extend([intervalo * 1000, rafaga])
+        permitido, restante, retry_ms, reset_ms = await self._script(keys=[c[0] for c in claves], args=args)
+        return bool(permitido), int(restante), retry_ms / 1000, reset_ms / 1000
+
+    async def verificar(self, tenant_id=None, user_id=None, ip=None) -> Optional[Decision]:
+        claves = self.claves(tenant_id, user_id, ip)
+        if not claves:
+            return None
+        limite = min(rafaga for _, rafaga, _ in claves)
+        identidad = tuple(c[0] for c in claves)
+
+        decision = self._usar_lease(identidad)
+        if decision is not None:
+            RATE_LIMIT_DECISIONES.labels(resultado="permitido", origen="lease").inc()
+            return decision
+
+        if time.monotonic() >= self._redis_caido_hasta:
+            try:
+                costo = max(1, min(self.lease, limite))
+                permitido, restante, retry, reset = await self._redis(claves, costo)
+                if not permitido and costo > 1:
+                    # No alcanza para un lease completo: se pide solo esta solicitud
+                    costo = 1
+                    permitido, restante, retry, reset = await self._redis(claves, costo)
+                if permitido:
+                    self._guardar_lease(identidad, costo - 1, limite, restante, reset)
+                    restante += costo - 1
+                RATE_LIMIT_DECISIONES.labels(
+                    resultado="permitido" if permitido else "rechazado", origen="redis"
+                ).inc()
+                return Decision(permitido, limite, restante, retry, reset)
+            except Exception as e:
+                if time.monotonic() >= self._redis_caido_hasta:
+                    logger.warning(f"Rate limiter sin Redis, usando limitador local: {e}")
+                self._redis_caido_hasta = time.monotonic() + RATE_LIMIT_REDIS_RETRY
+                self._script = None
+
+        permitido, restante, retry, reset = self.local.verificar(claves)
+        RATE_LIMIT_DECISIONES.labels(resultado="permitido" if permitido else "rechazado", origen="local").inc()
+        return Decision(permitido, limite, restante, retry, reset)
+
+
+rate_limiter = RateLimiter()
+
+
+def ip_cliente(request: Request) -> Optional[str]:
+    if RATE_LIMIT_TRUST_PROXY:
+        reenviada = request.headers.get("x-forwarded-for")
+        if reenviada:
+            return reenviada.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    """
+    Aplica los límites por tenant/usuario/IP antes de llegar al handler.
+    Los claims salen del caché compartido de auth/security.py.
+    """
+    if not RATE_LIMIT_ENABLED or request.method == "OPTIONS" or request.url.path.startswith(RUTAS_EXENTAS):
+        return await call_next(request)
+
+    claims = get_request_claims(request) or {}
+    decision = await rate_limiter.verificar(
+        tenant_id=claims.get("tenant_id"),
+        user_id=claims.get("sub"),
+        ip=ip_cliente(request),
+    )
+    if decision is None:
+        return await call_next(request)
+
+    if not decision.permitido:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Demasiadas solicitudes. Intente nuevamente en unos segundos."},
+            headers=decision.headers(),
+        )
+
+    response = await call_next(request)
+    response.headers.update(decision.headers())
+    return response
@@ -0,0 +1,38 @@
+import os
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+# Configuración Redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Timeouts cortos: si Redis no responde, los cachés pasan a modo degradado en
+# lugar de sumar segundos de espera a cada request
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.25))
+
+_client: "Optional[Redis]" = None
+
+
+def get_redis() -> "Redis":
+    """
+    Cliente compartido (un solo pool de conexiones por proceso), creado al primer
+    uso; close_redis() lo cierra en el shutdown. redis se importa recién aquí.
+    """
+    global _client
+    if _client is None:
+        from redis.asyncio import Redis
+
+        _client = Redis.from_url(
+            REDIS_URL,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+    return _client
+
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
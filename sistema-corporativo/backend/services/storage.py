@@ -0,0 +1,304 @@
+import asyncio
+import os
+import re
+import time
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+logger = logging.getLogger("sistema_corporativo")
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _validar_sha256(sha256: str) -> str:
+    if not _SHA256_RE.match(sha256 or ""):
+        raise ValueError(f"SHA-256 inválido: {sha256!r}")
+    return sha256
+
+
+def shard_path(sha256: str) -> str:
+    """Fan-out de dos niveles (ab/cd/abcd...) para no tener millones de archivos en un directorio."""
+    sha256 = _validar_sha256(sha256)
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+class BlobStore(ABC):
+    """
+    Almacén de adjuntos direccionado por contenido (clave = SHA-256).
+    El mismo archivo enviado a N gerencias se guarda una sola vez; las
+    referencias viven en documento_adjuntos.sha256.
+    """
+
+    @abstractmethod
+    async def put(self, sha256: str, origen: Path, mime_type: Optional[str] = None) -> bool:
+        """
+        Publica `origen` bajo `sha256` y elimina `origen`. Devuelve False si el
+        blob ya existía (deduplicado); en ese caso se refresca su fecha para que
+        el recolector no lo borre mientras se inserta la nueva referencia.
+        """
+
+    @abstractmethod
+    async def exists(self, sha256: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, sha256: str) -> None:
+        ...
+
+    @abstractmethod
+    async def delete_si_anterior(self, sha256: str, limite: float) -> bool:
+        """
+        Borra el blob solo si su fecha sigue siendo anterior a `limite` (epoch).
+        Un put deduplicado la refresca: así el recolector no borra un blob que
+        otra subida acaba de reutilizar. Devuelve True si lo borró.
+        """
+
+    @abstractmethod
+    def list_blobs(self) -> AsyncIterator[Tuple[str, float]]:
+        """Itera (sha256, mtime epoch) de todos los blobs almacenados."""
+
+    @abstractmethod
+    def url(self, sha256: str) -> str:
+        ...
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: Path, url_prefix: str = "/uploads/blobs"):
+        self.root = Path(root)
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def path(self, sha256: str) -> Path:
+        return self.root / shard_path(sha256)
+
+    @staticmethod
+    def _put_sync(origen: Path, destino: Path) -> bool:
+        if destino.exists():
+            try:
+                os.utime(destino)
+                origen.unlink(missing_ok=True)
+                return False
+            except FileNotFoundError:
+                pass  # El recolector lo borró entre exists() y utime(): se publica de nuevo
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        # Rename atómico: dos subidas concurrentes del mismo contenido escriben lo mismo
+        os.replace(origen, destino)
+        return True
+
+    async def put(self, sha256: str, origen: Path, mime_type: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self._put_sync, Path(origen), self.path(sha256))
+
+    async def exists(self, sha256: str) -> bool:
+        return await asyncio.to_thread(self.path(sha256).exists)
+
+    async def delete(self, sha256: str) -> None:
+        await asyncio.to_thread(self.path(sha256).unlink, True)
+
+    @staticmethod
+    def _delete_si_anterior_sync(destino: Path, limite: float) -> bool:
+        # stat y unlink en la misma llamada: la ventana con un put concurrente es mínima
+        try:
+            if destino.stat().st_mtime >= limite:
+                return False
+            destino.unlink()
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def delete_si_anterior(self, sha256: str, limite: float) -> bool:
+        return await asyncio.to_thread(self._delete_si_anterior_sync, self.path(sha256), limite)
+
+    def _scan(self):
+        blobs = []
+        if not self.root.exists():
+            return blobs
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if _SHA256_RE.match(name):
+                    blobs.append((name, os.stat(os.path.join(dirpath, name)).st_mtime))
+        return blobs
+
+    async def list_blobs(self) -> AsyncIterator[Tuple[str, float]]:
+        for item in await asyncio.to_thread(self._scan):
+            yield item
+
+    def url(self, sha256: str) -> str:
+        return f"{self.url_prefix}/{shard_path(sha256)}"
+
+
+class S3BlobStore(BlobStore):
+    """
+    Backend compatible con S3 (AWS, MinIO, Supabase Storage S3). `endpoint_url`
+    permite probarlo contra un MinIO local. boto3 es opcional: solo se importa
+    si se selecciona este backend.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "blobs/", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requiere el paquete boto3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def key(self, sha256: str) -> str:
+        return f"{self.prefix}{shard_path(sha256)}"
+
+    def _exists_sync(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _put_sync(self, origen: Path, key: str, mime_type: Optional[str]) -> bool:
+        try:
+            if self._exists_sync(key):
+                # Copia sobre sí mismo para refrescar LastModified (ver BlobStore.put)
+                self._client.copy_object(
+                    Bucket=self.bucket, Key=key,
+                    CopySource={"Bucket": self.bucket, "Key": key},
+                    MetadataDirective="REPLACE",
+                    ContentType=mime_type or "application/octet-stream",
+                )
+                return False
+            self._client.upload_file(
+                str(origen), self.bucket, key,
+                ExtraArgs={"ContentType": mime_type or "application/octet-stream"},
+            )
+            return True
+        finally:
+            origen.unlink(missing_ok=True)
+
+    async def put(self, sha256: str, origen: Path, mime_type: Optional[str] = None) -> bool:
+        return await asyncio.to_thread(self._put_sync, Path(origen), self.key(sha256), mime_type)
+
+    async def exists(self, sha256: str) -> bool:
+        return await asyncio.to_thread(self._exists_sync, self.key(sha256))
+
+    async def delete(self, sha256: str) -> None:
+        await asyncio.to_thread(self._client.delete_object, Bucket=self.bucket, Key=self.key(sha256))
+
+    def _delete_si_anterior_sync(self, key: str, limite: float) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            head = self._client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        if head["LastModified"].timestamp() >= limite:
+            return False
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+        return True
+
+    async def delete_si_anterior(self, sha256: str, limite: float) -> bool:
+        return await asyncio.to_thread(self._delete_si_anterior_sync, self.key(sha256), limite)
+
+    def _scan(self):
+        blobs = []
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                name = obj["Key"].rsplit("/", 1)[-1]
+                if _SHA256_RE.match(name):
+                    blobs.append((name, obj["LastModified"].timestamp()))
+        return blobs
+
+    async def list_blobs(self) -> AsyncIterator[Tuple[str, float]]:
+        for item in await asyncio.to_thread(self._scan):
+            yield item
+
+    def url(self, sha256: str) -> str:
+        return f"s3://{self.bucket}/{self.key(sha256)}"
+
+    def presigned_url(self, sha256: str, nombre: str, mime_type: str, expira_segundos: int = 300) -> str:
+        return self._client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.key(sha256),
+                "ResponseContentType": mime_type,
+                "ResponseContentDisposition": f'inline; filename="{nombre}"',
+                "ResponseCacheControl": "private, max-age=31536000, immutable",
+            },
+            ExpiresIn=expira_segundos,
+        )
+
+
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Backend configurado por STORAGE_BACKEND (local | s3)."""
+    global _store
+    if _store is None:
+        backend = os.getenv("STORAGE_BACKEND", "local").lower()
+        if backend == "s3":
+            _store = S3BlobStore(
+                bucket=os.environ["S3_BUCKET"],
+                prefix=os.getenv("S3_PREFIX", "blobs/"),
+                endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            )
+        else:
+            _store = LocalBlobStore(Path(os.getenv("STORAGE_LOCAL_ROOT", "uploads/blobs")))
+    return _store
+
+
+# Referencias: un blob está vivo mientras alguna fila de documento_adjuntos lo apunte
+_REFERENCIADOS_QUERY = """
+    SELECT DISTINCT sha256 FROM documento_adjuntos WHERE sha256 = ANY($1)
+"""
+_REFERENCIADO_QUERY = "SELECT EXISTS (SELECT 1 FROM documento_adjuntos WHERE sha256 = $1)"
+
+# documento_adjuntos tiene RLS por tenant: el recolector corre sin tenant en
+# contexto y necesita un rol que vea todas las filas (BYPASSRLS o superusuario).
+# Con otro rol no vería ninguna referencia y borraría todos los blobs antiguos.
+_VE_TODOS_LOS_TENANTS_QUERY = "SELECT rolbypassrls OR rolsuper FROM pg_roles WHERE rolname = current_user"
+
+
+async def rol_ve_todos_los_tenants(conn) -> bool:
+    return bool(await conn.fetchval(_VE_TODOS_LOS_TENANTS_QUERY))
+
+
+async def recolectar_blobs(conn, store: BlobStore, gracia_segundos: float = 24 * 3600, lote: int = 1000) -> dict:
+    """
+    Borra blobs sin referencias en documento_adjuntos. Solo considera blobs
+    más antiguos que el período de gracia, para no borrar uno recién subido
+    cuya transacción todavía no confirmó la fila que lo referencia. Justo antes
+    de cada borrado vuelve a verificar la referencia y la fecha del blob: una
+    subida deduplicada pudo reutilizarlo después de la consulta del lote.
+    """
+    if not await rol_ve_todos_los_tenants(conn):
+        raise RuntimeError("La recolección de blobs requiere un rol con BYPASSRLS (ver RUNBOOK)")
+
+    limite = time.time() - gracia_segundos
+    revisados = borrados = 0
+    candidatos = []
+
+    async def procesar(shas):
+        nonlocal borrados
+        rows = await conn.fetch(_REFERENCIADOS_QUERY, shas)
+        vivos = {r["sha256"] for r in rows}
+        for sha in shas:
+            if sha in vivos or await conn.fetchval(_REFERENCIADO_QUERY, sha):
+                continue
+            if await store.delete_si_anterior(sha, limite):
+                borrados += 1
+
+    async for sha, mtime in store.list_blobs():
+        revisados += 1
+        if mtime < limite:
+            candidatos.append(sha)
+        if len(candidatos) >= lote:
+            await procesar(candidatos)
+            candidatos = []
+    if candidatos:
+        await procesar(candidatos)
+
+    return {"revisados": revisados, "borrados": borrados}
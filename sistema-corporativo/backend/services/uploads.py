@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from prometheus_client import Counter, Gauge, Histogram
+
+MB = 1024 * 1024
+
+# Configuración (MB por archivo / por request, tamaño de chunk y threads de I/O)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", 1024)) * 1024
+MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_MB", 50)) * MB
+MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_MB", 200)) * MB
+
+# Pool acotado: el I/O de disco nunca corre en el event loop y un pico de
+# subidas no puede acaparar el threadpool por defecto de Starlette
+_io_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("UPLOAD_IO_THREADS", 4)),
+    thread_name_prefix="upload-io",
+)
+
+# Métricas de progreso y throughput (expuestas en /metrics)
+UPLOADS_EN_CURSO = Gauge("uploads_in_progress", "Archivos que se están escribiendo a disco")
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes de adjuntos escritos a disco")
+UPLOAD_ARCHIVOS = Counter("upload_files_total", "Adjuntos procesados", ["resultado"])
+UPLOAD_DURACION = Histogram(
+    "upload_duration_seconds",
+    "Tiempo de escritura por adjunto",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+UPLOAD_THROUGHPUT = Histogram(
+    "upload_throughput_bytes_per_second",
+    "Throughput de escritura por adjunto",
+    buckets=(1 * MB, 5 * MB, 10 * MB, 25 * MB, 50 * MB, 100 * MB, 250 * MB, 500 * MB),
+)
+
+
+@dataclass
+class StoredUpload:
+    path: Path
+    url: str
+    nombre: str
+    mime_type: Optional[str]
+    tamano: int
+    sha256: str
+
+
+class UploadBudget:
+    """Límite de bytes acumulados entre todos los archivos de un mismo request."""
+
+    def __init__(self, max_bytes: int = MAX_REQUEST_BYTES):
+        self.max_bytes = max_bytes
+        self.usados = 0
+
+    def consumir(self, n: int):
+        self.usados += n
+        if self.usados > self.max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"La solicitud excede el máximo de {self.max_bytes // MB} MB en adjuntos",
+            )
+
+
+def _escribir_chunk(f, hasher, chunk: bytes):
+    # hashlib libera el GIL para buffers grandes: hash y escritura corren fuera del loop
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+def _cerrar(f):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+async def guardar_upload(
+    archivo: UploadFile,
+    destino: Path,
+    presupuesto: UploadBudget,
+    max_file_bytes: int = MAX_FILE_BYTES,
+) -> StoredUpload:
+    """
+    Copia un UploadFile a `destino` por chunks sin bloquear el event loop.
+    Calcula SHA-256 y tamaño al vuelo, escribe a un nombre temporal y solo
+    lo publica con un rename atómico cuando el archivo está completo.
+    """
+    loop = asyncio.get_running_loop()
+    destino.mkdir(parents=True, exist_ok=True)
+
+    ext = Path(archivo.filename).suffix
+    file_id = f"{uuid.uuid4()}{ext}"
+    final_path = destino / file_id
+    tmp_path = destino / f".{file_id}.part"
+
+    hasher = hashlib.sha256()
+    tamano = 0
+    inicio = time.perf_counter()
+    UPLOADS_EN_CURSO.inc()
+    f = await loop.run_in_executor(_io_executor, open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await archivo.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            tamano += len(chunk)
+            if tamano > max_file_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"El archivo '{archivo.filename}' excede el máximo de {max_file_bytes // MB} MB",
+                )
+            presupuesto.consumir(len(chunk))
+            await loop.run_in_executor(_io_executor, _escribir_chunk, f, hasher, chunk)
+            UPLOAD_BYTES.inc(len(chunk))
+
+        await loop.run_in_executor(_io_executor, _cerrar, f)
+        await loop.run_in_executor(_io_executor, os.replace, tmp_path, final_path)
+    except BaseException:
+        UPLOAD_ARCHIVOS.labels(resultado="error").inc()
+        f.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        UPLOADS_EN_CURSO.dec()
+
+    duracion = time.perf_counter() - inicio
+    UPLOAD_ARCHIVOS.labels(resultado="ok").inc()
+    UPLOAD_DURACION.observe(duracion)
+    if duracion > 0:
+        UPLOAD_THROUGHPUT.observe(tamano / duracion)
+
+    return StoredUpload(
+        path=final_path,
+        url=f"/{destino.as_posix().strip('/')}/{file_id}",
+        nombre=archivo.filename,
+        mime_type=archivo.content_type,
+        tamano=tamano,
+        sha256=hasher.hexdigest(),
+    )
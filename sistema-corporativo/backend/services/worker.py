@@ -1,6 +1,18 @@
 import os
-from arq import create_pool
+import logging
+from dotenv import load_dotenv
+
+# Punto de entrada del worker (arq services.worker.WorkerSettings): el .env se
+# carga antes de importar la app, cuya configuración se lee al importar
+load_dotenv()
+
+from arq import create_pool, cron
 from arq.connections import RedisSettings
+from database.async_db import init_db_pool, db_session
+from services.documentos import expirar_documentos
+from services.storage import get_blob_store, recolectar_blobs, rol_ve_todos_los_tenants
+
+logger = logging.getLogger("sistema_corporativo")
 
 # Herramienta para encolar tareas desde FastAPI
 async def get_worker_pool():
@@ -22,9 +34,48 @@ async def generate_pdf_report(ctx, tenant_id: str, report_data: dict):
     # Lógica pydf2 / reportlab aquí
     return {"status": "completed", "url": "..."}
 
+async def expire_documentos_task(ctx):
+    """
+    Máquina de estados del buzón (en-proceso -> pendiente -> omitido).
+    Corre sin tenant en contexto: el rol del worker debe poder ver todos los tenants.
+    """
+    batch_size = int(os.getenv("EXPIRY_SWEEP_BATCH", 500))
+    async with db_session() as conn:
+        resultado = await expirar_documentos(conn, batch_size=batch_size)
+    logger.info(f"Barrido de expiración completado: {resultado}")
+    return resultado
+
+async def gc_blobs_task(ctx):
+    """
+    Elimina adjuntos del almacén que ya no referencia ninguna fila de documento_adjuntos.
+    Requiere un rol con BYPASSRLS: recolectar_blobs no borra nada sin él.
+    """
+    gracia = float(os.getenv("STORAGE_GC_GRACE_HOURS", 24)) * 3600
+    async with db_session() as conn:
+        resultado = await recolectar_blobs(conn, get_blob_store(), gracia_segundos=gracia)
+    logger.info(f"Recolección de blobs completada: {resultado}")
+    return resultado
+
+async def startup(ctx):
+    await init_db_pool()
+    # Las tareas de mantenimiento corren sin tenant: con RLS solo ven todo con BYPASSRLS
+    async with db_session() as conn:
+        if not await rol_ve_todos_los_tenants(conn):
+            logger.error(
+                "El rol de BD del worker no tiene BYPASSRLS: la recolección de blobs "
+                "no correrá y el barrido de expiración no verá todos los tenants"
+            )
+
 class WorkerSettings:
     """Configuración del worker de ARQ."""
     functions = [send_email_task, generate_pdf_report]
+    cron_jobs = [
+        # Cada 5 minutos; la transición más corta es de 3 días, no hace falta más
+        cron(expire_documentos_task, minute=set(range(0, 60, 5)), run_at_startup=True),
+        # Diario en horario de baja carga
+        cron(gc_blobs_task, hour=3, minute=30),
+    ]
+    on_startup = startup
     redis_settings = RedisSettings(
         host=os.getenv("REDIS_HOST", "localhost"),
         port=int(os.getenv("REDIS_PORT", 6379))
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from uuid import UUID
 
@@ -23,4 +23,10 @@ class UsuarioResponse(UsuarioBase):
         from_attributes = True
 
 class SwitchOrgRequest(BaseModel):
-    organization_id: UUID
\ No newline at end of file
+    organization_id: UUID
+
+class DiagnosticoConsultasUpdate(BaseModel):
+    activo: Optional[bool] = None
+    umbral_ms: Optional[float] = Field(None, gt=0)
+    muestreo_explain: Optional[float] = Field(None, ge=0, le=1)
+    explain_intervalo: Optional[float] = Field(None, ge=0)
@@ -0,0 +1,67 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services import activity
+
+
+class _FakeConn:
+    def __init__(self, falla=False):
+        self.llamadas = []
+        self.falla = falla
+
+    async def execute(self, query, ids, tss):
+        if self.falla:
+            raise ConnectionError("sin conexión")
+        self.llamadas.append((query, ids, tss))
+
+
+def _sesion(conn):
+    @asynccontextmanager
+    async def db_session():
+        yield conn
+    return db_session
+
+
+def test_agrupa_y_conserva_el_mas_reciente(monkeypatch):
+    conn = _FakeConn()
+    monkeypatch.setattr(activity, "db_session", _sesion(conn))
+    rec = activity.ActivityRecorder("test", "profiles", "ultima_conexion")
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    rec.registrar("u1", t0)
+    rec.registrar("u1", t0 + timedelta(seconds=5))
+    rec.registrar("u1", t0 + timedelta(seconds=1))
+    rec.registrar("u2", t0)
+
+    assert asyncio.run(rec.flush()) == 2
+    (query, ids, tss), = conn.llamadas
+    assert "unnest($1::uuid[], $2::timestamptz[])" in query
+    assert dict(zip(ids, tss)) == {"u1": t0 + timedelta(seconds=5), "u2": t0}
+    assert asyncio.run(rec.flush()) == 0
+
+
+def test_error_reencola_y_stop_vacia(monkeypatch):
+    conn = _FakeConn(falla=True)
+    monkeypatch.setattr(activity, "db_session", _sesion(conn))
+    rec = activity.ActivityRecorder("test", "profiles", "ultima_conexion", intervalo=60)
+    rec.registrar("u1")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(rec.flush())
+
+    conn.falla = False
+
+    async def run():
+        rec.start()
+        await rec.stop()
+
+    asyncio.run(run())
+    assert conn.llamadas and conn.llamadas[0][1] == ["u1"]
+
+
+def test_identificadores_invalidos():
+    with pytest.raises(ValueError):
+        activity.ActivityRecorder("x", "profiles; DROP TABLE x", "ultima_conexion")
@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se importan al primer uso o en el startup, no al importar la app
+DIFERIDOS = ("redis", "jose", "passlib", "concurrent.futures.process")
+
+
+def test_importar_main_no_carga_dependencias_diferidas():
+    codigo = f"import sys, main; print(','.join(m for m in {DIFERIDOS!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", codigo], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == ""
+
+
+def test_jwt_sigue_disponible_desde_security():
+    from auth import security
+
+    assert security.jwt.decode is not None and issubclass(security.JWTError, Exception)
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from auth.admission import AuthAdmission
+
+
+def _intentar(admision, username, ip, password="clave"):
+    async def run():
+        async with admision.admitir(username, ip, password):
+            pass
+    asyncio.run(run())
+
+
+def test_limites_por_usuario_ip_y_presupuesto():
+    admision = AuthAdmission(presupuesto=3, por_usuario=1, por_ip=2)
+
+    async def run():
+        async with admision.admitir("Ana", "1.1.1.1"):
+            with pytest.raises(HTTPException) as exc:
+                async with admision.admitir("ana ", "2.2.2.2"):
+                    pass
+            assert exc.value.status_code == 429
+
+            async with admision.admitir("beto", "1.1.1.1"):
+                with pytest.raises(HTTPException) as exc:
+                    async with admision.admitir("carla", "1.1.1.1"):
+                        pass
+                assert exc.value.status_code == 429
+
+                async with admision.admitir("carla", "3.3.3.3"):
+                    with pytest.raises(HTTPException) as exc:
+                        async with admision.admitir("dario", "4.4.4.4"):
+                            pass
+                    assert exc.value.status_code == 503
+                    assert exc.value.headers["Retry-After"]
+
+    asyncio.run(run())
+    # Todo se libera al salir, incluso tras excepciones
+    assert admision.en_curso == 0 and not admision._usuarios and not admision._ips
+    _intentar(admision, "ana", "1.1.1.1")
+
+
+def test_password_largo_se_rechaza_sin_hashear():
+    admision = AuthAdmission()
+    with pytest.raises(HTTPException) as exc:
+        _intentar(admision, "ana", "1.1.1.1", password="x" * 10_000)
+    assert exc.value.status_code == 400
+    assert admision.en_curso == 0
+
+
+def test_login_rechazado_no_toma_conexion(monkeypatch):
+    # Sin dependencia de BD: la sesión se abre recién dentro de `admitir`
+    from fastapi.testclient import TestClient
+
+    import main
+    from routers import auth_router
+
+    def sin_bd():
+        raise AssertionError("el rechazo no debe tomar una conexión")
+
+    monkeypatch.setattr(main, "db_session", sin_bd)
+    monkeypatch.setattr(auth_router, "db_session", sin_bd)
+    monkeypatch.setattr(main.auth_admission, "presupuesto", 0)
+    monkeypatch.setattr("services.rate_limiter.RATE_LIMIT_ENABLED", False)
+    cliente = TestClient(main.app)
+
+    r = cliente.post("/login", data={"username": "ana", "password": "clave"})
+    assert r.status_code == 503 and "Retry-After" in r.headers
+    r = cliente.post("/auth/login", json={"username": "ana", "password": "clave"})
+    assert r.status_code == 503
@@ -0,0 +1,60 @@
+import time
+from datetime import timedelta
+
+import pytest
+from jose import JWTError, jwt
+from starlette.requests import Request
+
+from auth import security
+
+
+def _request(token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.fixture(autouse=True)
+def _cache_limpio():
+    security.claims_cache.clear()
+    yield
+    security.claims_cache.clear()
+
+
+def test_decode_usa_cache(monkeypatch):
+    token = security.create_access_token({"sub": "u1", "tenant_id": "t1"})
+    llamadas = []
+    original = jwt.decode
+    monkeypatch.setattr(security.jwt, "decode", lambda *a, **k: llamadas.append(1) or original(*a, **k))
+
+    assert security.decode_token(token)["sub"] == "u1"
+    assert security.decode_token(token)["sub"] == "u1"
+    assert len(llamadas) == 1
+
+
+def test_cache_expira_con_exp_y_es_acotado():
+    cache = security.ClaimsCache(maxsize=2)
+    cache.put("vencido", {"sub": "x", "exp": time.time() - 1})
+    assert cache.get("vencido") is None
+
+    for t in ("a", "b", "c"):
+        cache.put(t, {"sub": t, "exp": time.time() + 60})
+    assert len(cache) == 2 and cache.get("a") is None and cache.get("c")["sub"] == "c"
+
+    cache.put("sin-exp", {"sub": "x"})
+    assert cache.get("sin-exp") is None
+
+
+def test_token_invalido_y_una_decodificacion_por_request():
+    malo = jwt.encode({"sub": "u1", "exp": time.time() + 60}, "otra-clave", algorithm="HS256")
+    with pytest.raises(JWTError):
+        security.decode_token(malo)
+
+    request = _request(malo)
+    assert security.get_request_claims(request) is None
+    assert request.state.claims_error
+
+    token = security.create_access_token({"sub": "u2"}, expires_delta=timedelta(minutes=5))
+    request = _request(token)
+    claims = security.get_request_claims(request)
+    assert claims["sub"] == "u2" and security.get_request_claims(request) is claims
+    assert security.get_request_claims(_request()) is None
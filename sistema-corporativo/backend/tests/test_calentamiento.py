@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from database import sentencias
+from database.calentamiento import PoolWarmup
+
+
+class _FakeConn:
+    def __init__(self, ejecutadas):
+        self.ejecutadas = ejecutadas
+
+    async def fetch(self, sql, *args):
+        self.ejecutadas.append((sql, args))
+        return []
+
+
+class _FakePool:
+    def __init__(self, demora=0.05):
+        self.demora = demora
+        self.ejecutadas = []
+        self.liberadas = 0
+
+    def get_max_size(self):
+        return 4
+
+    async def acquire(self):
+        await asyncio.sleep(self.demora)  # handshake
+        return _FakeConn(self.ejecutadas)
+
+    async def release(self, conn):
+        self.liberadas += 1
+
+
+def test_abre_en_paralelo_y_ejecuta_calientes(monkeypatch):
+    monkeypatch.setattr(sentencias, "CONSULTAS_CALIENTES", {
+        "lectura": sentencias.Consulta("lectura", "SELECT id FROM documentos WHERE tenant_id = $1 AND id = $2"),
+        "escritura": sentencias.Consulta("escritura", "UPDATE documentos SET leido = true WHERE id = $1"),
+    })
+    pool = _FakePool()
+    warmup = PoolWarmup()
+
+    async def run():
+        warmup.start(pool, objetivo=10, timeout=5)
+        assert not warmup.listo
+        await warmup._tarea
+
+    inicio = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - inicio < 4 * pool.demora  # no en serie
+    assert warmup.listo and pool.liberadas == 4  # acotado al max_size
+    assert pool.ejecutadas == [(sentencias.CONSULTAS_CALIENTES["lectura"].sql, (None, None))] * 4
+
+
+def test_timeout_declara_listo_con_lo_que_haya(monkeypatch):
+    monkeypatch.setattr(sentencias, "CONSULTAS_CALIENTES", {})
+    pool = _FakePool(demora=10)
+    warmup = PoolWarmup()
+
+    async def run():
+        warmup.start(pool, objetivo=2, timeout=0.05)
+        await warmup._tarea
+
+    asyncio.run(run())
+    assert warmup.listo and pool.liberadas == 0
+
+
+def test_readiness_en_calentamiento_no_pide_conexion(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    def sin_bd():
+        raise AssertionError("el probe no debe esperar un cupo del pool mientras calienta")
+
+    monkeypatch.setattr(main, "db_session", sin_bd)
+    monkeypatch.setattr(main.pool_warmup, "listo", False)
+
+    r = TestClient(main.app).get("/health/ready")
+    assert r.status_code == 503 and "warming up" in r.json()["detail"]
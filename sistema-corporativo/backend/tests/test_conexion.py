@@ -0,0 +1,91 @@
+import asyncio
+
+import asyncpg
+
+from database.conexion import Conexion, _literal
+
+
+def _conexion(monkeypatch):
+    enviados = []
+
+    async def execute(self, query, *args, timeout=None):
+        enviados.append(query)
+        return "OK"
+
+    monkeypatch.setattr(asyncpg.Connection, "execute", execute)
+    monkeypatch.setattr(asyncpg.Connection, "get_reset_query", lambda self: "RESET ALL;")
+    # Instancia sin socket: solo se ejercita la lógica propia de Conexion
+    conn = Conexion.__new__(Conexion)
+    conn._protocol = None
+    conn._aborted = True
+    conn._contexto_begin = None
+    conn._sin_reset = False
+    return conn, enviados
+
+
+def test_set_local_viaja_con_el_begin(monkeypatch):
+    conn, enviados = _conexion(monkeypatch)
+    conn._contexto_begin = "SET LOCAL app.current_tenant_id = 't1';"
+
+    async def run():
+        await conn.execute("BEGIN;")
+        await conn.execute("BEGIN;")
+
+    asyncio.run(run())
+    assert enviados == ["BEGIN; SET LOCAL app.current_tenant_id = 't1';", "BEGIN;"]
+
+
+def test_begin_real_de_asyncpg_lleva_el_set_local(monkeypatch):
+    # Conexion.execute reconoce el BEGIN por su texto, que es interno de
+    # asyncpg.Transaction.start(): si una versión nueva lo cambia, esto falla
+    conn, enviados = _conexion(monkeypatch)
+
+    class _Protocolo:
+        def is_connected(self):
+            return True
+
+        def is_in_transaction(self):
+            return False
+
+    conn._protocol = _Protocolo()
+    conn._aborted = False
+    conn._top_xact = None
+    conn._pool_release_ctr = 0
+    conn._contexto_begin = "SET LOCAL app.current_tenant_id = 't1';"
+
+    try:
+        asyncio.run(asyncpg.transaction.Transaction(conn, None, False, False).start())
+    finally:
+        conn._aborted = True  # sin socket: que __del__ no intente cerrarla
+    assert enviados == ["BEGIN; SET LOCAL app.current_tenant_id = 't1';"]
+
+
+def test_reset_omitido_una_sola_vez(monkeypatch):
+    conn, _ = _conexion(monkeypatch)
+    conn.omitir_reset()
+    assert conn.get_reset_query() == ""
+    assert conn.get_reset_query() == "RESET ALL;"
+
+
+def test_literal_escapa_comillas():
+    assert _literal("a'; DROP TABLE x; --") == "'a''; DROP TABLE x; --'"
+
+
+def test_dependencias_de_bd_terminan_antes_de_responder():
+    # Con scope="request" el COMMIT de db_session corre después de enviar la respuesta
+    import main
+    from database.async_db import get_db_connection, get_read_connection
+
+    def dependencias(dependant):
+        for sub in dependant.dependencies:
+            yield sub
+            yield from dependencias(sub)
+
+    revisadas = 0
+    for ruta in main.app.routes:
+        dependant = getattr(ruta, "dependant", None)
+        for dep in dependencias(dependant) if dependant else ():
+            if dep.call in (get_db_connection, get_read_connection):
+                assert dep.scope == "function", ruta.path
+                revisadas += 1
+    assert revisadas > 0
@@ -0,0 +1,24 @@
+from services.contadores import agregar_resumen
+
+
+def _fila(tipo, estado, leido, total):
+    return {"destino_tipo": tipo, "estado": estado, "leido": leido, "total": total}
+
+
+def test_agregar_resumen():
+    resumen = agregar_resumen([
+        _fila("usuario", "en-proceso", False, 3),
+        _fila("usuario", "en-proceso", True, 2),
+        _fila("gerencia", "pendiente", False, 4),
+        _fila("gerencia", "en-proceso", True, 1),
+    ])
+    assert resumen["total"] == 10
+    assert resumen["no_leidos"] == 7
+    assert resumen["por_estado"] == {"en-proceso": 6, "pendiente": 4}
+    assert resumen["personal"] == {"total": 5, "no_leidos": 3, "por_estado": {"en-proceso": 5}}
+    assert resumen["gerencia"]["no_leidos"] == 4
+
+
+def test_agregar_resumen_vacio():
+    resumen = agregar_resumen([])
+    assert resumen["total"] == 0 and resumen["no_leidos"] == 0 and resumen["por_estado"] == {}
@@ -0,0 +1,77 @@
+import asyncio
+import contextlib
+
+from services import correlativos as correlativos_module
+from services.correlativos import CorrelativoAllocator, formatear_correlativo, _parse_bloques
+
+
+class _FakeCounterConn:
+    """Simula el UPSERT ... RETURNING ultimo sobre documento_correlativos."""
+
+    def __init__(self):
+        self.contadores = {}
+        self.llamadas = 0
+
+    async def fetchval(self, query, tenant_id, siglas, anio, cantidad):
+        self.llamadas += 1
+        clave = (tenant_id, siglas, anio)
+        self.contadores[clave] = self.contadores.get(clave, 0) + cantidad
+        return self.contadores[clave]
+
+
+def test_formato_y_config_bloques():
+    assert formatear_correlativo("TIC", 7, 2026) == "TIC-007-2026"
+    assert _parse_bloques("TIC=50, GG=20,COR=1,basura") == {"TIC": 50, "GG": 20}
+
+
+def test_sin_bloque_avanza_en_la_conexion_del_documento():
+    conn = _FakeCounterConn()
+    allocator = CorrelativoAllocator(bloques={})
+
+    async def run():
+        return [await allocator.generar(conn, "t1", "GG", 2026) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["GG-001-2026", "GG-002-2026", "GG-003-2026"]
+    assert conn.llamadas == 3
+
+
+def test_bloques_un_round_trip_cada_n(monkeypatch):
+    conn_bloques = _FakeCounterConn()
+
+    @contextlib.asynccontextmanager
+    async def fake_session():
+        yield conn_bloques
+
+    monkeypatch.setattr(correlativos_module, "db_session", fake_session)
+    allocator = CorrelativoAllocator(bloques={"TIC": 5})
+
+    async def run():
+        return await asyncio.gather(*[allocator.reservar("t1", "TIC", 2026) for _ in range(12)])
+
+    numeros = asyncio.run(run())
+    assert sorted(numeros) == list(range(1, 13))
+    assert conn_bloques.llamadas == 3
+
+
+def test_generar_nunca_abre_otra_sesion(monkeypatch):
+    # La conexión del documento ya está tomada: una sesión anidada podría quedar
+    # esperando un cupo de admisión que nunca se libera
+    @contextlib.asynccontextmanager
+    async def sin_sesion():
+        raise AssertionError("generar() no debe tomar otra conexión")
+        yield
+
+    monkeypatch.setattr(correlativos_module, "db_session", sin_sesion)
+    conn = _FakeCounterConn()
+    allocator = CorrelativoAllocator(bloques={"TIC": 5})
+
+    async def run():
+        assert await allocator.reservar("t1", "GG", 2026) is None
+        return [
+            await allocator.generar(conn, "t1", "TIC", 2026, reservado=41),
+            await allocator.generar(conn, "t1", "TIC", 2026),
+        ]
+
+    # Sin número reservado avanza de a uno en la conexión del documento
+    assert asyncio.run(run()) == ["TIC-041-2026", "TIC-001-2026"]
+    assert conn.llamadas == 1
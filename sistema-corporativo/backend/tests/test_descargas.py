@@ -0,0 +1,56 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import formatdate
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import FileResponse
+
+from services import descargas
+from services.storage import LocalBlobStore
+
+
+def _request(headers=None):
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def _adjunto(sha, fecha):
+    return {
+        "id": 1, "url_archivo": f"/uploads/blobs/{sha}", "nombre_archivo": "oficio.pdf",
+        "mime_type": "application/pdf", "tamano_bytes": 8, "sha256": sha, "fecha_creacion": fecha,
+    }
+
+
+def test_responder_adjunto_etag_y_304(tmp_path, monkeypatch):
+    store = LocalBlobStore(tmp_path / "blobs")
+    sha = hashlib.sha256(b"circular").hexdigest()
+    store.path(sha).parent.mkdir(parents=True)
+    store.path(sha).write_bytes(b"circular")
+    monkeypatch.setattr(descargas, "get_blob_store", lambda: store)
+    fecha = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    resp = descargas.responder_adjunto(_request(), _adjunto(sha, fecha))
+    assert isinstance(resp, FileResponse)
+    assert resp.headers["etag"] == f'"{sha}"'
+    assert "immutable" in resp.headers["cache-control"]
+    assert resp.headers["content-type"] == "application/pdf"
+
+    resp = descargas.responder_adjunto(_request({"If-None-Match": f'"{sha}"'}), _adjunto(sha, fecha))
+    assert resp.status_code == 304
+
+    desde = formatdate(fecha.timestamp(), usegmt=True)
+    resp = descargas.responder_adjunto(_request({"If-Modified-Since": desde}), _adjunto(sha, fecha))
+    assert resp.status_code == 304
+
+    # If-None-Match tiene prioridad sobre If-Modified-Since
+    resp = descargas.responder_adjunto(
+        _request({"If-None-Match": '"otro"', "If-Modified-Since": desde}), _adjunto(sha, fecha)
+    )
+    assert resp.status_code == 200
+
+
+def test_ruta_legacy_no_sale_de_uploads():
+    with pytest.raises(HTTPException):
+        descargas._ruta_legacy("/uploads/../main.py")
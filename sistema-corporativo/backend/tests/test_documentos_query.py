@@ -0,0 +1,168 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from services import documentos
+
+
+def test_cursor_roundtrip_int_and_uuid():
+    fecha = datetime(2026, 1, 15, 10, 30, tzinfo=timezone.utc)
+    for doc_id in (42, uuid.uuid4()):
+        cursor = documentos.encode_cursor(fecha, doc_id)
+        assert documentos.decode_cursor(cursor) == (fecha, doc_id)
+
+
+def test_cursor_invalido():
+    with pytest.raises(ValueError):
+        documentos.decode_cursor("no-es-un-cursor")
+
+
+def test_proyeccion_omite_joins_y_columnas_pesadas():
+    columnas = documentos.parse_fields("name,signaturestatus")
+    assert columnas == ["id", "fecha_creacion", "name", "signaturestatus"]
+
+    query, args = documentos.build_list_query(columnas, limit=20)
+    assert "contenido" not in query
+    assert "JOIN" not in query
+    assert "documento_adjuntos" not in query
+    assert query.rstrip().endswith("LIMIT $1")
+    assert args == [21]
+
+
+def test_proyeccion_en_orden_fijo():
+    a = documentos.build_list_query(documentos.parse_fields("signaturestatus,name,archivos"), limit=5)
+    b = documentos.build_list_query(documentos.parse_fields("archivos, NAME,signaturestatus,name"), limit=5)
+    assert a == b
+    assert documentos.parse_fields("archivos,name") == ["id", "fecha_creacion", "name", "archivos"]
+
+
+def test_fields_desconocidos():
+    with pytest.raises(ValueError):
+        documentos.parse_fields("id,password_hash")
+
+
+def test_query_keyset_con_tenant_y_cursor():
+    tenant = str(uuid.uuid4())
+    cursor = documentos.encode_cursor(datetime(2026, 1, 1, tzinfo=timezone.utc), 7)
+    query, args = documentos.build_list_query(
+        documentos.parse_fields(None), tenant_id=tenant, cursor=cursor, limit=10
+    )
+    assert "d.tenant_id = $1" in query
+    assert "(d.fecha_creacion, d.id) < ($2, $3)" in query
+    assert "ORDER BY d.fecha_creacion DESC, d.id DESC" in query
+    assert args[0] == uuid.UUID(tenant) and args[2] == 7 and args[3] == 11
+
+
+def test_next_cursor_solo_si_hay_fila_extra():
+    fecha = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = [{"id": i, "fecha_creacion": fecha} for i in range(3, 0, -1)]
+    assert documentos.next_cursor(rows, 3) is None
+    assert documentos.next_cursor(rows, 2) == documentos.encode_cursor(fecha, 2)
+
+
+class _FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def transaction(self):
+        return _FakeTransaction()
+
+    async def fetch(self, query, *args):
+        # Consulta batch de adjuntos: un adjunto para el documento 1
+        return [{
+            "id": 10, "documento_id": 1, "url_archivo": "/uploads/a.pdf",
+            "nombre_archivo": "a.pdf", "mime_type": "application/pdf",
+            "tamano_bytes": 123, "sha256": None, "fecha_creacion": None,
+        }]
+
+    async def cursor(self, query, *args, prefetch=None):
+        for r in self.rows:
+            yield r
+
+
+def _collect_stream(monkeypatch, rows, **kwargs):
+    import asyncio
+    import contextlib
+    import json
+
+    @contextlib.asynccontextmanager
+    async def fake_session(user_id=None):
+        yield _FakeConn(rows)
+
+    monkeypatch.setattr(documentos, "read_session", fake_session)
+
+    async def run():
+        columnas = documentos.parse_fields(None)
+        return "".join([chunk async for chunk in documentos.stream_documentos("SELECT", [], columnas, **kwargs)])
+
+    return asyncio.run(run()), json
+
+
+def test_stream_ndjson_y_array(monkeypatch):
+    fecha = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = [{"id": i, "fecha_creacion": fecha, "fileurl": None} for i in range(3)]
+    rows[2]["fileurl"] = "/uploads/legacy.pdf"
+
+    body, json = _collect_stream(monkeypatch, rows, ndjson=True)
+    docs = [json.loads(l) for l in body.strip().split("\n")]
+    assert [d["id"] for d in docs] == [0, 1, 2]
+    assert docs[0]["archivos"] == [] and docs[0]["adjuntos"] == []
+    assert docs[1]["archivos"] == ["/documentos/adjuntos/10"]
+    assert docs[1]["adjuntos"][0]["mime_type"] == "application/pdf"
+    assert docs[2]["archivos"] == ["/documentos/2/archivo"]
+    # Nunca la ruta en disco: /uploads ya no se sirve como estático
+    assert docs[2]["fileurl"] == "/documentos/2/archivo" and docs[0]["fileurl"] is None
+
+    body, json = _collect_stream(monkeypatch, rows, ndjson=False, limit=2)
+    assert [d["id"] for d in json.loads(body)] == [0, 1]
+
+
+class _FakeSweepConn:
+    """Simula _SWEEP_QUERY: cada UPDATE toma hasta `batch_size` filas del estado origen."""
+
+    def __init__(self, pendientes):
+        self.pendientes = dict(pendientes)
+        self.llamadas = []
+
+    async def execute(self, query, origen, destino, dias, batch_size):
+        assert query is documentos._SWEEP_QUERY
+        self.llamadas.append((origen, destino, dias, batch_size))
+        afectadas = min(self.pendientes.get(origen, 0), batch_size)
+        self.pendientes[origen] = self.pendientes.get(origen, 0) - afectadas
+        # Las filas pasan al estado destino y pueden caer en la transición siguiente
+        self.pendientes[destino] = self.pendientes.get(destino, 0) + afectadas
+        return f"UPDATE {afectadas}"
+
+
+def test_expiracion_en_lotes_hasta_lote_corto():
+    import asyncio
+
+    conn = _FakeSweepConn({"en-proceso": 5, "pendiente": 3})
+    resultado = asyncio.run(documentos.expirar_documentos(conn, batch_size=2))
+
+    # en-proceso: lotes de 2, 2 y uno corto de 1; pendiente: 3 + 5 movidas = 8 -> 2,2,2,2,0
+    assert resultado == {"en-proceso->pendiente": 5, "pendiente->omitido": 8}
+    assert [c[0] for c in conn.llamadas] == ["en-proceso"] * 3 + ["pendiente"] * 5
+    assert conn.llamadas[0] == ("en-proceso", "pendiente", 3, 2)
+    assert conn.llamadas[-1] == ("pendiente", "omitido", 6, 2)
+    assert conn.pendientes["omitido"] == 8
+
+
+def test_expiracion_sin_filas_un_solo_lote_por_transicion():
+    import asyncio
+
+    conn = _FakeSweepConn({})
+    assert asyncio.run(documentos.expirar_documentos(conn)) == {
+        "en-proceso->pendiente": 0,
+        "pendiente->omitido": 0,
+    }
+    assert len(conn.llamadas) == 2
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+
+from prometheus_client import REGISTRY
+
+from database import instrumentacion
+from database import sentencias
+
+
+def _valor(nombre, **labels):
+    return REGISTRY.get_sample_value(nombre, labels) or 0
+
+
+async def _resultado(valor, demora=0.0):
+    if demora:
+        await asyncio.sleep(demora)
+    return valor
+
+
+def test_nombre_estable_y_nombre_de_consulta_registrada():
+    a = instrumentacion.nombre_consulta("SELECT id FROM documentos WHERE id = $1")
+    b = instrumentacion.nombre_consulta("SELECT id\n  FROM documentos\n WHERE id = $1")
+    assert a == b and a.startswith("select:documentos:")
+    sentencias.consulta_caliente("prueba_nombrada", "SELECT 1 FROM gerencias")
+    sentencias.CONSULTAS_CALIENTES.pop("prueba_nombrada")
+    assert instrumentacion.nombre_consulta("SELECT 1 FROM gerencias") == "prueba_nombrada"
+    assert instrumentacion.es_control("BEGIN ISOLATION LEVEL READ COMMITTED; SET LOCAL x = '1';")
+
+
+def test_histograma_y_log_de_consulta_lenta(monkeypatch, caplog):
+    monkeypatch.setattr(instrumentacion.config, "umbral_ms", 1)
+    monkeypatch.setattr(instrumentacion.config, "muestreo_explain", 1.0)
+    planes = []
+
+    async def capturar(nombre, sql, args):
+        planes.append(nombre)
+
+    monkeypatch.setattr(instrumentacion, "_capturar_plan", capturar)
+    sql = "UPDATE documentos SET estado = $1 WHERE id = $2"
+
+    async def run():
+        return await instrumentacion.medir(sql, ("x", 1), _resultado("UPDATE 1", 0.01))
+
+    with caplog.at_level(logging.WARNING, logger="sistema_corporativo"):
+        assert asyncio.run(run()) == "UPDATE 1"
+    nombre = instrumentacion.nombre_consulta(sql)
+    assert _valor("db_query_seconds_count", consulta=nombre) == 1
+    assert any(getattr(r, "query", None) == nombre for r in caplog.records)
+    assert planes == []  # EXPLAIN ANALYZE nunca sobre escrituras
+
+
+def test_desactivado_no_mide(monkeypatch):
+    monkeypatch.setattr(instrumentacion.config, "activo", False)
+    sql = "SELECT nombre FROM roles"
+    assert asyncio.run(instrumentacion.medir(sql, (), _resultado([]))) == []
+    assert _valor("db_query_seconds_count", consulta=instrumentacion.nombre_consulta(sql)) == 0
+
+
+def test_sql_dinamica_no_crece_sin_limite():
+    registrados = len(instrumentacion._registrados)
+    for i in range(3000):
+        sentencias.Consulta("documentos_listado", f"SELECT c{i} FROM documentos")
+        instrumentacion.nombre_consulta(f"SELECT c{i} FROM documentos")
+    assert len(instrumentacion._registrados) == registrados
+    assert len(instrumentacion._nombres) <= 2048
+
+
+def test_sql_por_request_con_nombre_fijo_es_una_sola_serie(monkeypatch):
+    monkeypatch.setattr(instrumentacion.config, "umbral_ms", 0)
+    monkeypatch.setattr(instrumentacion.config, "muestreo_explain", 1.0)
+    monkeypatch.setattr(instrumentacion.config, "explain_intervalo", 0)
+
+    async def capturar(nombre, sql, args):
+        pass
+
+    monkeypatch.setattr(instrumentacion, "_capturar_plan", capturar)
+    antes = _valor("db_query_seconds_count", consulta="prueba_listado")
+
+    async def run():
+        for i in range(50):
+            sql = f"SELECT c{i} FROM documentos"
+            await instrumentacion.medir(sql, (), _resultado([]), nombre="prueba_listado")
+        # Nombres libres (consultas inline lentas): el registro de EXPLAIN es un LRU
+        for i in range(instrumentacion._MAX_NOMBRES + 10):
+            instrumentacion._consulta_lenta(f"select:x:{i}", "SELECT 1", (), 1.0)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert _valor("db_query_seconds_count", consulta="prueba_listado") == antes + 50
+    assert len(instrumentacion._ultimo_explain) <= instrumentacion._MAX_NOMBRES
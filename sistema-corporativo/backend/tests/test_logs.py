@@ -0,0 +1,108 @@
+import json
+import logging
+import queue
+import sys
+
+from prometheus_client import REGISTRY
+
+from middleware.context import tenant_id_var
+from services import logs
+
+
+def _registro(nivel=logging.INFO, nombre="sistema_corporativo.contexto", linea=10, exc_info=None):
+    return logging.LogRecord(nombre, nivel, "/app/x.py", linea, "hola %s", ("mundo",), exc_info)
+
+
+def _descartados(motivo):
+    return REGISTRY.get_sample_value("log_messages_dropped_total", {"motivo": motivo}) or 0
+
+
+def test_muestreo_solo_afecta_info_de_loggers_configurados():
+    filtro = logs.MuestreoFilter({"sistema_corporativo.contexto": 0.0})
+    antes = _descartados("muestreo")
+    assert not filtro.filter(_registro())
+    assert filtro.filter(_registro(nivel=logging.WARNING))
+    assert filtro.filter(_registro(nombre="sistema_corporativo"))
+    assert _descartados("muestreo") == antes + 1
+
+
+def test_errores_repetidos_se_escriben_una_vez_por_ventana(monkeypatch):
+    reloj = [100.0]
+    monkeypatch.setattr(logs.time, "monotonic", lambda: reloj[0])
+    filtro = logs.DeduplicarErrores(ventana=60)
+    assert filtro.filter(_registro(nivel=logging.ERROR))
+    assert not filtro.filter(_registro(nivel=logging.ERROR))
+    assert not filtro.filter(_registro(nivel=logging.ERROR))
+    assert filtro.filter(_registro(nivel=logging.ERROR, linea=11))  # otro origen
+    reloj[0] += 61
+    siguiente = _registro(nivel=logging.ERROR)
+    assert filtro.filter(siguiente) and siguiente.repeticiones == 2
+
+
+def test_errores_de_distinto_origen_no_se_agrupan():
+    def falla_a():
+        raise ValueError("a")
+
+    def falla_b():
+        raise ValueError("b")
+
+    def registro_de(fn):
+        try:
+            fn()
+        except ValueError:
+            return _registro(nivel=logging.ERROR, exc_info=sys.exc_info())
+
+    # Mismo logger.exception (misma línea), excepciones lanzadas en lugares distintos
+    filtro = logs.DeduplicarErrores(ventana=60)
+    assert filtro.filter(registro_de(falla_a))
+    assert filtro.filter(registro_de(falla_b))
+    assert not filtro.filter(registro_de(falla_a))
+
+
+def test_cola_llena_descarta_sin_bloquear_y_conserva_contexto():
+    handler = logs.ContextQueueHandler(queue.Queue(maxsize=1))
+    antes = _descartados("cola_llena")
+    token = tenant_id_var.set("t-1")
+    try:
+        try:
+            raise ValueError("falla")
+        except ValueError:
+            handler.emit(_registro(exc_info=sys.exc_info()))
+        handler.emit(_registro())
+    finally:
+        tenant_id_var.reset(token)
+    assert _descartados("cola_llena") == antes + 1
+
+    salida = json.loads(logs.JSONFormatter().format(handler.queue.get_nowait()))
+    assert salida["message"] == "hola mundo" and salida["tenant_id"] == "t-1"
+    assert "ValueError: falla" in salida["exception"]
+
+
+def test_error_global_va_al_logger_y_no_a_stdout(capsys):
+    import asyncio
+
+    from starlette.requests import Request
+
+    import main
+
+    class _Captura(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.registros = []
+
+        def emit(self, record):
+            self.registros.append(record)
+
+    captura = _Captura()
+    logger = logging.getLogger("sistema_corporativo")
+    logger.addHandler(captura)
+    try:
+        request = Request({"type": "http", "method": "GET", "path": "/x", "headers": [], "query_string": b""})
+        respuesta = asyncio.run(main.global_exception_handler(request, RuntimeError("boom")))
+    finally:
+        logger.removeHandler(captura)
+
+    assert respuesta.status_code == 500
+    registro = next(r for r in captura.registros if r.getMessage() == "GLOBAL ERROR: boom")
+    assert registro.exc_info[0] is RuntimeError
+    assert capsys.readouterr().out == ""
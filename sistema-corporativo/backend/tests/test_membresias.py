@@ -0,0 +1,76 @@
+import asyncio
+import uuid
+
+from services import membresias as modulo
+
+
+class _FakeConn:
+    def __init__(self, filas):
+        self.filas = filas
+        self.consultas = 0
+
+    async def fetch(self, query, user_id):
+        self.consultas += 1
+        return self.filas
+
+
+class _FakeRedis:
+    def __init__(self, caido=False):
+        self.datos = {}
+        self.publicados = []
+        self.caido = caido
+
+    def _check(self):
+        if self.caido:
+            raise ConnectionError("redis caído")
+
+    async def get(self, k):
+        self._check()
+        return self.datos.get(k)
+
+    async def set(self, k, v, ex=None):
+        self._check()
+        self.datos[k] = v
+
+    async def delete(self, k):
+        self._check()
+        self.datos.pop(k, None)
+
+    async def publish(self, canal, msg):
+        self._check()
+        self.publicados.append((canal, msg))
+
+
+def test_l1_l2_y_bd(monkeypatch):
+    redis = _FakeRedis()
+    monkeypatch.setattr(modulo, "get_redis", lambda: redis)
+    org = uuid.uuid4()
+    conn = _FakeConn([{"organization_id": org, "role": "admin"}])
+    cache = modulo.MembershipCache()
+
+    async def run():
+        assert await cache.rol(conn, "u1", org) == "admin"   # miss -> BD
+        assert await cache.rol(conn, "u1", org) == "admin"   # L1
+        cache._l1.clear()
+        assert await cache.rol(conn, "u1", uuid.uuid4()) is None  # L2
+        await cache.invalidar("u1")
+
+    asyncio.run(run())
+    assert conn.consultas == 1
+    assert redis.datos == {} and redis.publicados == [(modulo.CANAL_INVALIDACION, "u1")]
+
+
+def test_degradado_consulta_bd_sin_l1(monkeypatch):
+    redis = _FakeRedis(caido=True)
+    monkeypatch.setattr(modulo, "get_redis", lambda: redis)
+    org = uuid.uuid4()
+    conn = _FakeConn([{"organization_id": org, "role": "member"}])
+    cache = modulo.MembershipCache()
+
+    async def run():
+        for _ in range(3):
+            assert await cache.rol(conn, "u1", org) == "member"
+
+    asyncio.run(run())
+    assert cache.degradado
+    assert conn.consultas == 3
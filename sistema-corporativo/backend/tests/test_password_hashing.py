@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from passlib.hash import pbkdf2_sha256
+
+from auth import security
+
+
+def test_verify_and_update_rehashea_rondas_viejas():
+    viejo = pbkdf2_sha256.using(rounds=1000).hash("clave")
+    valida, nuevo = security.verify_and_update("clave", viejo)
+    assert valida and nuevo and f"${security.PBKDF2_ROUNDS}$" in nuevo
+
+    valida, nuevo = security.verify_and_update("clave", security.get_password_hash("clave"))
+    assert valida and nuevo is None
+    assert security.verify_and_update("otra", viejo) == (False, None)
+
+
+def test_verify_en_pool_y_cola_llena(monkeypatch):
+    hashed = security.get_password_hash("clave")
+
+    async def run():
+        try:
+            # Los hijos no se crean con fork: heredarían los locks de los hilos en curso
+            assert security._get_hash_pool()._mp_context.get_start_method() != "fork"
+            return await security.verify_password_async("clave", hashed)
+        finally:
+            security.shutdown_hash_pool()
+
+    assert asyncio.run(run()) == (True, None)
+
+    monkeypatch.setattr(security, "_pendientes", security.PASSWORD_HASH_MAX_QUEUE)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(security.verify_password_async("clave", hashed))
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"]
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from database.admision import PoolAdmission, clase_actual
+from middleware.context import request_scope_var
+
+DEADLINES = {"critica": 1.0, "normal": 1.0, "masiva": 0.05}
+
+
+def test_prioridad_antes_que_llegada():
+    async def run():
+        admision = PoolAdmission(capacidad=1, deadlines=DEADLINES)
+        orden = []
+        await admision.entrar("normal")
+
+        async def sesion(clase):
+            await admision.entrar(clase)
+            orden.append(clase)
+            admision.salir()
+
+        tareas = [asyncio.create_task(sesion("normal")), asyncio.create_task(sesion("critica"))]
+        await asyncio.sleep(0)
+        admision.salir()
+        await asyncio.gather(*tareas)
+        return orden, admision.en_uso
+
+    assert asyncio.run(run()) == (["critica", "normal"], 0)
+
+
+def test_deadline_y_cola_llena_responden_503():
+    async def run():
+        admision = PoolAdmission(capacidad=1, max_cola=1, deadlines=DEADLINES)
+        await admision.entrar("normal")
+        with pytest.raises(HTTPException) as vencido:
+            await admision.entrar("masiva")
+        espera = asyncio.create_task(admision.entrar("normal"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as lleno:
+            await admision.entrar("normal")
+        espera.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await espera
+        return vencido.value, lleno.value, admision._esperando
+
+    vencido, lleno, esperando = asyncio.run(run())
+    assert vencido.status_code == lleno.status_code == 503
+    assert "Retry-After" in lleno.headers
+    assert esperando == 0
+
+
+def test_critica_desplaza_a_masiva_con_cola_llena():
+    async def run():
+        admision = PoolAdmission(capacidad=1, max_cola=1, deadlines={**DEADLINES, "masiva": 1.0})
+        await admision.entrar("normal")
+        masiva = asyncio.create_task(admision.entrar("masiva"))
+        await asyncio.sleep(0)
+        critica = asyncio.create_task(admision.entrar("critica"))
+        await asyncio.sleep(0)
+        admision.salir()
+        await critica
+        with pytest.raises(HTTPException):
+            await masiva
+        return admision.en_uso
+
+    assert asyncio.run(run()) == 1
+
+
+def test_clase_por_plantilla_de_ruta():
+    class _Ruta:
+        def __init__(self, path):
+            self.path = path
+
+    def clase(metodo, path):
+        token = request_scope_var.set({"method": metodo, "route": _Ruta(path)})
+        try:
+            return clase_actual()
+        finally:
+            request_scope_var.reset(token)
+
+    assert clase_actual() == "normal"
+    assert clase("GET", "/documentos") == "masiva"
+    # Bajo saturación los logins no esperan detrás de los listados
+    assert clase("POST", "/login") == "critica"
+    assert clase("POST", "/auth/register") == "critica"
+
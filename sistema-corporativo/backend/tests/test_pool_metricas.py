@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from database import metricas
+from middleware.context import get_current_route, request_scope_var
+
+
+class _FakePool:
+    def __init__(self, agotado=False):
+        self.agotado = agotado
+
+    async def acquire(self, timeout=None):
+        if self.agotado:
+            raise asyncio.TimeoutError()
+        return "conn"
+
+    def get_size(self):
+        return 5
+
+    def get_idle_size(self):
+        return 2
+
+    def get_max_size(self):
+        return 20
+
+
+def _valor(nombre, **labels):
+    return REGISTRY.get_sample_value(nombre, labels) or 0
+
+
+def test_gauges_se_leen_del_pool_al_scrapear():
+    pool = _FakePool()
+    metricas.registrar_pool("prueba", lambda: pool)
+    assert _valor("db_pool_connections", pool="prueba", estado="en_uso") == 3
+    assert _valor("db_pool_connections", pool="prueba", estado="libres") == 2
+    assert _valor("db_pool_connections", pool="prueba", estado="max") == 20
+
+
+def test_espera_y_timeouts():
+    antes = _valor("db_pool_acquire_seconds_count", pool="prueba_espera")
+    conn, _ = asyncio.run(metricas.adquirir(_FakePool(), "prueba_espera", 1))
+    assert conn == "conn"
+    assert _valor("db_pool_acquire_seconds_count", pool="prueba_espera") == antes + 1
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(metricas.adquirir(_FakePool(agotado=True), "prueba_espera", 1))
+    assert _valor("db_pool_acquire_timeouts_total", pool="prueba_espera") == 1
+
+
+def test_retencion_por_plantilla_de_ruta():
+    class _Ruta:
+        path = "/documentos/{id}"
+
+    assert get_current_route() == "sin_ruta"
+    token = request_scope_var.set({"route": _Ruta()})
+    try:
+        metricas.registrar_retencion("prueba_ruta", 0.0)
+    finally:
+        request_scope_var.reset(token)
+    assert _valor("db_pool_hold_seconds_count", pool="prueba_ruta", ruta="/documentos/{id}") == 1
@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+import pytest
+
+from services.rate_limiter import LocalGCRA, RateLimiter
+
+LIMITES = {"tenant": (10, 1.0), "user": (3, 1.0), "ip": (5, 1.0)}
+
+
+class _Reloj:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+class _RedisStandIn:
+    """Simula EVALSHA del script GCRA con el mismo algoritmo en memoria."""
+
+    def __init__(self):
+        self.reloj = _Reloj()
+        self.gcra = LocalGCRA(reloj=self.reloj)
+        self.llamadas = 0
+
+    def register_script(self, _lua):
+        async def script(keys, args):
+            self.llamadas += 1
+            costo = args[0]
+            claves = [(k, args[2 + 2 * i], args[1 + 2 * i] / 1000) for i, k in enumerate(keys)]
+            ok, restante, retry, reset = self.gcra.verificar(claves, costo)
+            return [int(ok), restante, int(retry * 1000), int(reset * 1000)]
+        return script
+
+
+class _RedisCaido:
+    def register_script(self, _lua):
+        async def script(keys, args):
+            raise ConnectionError("redis caído")
+        return script
+
+
+def test_gcra_local_rafaga_y_recuperacion():
+    reloj = _Reloj()
+    gcra = LocalGCRA(reloj=reloj)
+    claves = [("rl:user:u1", 3, 1 / 3)]
+    assert [gcra.verificar(claves)[0] for _ in range(4)] == [True, True, True, False]
+    ok, _, retry, _ = gcra.verificar(claves)
+    assert not ok and 0 < retry <= 1 / 3 + 1e-6
+    reloj.t += 1 / 3
+    assert gcra.verificar(claves)[0]
+
+
+def test_lease_reduce_idas_a_redis():
+    redis = _RedisStandIn()
+    limiter = RateLimiter(limites=LIMITES, lease=3, lease_ttl=60, redis_factory=lambda: redis)
+
+    async def run():
+        return [await limiter.verificar("t1", "u1", "1.2.3.4") for _ in range(4)]
+
+    decisiones = asyncio.run(run())
+    assert [d.permitido for d in decisiones] == [True, True, True, False]
+    assert redis.llamadas <= 3
+    assert decisiones[0].limite == 3
+    assert decisiones[-1].headers()["Retry-After"] == "1"
+    assert "Retry-After" not in decisiones[0].headers()
+
+
+def test_fallback_local_si_redis_no_responde():
+    limiter = RateLimiter(limites=LIMITES, lease=2, redis_factory=lambda: _RedisCaido())
+
+    async def run():
+        return [await limiter.verificar(None, None, "9.9.9.9") for _ in range(6)]
+
+    permitidos = [d.permitido for d in asyncio.run(run())]
+    assert permitidos == [True] * 5 + [False]
+    assert asyncio.run(limiter.verificar()) is None
+
+
+@pytest.mark.skipif(not os.getenv("RATE_LIMIT_TEST_REDIS_URL"), reason="requiere un Redis local")
+def test_script_lua_contra_redis_real():
+    from redis.asyncio import Redis
+
+    async def run():
+        redis = Redis.from_url(os.environ["RATE_LIMIT_TEST_REDIS_URL"])
+        try:
+            await redis.delete("rl:user:test-lua")
+            limiter = RateLimiter(limites=LIMITES, lease=0, redis_factory=lambda: redis)
+            return [(await limiter.verificar(user_id="test-lua")).permitido for _ in range(4)]
+        finally:
+            await redis.aclose()
+
+    assert asyncio.run(run()) == [True, True, True, False]
@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+import pytest
+
+from database.replicas import ReplicaRouter
+
+
+class _Reloj:
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+
+def _router(reloj):
+    router = ReplicaRouter(max_lag=5, intervalo=1, margen=1, reloj=reloj)
+    router.pool = object()  # solo se consulta si hay pool configurado
+    return router
+
+
+def test_sin_replica_o_sin_medicion_va_a_primaria():
+    reloj = _Reloj()
+    router = ReplicaRouter(reloj=reloj)
+    assert router.decidir("u1") == (False, "sin_replica")
+    router.pool = object()
+    assert router.decidir("u1") == (False, "caida")
+
+
+def test_lag_alto_y_medicion_vieja():
+    reloj = _Reloj()
+    router = _router(reloj)
+    router.actualizar_lag(0.2, reloj.t)
+    assert router.decidir() == (True, "ok")
+    router.actualizar_lag(10, reloj.t)
+    assert router.decidir() == (False, "lag")
+    router.actualizar_lag(0.2, reloj.t)
+    reloj.t += 10  # el monitor dejó de medir
+    assert router.decidir() == (False, "caida")
+
+
+def test_read_your_writes():
+    reloj = _Reloj()
+    router = _router(reloj)
+    router.actualizar_lag(0, reloj.t)
+    router.registrar_escritura("u1")
+    assert router.decidir("u1") == (False, "escritura_reciente")
+    # Otro usuario no se ve afectado
+    assert router.decidir("u2") == (True, "ok")
+    # Medición posterior a la escritura + margen: la réplica ya la reprodujo
+    reloj.t += 2
+    router.actualizar_lag(0.5, reloj.t)
+    assert router.decidir("u1") == (True, "ok")
+
+
+@pytest.mark.skipif(not os.getenv("DB_TEST_URL"), reason="requiere un Postgres local")
+def test_misma_instancia_como_primaria_y_replica():
+    # DB_TEST_URL=postgresql://postgres@localhost/postgres DB_SSL=disable
+    async def run():
+        router = ReplicaRouter()
+        await router.start(os.environ["DB_TEST_URL"])
+        try:
+            return router.lag, router.decidir("u1")
+        finally:
+            await router.stop()
+
+    assert asyncio.run(run()) == (0, (True, "ok"))
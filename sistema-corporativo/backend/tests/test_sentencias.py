@@ -0,0 +1,70 @@
+import asyncio
+from collections import OrderedDict
+
+from database import sentencias
+
+
+class _FakeStmt:
+    def __init__(self, sql):
+        self.sql = sql
+        self.ejecuciones = 0
+
+    async def fetch(self, *args):
+        self.ejecuciones += 1
+        return [("preparada", args)]
+
+
+class _FakeConn:
+    def __init__(self):
+        self.sentencias = OrderedDict()
+        self.preparadas = 0
+        self.simples = 0
+
+    async def prepare(self, sql):
+        self.preparadas += 1
+        return _FakeStmt(sql)
+
+    async def fetch(self, sql, *args):
+        self.simples += 1
+        return [("simple", args)]
+
+
+def test_modo_por_dsn():
+    assert sentencias.modo_por_dsn("postgresql://u:p@aws-0.pooler.supabase.com:6543/postgres") == "transaction"
+    assert sentencias.modo_por_dsn("postgresql://u:p@db.local:5432/postgres") is None
+
+
+def test_session_prepara_una_vez_por_conexion(monkeypatch):
+    monkeypatch.setattr(sentencias, "modo", "session")
+    consulta = sentencias.Consulta("prueba_session", "SELECT $1")
+    conn = _FakeConn()
+
+    async def run():
+        for i in range(3):
+            assert await sentencias.fetch(conn, consulta, i) == [("preparada", (i,))]
+
+    asyncio.run(run())
+    assert conn.preparadas == 1
+    assert conn.simples == 0
+    assert conn.sentencias["SELECT $1"].ejecuciones == 3
+
+
+def test_transaction_no_prepara(monkeypatch):
+    monkeypatch.setattr(sentencias, "modo", "transaction")
+    consulta = sentencias.Consulta("prueba_transaction", "SELECT $1")
+    conn = _FakeConn()
+    asyncio.run(sentencias.fetch(conn, consulta, 1))
+    assert conn.preparadas == 0
+    assert conn.simples == 1
+
+
+def test_precalentar_y_lru(monkeypatch):
+    monkeypatch.setattr(sentencias, "modo", "session")
+    monkeypatch.setattr(sentencias, "DB_PREPARED_PER_CONNECTION", 2)
+    monkeypatch.setattr(sentencias, "CONSULTAS_CALIENTES", {})
+    for i in range(3):
+        sentencias.consulta_caliente(f"q{i}", f"SELECT {i}")
+    conn = _FakeConn()
+    asyncio.run(sentencias.precalentar(conn))
+    # Solo las más recientes sobreviven al límite por conexión
+    assert list(conn.sentencias) == ["SELECT 1", "SELECT 2"]
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+
+import pytest
+
+from services.storage import LocalBlobStore, S3BlobStore, recolectar_blobs, shard_path
+
+
+def _staged(tmp_path, data: bytes):
+    path = tmp_path / f"{uuid.uuid4()}.part"
+    path.write_bytes(data)
+    return path, hashlib.sha256(data).hexdigest()
+
+
+def test_shard_path_y_hash_invalido():
+    sha = "ab" * 32
+    assert shard_path(sha) == f"ab/ab/{sha}"
+    with pytest.raises(ValueError):
+        shard_path("../../etc/passwd")
+
+
+def test_local_deduplica(tmp_path):
+    store = LocalBlobStore(tmp_path / "blobs")
+
+    async def run():
+        p1, sha = _staged(tmp_path, b"circular")
+        p2, _ = _staged(tmp_path, b"circular")
+        return sha, await store.put(sha, p1), await store.put(sha, p2), p1, p2
+
+    sha, primero, segundo, p1, p2 = asyncio.run(run())
+    assert (primero, segundo) == (True, False)
+    assert store.path(sha).read_bytes() == b"circular"
+    assert not p1.exists() and not p2.exists()
+    assert store.url(sha) == f"/uploads/blobs/{sha[:2]}/{sha[2:4]}/{sha}"
+
+
+class _FakeRefsConn:
+    def __init__(self, referenciados, bypass_rls=True, al_consultar_lote=None):
+        self.referenciados = set(referenciados)
+        self.bypass_rls = bypass_rls
+        self.al_consultar_lote = al_consultar_lote
+
+    async def fetch(self, query, shas):
+        filas = [{"sha256": s} for s in shas if s in self.referenciados]
+        if self.al_consultar_lote:
+            self.al_consultar_lote()
+        return filas
+
+    async def fetchval(self, query, *args):
+        if "pg_roles" in query:
+            return self.bypass_rls
+        return args[0] in self.referenciados
+
+
+def _blobs_viejos(tmp_path, store, *datos):
+    async def preparar():
+        shas = []
+        for data in datos:
+            path, sha = _staged(tmp_path, data)
+            await store.put(sha, path)
+            shas.append(sha)
+        return shas
+
+    shas = asyncio.run(preparar())
+    viejo = time.time() - 7 * 24 * 3600
+    for sha in shas:
+        os.utime(store.path(sha), (viejo, viejo))
+    return shas
+
+
+def test_gc_borra_solo_blobs_viejos_sin_referencias(tmp_path):
+    store = LocalBlobStore(tmp_path / "blobs")
+
+    async def preparar():
+        shas = []
+        for data in (b"vivo", b"huerfano", b"reciente"):
+            path, sha = _staged(tmp_path, data)
+            await store.put(sha, path)
+            shas.append(sha)
+        return shas
+
+    vivo, huerfano, reciente = asyncio.run(preparar())
+    viejo = time.time() - 7 * 24 * 3600
+    for sha in (vivo, huerfano):
+        os.utime(store.path(sha), (viejo, viejo))
+
+    resultado = asyncio.run(recolectar_blobs(_FakeRefsConn([vivo]), store, gracia_segundos=3600))
+    assert resultado == {"revisados": 3, "borrados": 1}
+    assert store.path(vivo).exists() and store.path(reciente).exists()
+    assert not store.path(huerfano).exists()
+
+
+def test_gc_sin_bypassrls_no_borra_nada(tmp_path):
+    store = LocalBlobStore(tmp_path / "blobs")
+    (huerfano,) = _blobs_viejos(tmp_path, store, b"huerfano")
+
+    # Con RLS y sin tenant el rol no ve referencias: borraría todo lo antiguo
+    with pytest.raises(RuntimeError):
+        asyncio.run(recolectar_blobs(_FakeRefsConn([], bypass_rls=False), store, gracia_segundos=3600))
+    assert store.path(huerfano).exists()
+
+
+def test_gc_reverifica_antes_de_cada_borrado(tmp_path):
+    store = LocalBlobStore(tmp_path / "blobs")
+    reutilizado, referenciado, huerfano = _blobs_viejos(tmp_path, store, b"reutilizado", b"referenciado", b"huerfano")
+    conn = _FakeRefsConn([])
+
+    def subidas_concurrentes():
+        # Tras la consulta del lote: un put deduplicado refresca un blob y otra
+        # transacción confirma la referencia a otro
+        path, _ = _staged(tmp_path, b"reutilizado")
+        store._put_sync(path, store.path(reutilizado))
+        conn.referenciados.add(referenciado)
+
+    conn.al_consultar_lote = subidas_concurrentes
+    resultado = asyncio.run(recolectar_blobs(conn, store, gracia_segundos=3600))
+    assert resultado == {"revisados": 3, "borrados": 1}
+    assert store.path(reutilizado).exists() and store.path(referenciado).exists()
+    assert not store.path(huerfano).exists()
+
+
+@pytest.mark.skipif(not os.getenv("S3_TEST_ENDPOINT"), reason="Requiere un S3 local (MinIO) en S3_TEST_ENDPOINT")
+def test_s3_contra_minio_local(tmp_path):
+    pytest.importorskip("boto3")
+    store = S3BlobStore(bucket=os.getenv("S3_TEST_BUCKET", "adjuntos-test"), endpoint_url=os.environ["S3_TEST_ENDPOINT"])
+
+    async def run():
+        p1, sha = _staged(tmp_path, uuid.uuid4().bytes)
+        p2 = tmp_path / "copia.part"
+        p2.write_bytes(p1.read_bytes())
+        resultados = (await store.put(sha, p1), await store.put(sha, p2), await store.exists(sha))
+        await store.delete(sha)
+        return resultados + (await store.exists(sha),)
+
+    assert asyncio.run(run()) == (True, False, True, False)
@@ -0,0 +1,42 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from services.uploads import UploadBudget, guardar_upload
+
+
+def _upload(data: bytes, nombre="informe.pdf"):
+    return UploadFile(io.BytesIO(data), filename=nombre)
+
+
+def test_guardar_upload_hash_tamano_y_rename(tmp_path):
+    data = b"x" * (3 * 1024 * 1024 + 17)
+    stored = asyncio.run(guardar_upload(_upload(data), tmp_path, UploadBudget()))
+
+    assert stored.tamano == len(data)
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    assert stored.path.read_bytes() == data
+    assert stored.path.suffix == ".pdf"
+    assert not list(tmp_path.glob("*.part")) and not list(tmp_path.glob(".*.part"))
+
+
+def test_limite_por_archivo_no_deja_temporales(tmp_path):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(guardar_upload(_upload(b"y" * 2048), tmp_path, UploadBudget(), max_file_bytes=1024))
+    assert exc.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_limite_por_request(tmp_path):
+    presupuesto = UploadBudget(max_bytes=1500)
+
+    async def run():
+        await guardar_upload(_upload(b"a" * 1000), tmp_path, presupuesto)
+        await guardar_upload(_upload(b"b" * 1000), tmp_path, presupuesto)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 413
@@ -54,6 +54,7 @@ import MasterPermissionPanel from "../../components/MasterPermissionPanel";
 import { logDocumentActivity } from "./security/actions";
 import { useRouter } from "next/navigation";
 import { useAuth } from "../../hooks/useAuth";
+import { abrirAdjunto } from "../../lib/api";
 import { UserRole, User } from "../../context/AuthContext";
 import {
   PieChart,
@@ -81,6 +82,7 @@ import {
   getAllUsers,
   getGerencias,
   markAsRead,
+  getResumenDocumentos,
 } from "../../lib/api";
 import { ApiDocument, ApiUser } from "../../lib/api";
 
@@ -962,6 +964,15 @@ const DocumentManager: React.FC<{
     const [messageContent, setMessageContent] = useState("");
     const [showViewModal, setShowViewModal] = useState(false);
     const [selectedDoc, setSelectedDoc] = useState<Document | null>(null);
+    const [noLeidos, setNoLeidos] = useState(0);
+
+    // Badge de no leídos desde /documentos/summary (contadores en BD, sin
+    // recorrer el listado); se refresca cuando cambia el buzón
+    useEffect(() => {
+      getResumenDocumentos()
+        .then((resumen) => setNoLeidos(resumen.no_leidos))
+        .catch((e) => console.error("Error fetching inbox summary", e));
+    }, [documents]);
 
     // Extract unique departments for filter
     const departments = useMemo(() => {
@@ -1381,6 +1392,11 @@ const DocumentManager: React.FC<{
             >
               <Inbox size={14} />
               BANDEJA DE ENTRADA
+              {noLeidos > 0 && (
+                <span className={`min-w-[18px] px-1.5 py-0.5 rounded-full text-[10px] font-bold leading-none ${docView === "inbox" ? "bg-white text-red-700" : "bg-red-700 text-white"}`}>
+                  {noLeidos}
+                </span>
+              )}
             </button>
             <button
               onClick={() => setDocView("sent")}
@@ -1549,6 +1565,7 @@ const DocumentManager: React.FC<{
                         {doc.fileUrl && (
                           <a
                             href={doc.fileUrl}
+                            onClick={(e) => { e.preventDefault(); abrirAdjunto(doc.fileUrl!).catch(() => alert("No se pudo abrir el adjunto.")); }}
                             target="_blank"
                             rel="noopener noreferrer"
                             className={`p-2 rounded-md transition-colors ${darkMode ? "hover:bg-slate-800 text-slate-400" : "hover:bg-slate-100 text-slate-600"}`}
@@ -1638,6 +1655,7 @@ const DocumentManager: React.FC<{
                             </div>
                             <a
                               href={url}
+                              onClick={(e) => { e.preventDefault(); abrirAdjunto(url!).catch(() => alert("No se pudo abrir el adjunto.")); }}
                               target="_blank"
                               rel="noopener noreferrer"
                               className="px-4 py-2 bg-blue-600 hover:bg-blue-700 text-white rounded-lg text-xs font-bold transition-colors flex items-center gap-2"
@@ -1658,6 +1676,7 @@ const DocumentManager: React.FC<{
                           </div>
                           <a
                             href={selectedDoc.fileUrl}
+                            onClick={(e) => { e.preventDefault(); abrirAdjunto(selectedDoc.fileUrl!).catch(() => alert("No se pudo abrir el adjunto.")); }}
                             target="_blank"
                             rel="noopener noreferrer"
                             className="px-4 py-2 bg-blue-600 hover:bg-blue-700 text-white rounded-lg text-xs font-bold transition-colors flex items-center gap-2"
@@ -75,6 +75,35 @@ async function handleResponse<T>(res: Response): Promise<T> {
 // DOCUMENTOS
 // ==========================================
 
+/**
+ * Abre un adjunto en una pestaña nueva. La descarga requiere el token
+ * (GET /documentos/adjuntos/{id} valida tenant y destinatario), por eso
+ * no basta con un <a href>: se descarga con fetch y se abre como blob.
+ */
+export async function abrirAdjunto(url: string): Promise<void> {
+    // La pestaña se abre antes del await para que el navegador no la bloquee
+    const ventana = window.open("", "_blank");
+    const token = localStorage.getItem("sgd_token");
+    try {
+        const res = await fetch(url.startsWith("http") ? url : `${BASE_URL}${url}`, {
+            headers: token ? { Authorization: `Bearer ${token}` } : {},
+        });
+        if (!res.ok) {
+            throw new Error(`Error ${res.status}: ${res.statusText}`);
+        }
+        const blobUrl = URL.createObjectURL(await res.blob());
+        if (ventana) {
+            ventana.location.href = blobUrl;
+        } else {
+            window.open(blobUrl, "_blank");
+        }
+        setTimeout(() => URL.revokeObjectURL(blobUrl), 60_000);
+    } catch (err) {
+        ventana?.close();
+        throw err;
+    }
+}
+
 /**
  * Obtiene todos los documentos a los que el usuario tiene acceso.
  */
@@ -85,6 +114,22 @@ export async function getDocumentos(): Promise<ApiDocument[]> {
     return handleResponse<ApiDocument[]>(res);
 }
 
+export interface ResumenBuzon {
+    total: number;
+    no_leidos: number;
+    por_estado: Record<string, number>;
+}
+
+/**
+ * Contadores del buzón (no leídos y por estado) sin descargar el listado.
+ */
+export async function getResumenDocumentos(): Promise<ResumenBuzon & { personal: ResumenBuzon; gerencia: ResumenBuzon }> {
+    const res = await fetch(`${BASE_URL}/documentos/summary`, {
+        headers: getAuthHeaders(),
+    });
+    return handleResponse(res);
+}
+
 /**
  * Sube un nuevo documento al servidor.
  * @param formData FormData con el archivo y metadatos